@@ -0,0 +1,297 @@
+import os
+import sys
+import logging
+import time
+import json
+import csv
+import socket
+import tempfile
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import requests
+try:
+    # posix only, peak RSS falls back to psutil or is not reported
+    import resource
+except ImportError:
+    resource = None
+
+from ebay_listing import EbayAPI, EXCEL_COL_MAPPING, DEFAULT_RATE_LIMITS, configure_logging
+from mock_ebay_server import MockEbayServer
+
+__version__ = "v1.0.0"
+
+SHEET_COLUMNS = ['sku', 'product.title', 'pricingSummary.auctionStartPrice', 'availableQuantity', 'condition',
+                 'categoryId', 'format', 'product.brand', 'product.mpn']
+
+
+def serve_mock(port: int, options: dict):
+    server = MockEbayServer(('127.0.0.1', port), **options)
+    server.serve_forever()
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_mock_server(options: dict):
+    """
+    Start the mock server in its own process, so it doesn't share the GIL or the peak RSS of the benchmark
+    :param options: MockEbayServer options
+    :return: (process, base url)
+    """
+    port = get_free_port()
+    process = multiprocessing.Process(target=serve_mock, args=(port, options), daemon=True)
+    process.start()
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            requests.get(base_url + '/mock/stats', timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise
+            time.sleep(0.1)
+
+
+def generate_sheet(directory: str, rows: int, images_per_sku: int = 1, image_kb: int = 16,
+                   shared_images: bool = False):
+    """
+    Write a synthetic listings csv & photo directory: one directory per sku.
+    Every image has content of its own, so each one is uploaded like the photos of real skus,
+    identical images are uploaded once per run.
+    :param directory:
+    :param rows:
+    :param images_per_sku:
+    :param image_kb:
+    :param shared_images: every sku gets the same images_per_sku files, hard linked where the filesystem allows
+    :return: (sheet file, photo directory)
+    """
+    photo_directory = os.path.join(directory, 'photos')
+    os.makedirs(photo_directory, exist_ok=True)
+    sources = []
+    for i in range(images_per_sku):
+        source = os.path.join(directory, f'source_{i}.jpg')
+        content = os.urandom(image_kb * 1024)
+        with open(source, 'wb') as f:
+            f.write(content)
+        sources.append((source, content))
+
+    sheet_file = os.path.join(directory, 'sheet.csv')
+    with open(sheet_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        # the sheet header is on the 4th row, like the eBay file exchange template
+        for _ in range(3):
+            writer.writerow(['info'])
+        writer.writerow([EXCEL_COL_MAPPING[key] for key in SHEET_COLUMNS])
+        for i in range(rows):
+            sku = f'BENCH{i:06d}'
+            writer.writerow([sku, f'Benchmark item {i}', 10 + i % 90, 1 + i % 5, 1000, 11483, 'FixedPrice',
+                             'Brand', 'Does not apply'])
+            sku_directory = os.path.join(photo_directory, sku)
+            os.makedirs(sku_directory, exist_ok=True)
+            for n, (source, content) in enumerate(sources):
+                target = os.path.join(sku_directory, f'{n}.jpg')
+                if shared_images:
+                    try:
+                        os.link(source, target)
+                        continue
+                    except OSError:
+                        pass
+                with open(target, 'wb') as f:
+                    # a header of its own makes the content of every image differ
+                    f.write(content if shared_images else f'{sku}-{n}'.encode() + content)
+    return sheet_file, photo_directory
+
+
+def get_peak_rss_mb():
+    if resource:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def run_benchmark(rows: int, directory: str, base_url: str, options: dict):
+    """
+    Run the workflow on a synthetic sheet against the mock server, in a fresh process per sheet size
+    :param rows:
+    :param directory: working directory of the run
+    :param base_url: mock server url
+    :param options: benchmark options
+    :return: result dict
+    """
+    os.chdir(directory)
+    configure_logging(log_file=options['log_file'], level=options['log_level'])
+    sheet_file, photo_directory = generate_sheet(directory, rows, options['images_per_sku'], options['image_kb'],
+                                                 options['shared_images'])
+    with open('ebay_sandbox_api_token.json', 'w') as f:
+        json.dump({
+            'access_token': 'BENCH', 'refresh_token': 'BENCH', 'expires_in': 7200,
+            'expires_at': time.time() + 7200
+        }, fp=f)
+
+    ebay = EbayAPI(
+        'bench', 'bench', 'bench',
+        test=True,
+        base_url=base_url,
+        photo_directory=photo_directory,
+        # every run uploads & bootstraps from scratch
+        image_cache_days=0,
+        policy_cache_hours=0,
+        aspect_cache_days=0,
+        save_image_index=False,
+        image_upload_workers=options['image_upload_workers'],
+        http_pool_size=options['http_pool_size'],
+        rate_limits={family: options['rate_limit'] for family in DEFAULT_RATE_LIMITS},
+        build_workers=options['build_workers'],
+        send_workers=options['send_workers'],
+        pipeline_queue_size=options['pipeline_queue_size']
+    )
+    requests.get(base_url + '/mock/reset')
+    start = time.perf_counter()
+    ebay.workflow(sheet_file, stream=options['stream'], chunk_size=options['chunk_size'])
+    elapsed = time.perf_counter() - start
+    stats = requests.get(base_url + '/mock/stats').json()
+    ebay.close()
+
+    published = sum(1 for result in ebay.publish_results.values() if result.get('listingId'))
+    return {
+        'rows': rows,
+        'published': published,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1),
+        'calls': stats['total_calls'],
+        'calls_per_row': round(stats['total_calls'] / rows, 3),
+        'bytes_uploaded': stats['bytes_uploaded'],
+        'errors': stats['errors'],
+        'throttled': stats['throttled'],
+        'peak_rss_mb': get_peak_rss_mb(),
+        'calls_by_endpoint': stats['calls'],
+    }
+
+
+def print_results(results: list):
+    header = f"{'rows':>8} {'published':>9} {'seconds':>9} {'rows/s':>9} {'calls':>8} {'calls/row':>9} " \
+             f"{'MB up':>9} {'429s':>6} {'5xx':>6} {'peak MB':>8}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        peak = f"{r['peak_rss_mb']:.1f}" if r['peak_rss_mb'] is not None else 'n/a'
+        print(f"{r['rows']:>8} {r['published']:>9} {r['seconds']:>9.2f} {r['rows_per_second']:>9.1f} "
+              f"{r['calls']:>8} {r['calls_per_row']:>9.3f} {r['bytes_uploaded'] / 1024 / 1024:>9.1f} "
+              f"{r['throttled']:>6} {r['errors']:>6} {peak:>8}")
+
+
+def compare_results(results: list, baseline_file: str, tolerance: float):
+    """
+    Compare with a saved run, rows/s lower or calls/row higher than tolerance are regressions
+    :param results:
+    :param baseline_file: json written by --save
+    :param tolerance: allowed relative change, e.g. 0.1
+    :return: True if there is no regression
+    """
+    with open(baseline_file, 'r') as f:
+        baseline = {r['rows']: r for r in json.load(f)['results']}
+    ok = True
+    for r in results:
+        base = baseline.get(r['rows'])
+        if not base:
+            print(f"{r['rows']} rows: no baseline")
+            continue
+        speed = r['rows_per_second'] / base['rows_per_second'] - 1
+        calls = r['calls_per_row'] / base['calls_per_row'] - 1 if base['calls_per_row'] else 0
+        regression = speed < -tolerance or calls > tolerance
+        ok = ok and not regression
+        print(f"{r['rows']} rows: rows/s {speed:+.1%}, calls/row {calls:+.1%}"
+              f"{'  REGRESSION' if regression else ''}")
+    return ok
+
+
+def main(args):
+    mock_options = {
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+        'throttle_rate': args.throttle_rate,
+        'item_error_rate': args.item_error_rate,
+    }
+    options = {
+        'images_per_sku': args.images_per_sku,
+        'image_kb': args.image_kb,
+        'shared_images': args.shared_images,
+        'image_upload_workers': args.image_upload_workers,
+        'http_pool_size': args.http_pool_size,
+        'rate_limit': args.rate_limit,
+        'build_workers': args.build_workers,
+        'send_workers': args.send_workers,
+        'pipeline_queue_size': args.pipeline_queue_size,
+        'stream': args.stream,
+        'chunk_size': args.chunk_size,
+        'log_level': logging.DEBUG if args.verbose else logging.WARNING,
+        'log_file': os.path.abspath(args.log_file),
+    }
+
+    process, base_url = start_mock_server(mock_options)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='ebay_benchmark_') as work_directory:
+            for rows in args.rows:
+                directory = os.path.join(work_directory, str(rows))
+                os.makedirs(directory)
+                # a fresh process per size, so the peak RSS is that of one run
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    results.append(executor.submit(run_benchmark, rows, directory, base_url, options).result())
+    finally:
+        process.terminate()
+
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'version': __version__, 'mock': mock_options, 'options': options, 'results': results},
+                      fp=f, indent=2)
+        print(f"Results saved to {args.save}")
+    if args.compare and not compare_results(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the listing workflow against the mock server")
+    parser.add_argument('-r', '--rows', type=int, nargs='+', default=[1000],
+                        help="Sheet sizes to run, e.g. 1000 10000 100000")
+    parser.add_argument('--images-per-sku', type=int, default=1)
+    parser.add_argument('--image-kb', type=int, default=16, help="Size of every synthetic image")
+    parser.add_argument('--shared-images', action='store_true',
+                        help="Give every sku the same images, which are then uploaded once per run")
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds every mock call waits")
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('--error-rate', type=float, default=0, help="Share of calls answered with 500")
+    parser.add_argument('--throttle-rate', type=float, default=0, help="Share of calls answered with 429")
+    parser.add_argument('--item-error-rate', type=float, default=0,
+                        help="Share of bulk request items answered with statusCode 500")
+    parser.add_argument('--image-upload-workers', type=int, default=4)
+    parser.add_argument('--http-pool-size', type=int, default=10)
+    parser.add_argument('--rate-limit', type=float, default=1000,
+                        help="Requests per second of every api family, high so the mock latency is measured")
+    parser.add_argument('--build-workers', type=int, default=2)
+    parser.add_argument('--send-workers', type=int, default=2)
+    parser.add_argument('--pipeline-queue-size', type=int, default=2)
+    parser.add_argument('-s', '--stream', action='store_true', help="Read the sheet in chunks")
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--save', help="Write the results to this json file")
+    parser.add_argument('--compare', help="Compare with a json file written by --save, exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Allowed relative change of rows/s & calls/row for --compare")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Debug logging of the workflow")
+    parser.add_argument('--log-file', default='benchmark.log', help="Log file of the workflow runs")
+
+    main(parser.parse_args())
@@ -1,37 +1,137 @@
 import os
+import atexit
 import logging
+import logging.handlers
 import time
 import json
+import csv
+import gzip
+import hashlib
+import random
+import sqlite3
+import threading
+import queue
+import asyncio
 import requests
-import pandas as pd
-from datetime import datetime, timedelta, timezone
-from python_calamine.pandas import pandas_monkeypatch
+from requests.adapters import HTTPAdapter
+from datetime import date, datetime, timedelta, timezone
 import xml.etree.ElementTree as ET
-from requests_toolbelt.multipart.encoder import MultipartEncoder
-from ebaysdk.trading import Connection as Trading
-from requests_oauthlib import OAuth2Session
+# pandas, numpy, python_calamine, ebaysdk, requests_oauthlib, requests_toolbelt, aiohttp & PIL are slow to import,
+# they are imported by the functions that use them, so the cli, library users & worker processes start fast
 import urllib.parse as urlparse
-from pprint import pformat
 import argparse
 import configparser
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, as_completed
 
 __version__ = "v2.5.0"
 
-pandas_monkeypatch()
+# share of payload & response bodies written by log_payload at DEBUG level
+PAYLOAD_SAMPLE_RATE = 1.0
+_log_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One json object per line
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'function': record.funcName,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(log_file: str = None, log_format: str = 'text', level='DEBUG',
+                      payload_sample_rate: float = 1.0):
+    """
+    Log to a daily file through a queue, so the file is written by a background thread.
+    Called by main, importing the module leaves logging to the application
+    :param log_file: defaults to <script name><yymmdd>.log in the working directory
+    :param log_format: text or json (json lines)
+    :param level:
+    :param payload_sample_rate: share of payload & response bodies logged at DEBUG level
+    :return:
+    """
+    global PAYLOAD_SAMPLE_RATE, _log_listener
+    PAYLOAD_SAMPLE_RATE = payload_sample_rate
+    if log_file is None:
+        log_file = os.path.join(
+            os.getcwd(),
+            os.path.splitext(os.path.basename(__file__))[0] +
+            datetime.now().strftime("%y%m%d") + '.log'
+        )
+
+    close_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+    file_handler = logging.FileHandler(log_file, mode='a', encoding='utf-8')
+    if log_format == 'json':
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter('%(asctime)s : %(levelname)s : %(funcName)s : %(message)s'))
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    _log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _log_listener.start()
+
+
+@atexit.register
+def close_logging():
+    """
+    Write the records still in the queue & close the log file, safe to call more than once
+    :return:
+    """
+    global _log_listener
+    listener, _log_listener = _log_listener, None
+    if listener:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+class _LazyPayload:
+    """
+    Payload formatted only when the log record is written, a callable is called then
+    """
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        payload = self.payload() if callable(self.payload) else self.payload
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8', errors='replace')
+        return payload if isinstance(payload, str) else json.dumps(payload, default=str)
+
+
+def log_payload(label: str, payload):
+    """
+    Debug log a payload or response body, a sample of PAYLOAD_SAMPLE_RATE of them,
+    nothing is serialized unless debug logging is enabled
+    :param label:
+    :param payload: value, or a callable returning it like response.json
+    :return:
+    """
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return
+    if PAYLOAD_SAMPLE_RATE < 1 and random.random() >= PAYLOAD_SAMPLE_RATE:
+        return
+    logging.debug('%s: %s', label, _LazyPayload(payload), stacklevel=2)
+
 
-# Configure logging
-logging_file = os.path.join(
-        os.getcwd(),
-        os.path.splitext(os.path.basename(__file__))[0] +
-        datetime.now().strftime("%y%m%d") + '.log'
-    )
-log_format = '%(asctime)s : %(levelname)s : %(funcName)s : %(message)s'
-logging.basicConfig(
-    filename=logging_file,
-    filemode='a',
-    format=log_format,
-    level=logging.DEBUG
-)
 CONFIG = None
 environment = 'sandbox'
 SCOPE = ["https://api.ebay.com/oauth/api_scope",
@@ -148,11 +248,913 @@ EXCEL_COL_MAPPING = {
     #'product.aspects.Unit Quantity': 'C:Unit Quantity',
     #'product.aspects.Unit Type': 'C:Unit Type',
 }
+# max requests per call of the bulk offer methods
+BULK_OFFER_LIMIT = 25
+# max inventory items per getInventoryItems page
+INVENTORY_PAGE_LIMIT = 200
+# max offers per getOffers page
+OFFER_PAGE_LIMIT = 200
+# http status codes of transient failures, whole calls & bulk items with these are retried
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# retries of a bulk call & of its failed items that are made even when the retry budget is spent,
+# a bulk call carries up to BULK_OFFER_LIMIT skus
+BULK_MIN_RETRIES = 1
+# uri prefix -> api family sharing one rate limit
+API_FAMILIES = {
+    '/sell/inventory/': 'inventory',
+    '/sell/account/': 'account',
+    '/ws/api.dll': 'trading',
+}
+# default requests per second of each api family
+DEFAULT_RATE_LIMITS = {
+    'inventory': 10,
+    'account': 5,
+    'trading': 5,
+    'other': 5,
+}
+# access tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+# upper bounds in seconds of the api call latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# the uri segment after these is an id, replaced by {id} in metric labels
+ID_RESOURCES = {'offer', 'inventory_item', 'location', 'category_tree', 'fulfillment_policy', 'payment_policy',
+                'return_policy'}
+
+
+class RateLimiter:
+    """
+    Adaptive token bucket: the rate is halved on 429 / 5xx responses and restored gradually on success
+    """
+
+    def __init__(self, rate: float, min_rate: float = 0.1):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token if one is available
+        :return: 0 if a request may be sent now, else seconds to wait before trying again
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now >= self.blocked_until and self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+
+    def acquire(self):
+        """
+        Block until a request may be sent
+        :return:
+        """
+        while wait := self.reserve():
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while wait := self.reserve():
+            await asyncio.sleep(wait)
+
+    def block(self, seconds: float):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def backoff(self, seconds: float = None):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+        if seconds:
+            self.block(seconds)
+
+    def success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def update(self, response):
+        """
+        Adjust the limiter from the status & rate limit headers of a response
+        :param response:
+        :return:
+        """
+        headers = response.headers
+        retry_after = None
+        try:
+            retry_after = float(headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            pass
+
+        if response.status_code == 429 or response.status_code >= 500:
+            logging.warning(f"{response.status_code} received, backing off")
+            self.backoff(retry_after)
+            return
+        self.success()
+
+        # quota exhausted until the reset time given by the server
+        try:
+            if int(headers.get('X-RateLimit-Remaining')) <= 0:
+                self.block(float(headers.get('X-RateLimit-Reset')))
+        except (TypeError, ValueError):
+            pass
+
+
+class RetryBudget:
+    """
+    Limits retries to a fraction of the requests sent, so an outage does not turn into a retry storm.
+    Every request deposits ratio tokens, a retry withdraws one.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10, max_tokens: float = 100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class Metrics:
+    """
+    Thread-safe api call counters, latency histograms & stage timers of a run,
+    exported as prometheus text, json snapshots & an end of run summary
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        # (method, endpoint) -> call statistics
+        self.endpoints = {}
+        # stage -> {'seconds', 'items'}
+        self.stages = {}
+
+    @staticmethod
+    def get_endpoint(uri: str):
+        segments = uri.split('?')[0].split('/')
+        return '/'.join(
+            '{id}' if i > 0 and segments[i - 1] in ID_RESOURCES else segment
+            for i, segment in enumerate(segments)
+        )
+
+    def _get_endpoint_stats(self, method: str, uri: str):
+        key = (method, self.get_endpoint(uri))
+        if key not in self.endpoints:
+            self.endpoints[key] = {
+                'calls': 0, 'errors': 0, 'throttled': 0, 'retries': 0, 'statuses': {},
+                'bytes_sent': 0, 'bytes_received': 0,
+                'seconds': 0.0, 'max_seconds': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS),
+            }
+        return self.endpoints[key]
+
+    def observe_call(self, method: str, uri: str, status, seconds: float, bytes_sent: int = 0,
+                     bytes_received: int = 0):
+        """
+        Record one attempt of an api call
+        :param method:
+        :param uri:
+        :param status: http status, 'error' for connection errors & timeouts
+        :param seconds:
+        :param bytes_sent:
+        :param bytes_received:
+        :return:
+        """
+        with self.lock:
+            stats = self._get_endpoint_stats(method, uri)
+            stats['calls'] += 1
+            stats['statuses'][str(status)] = stats['statuses'].get(str(status), 0) + 1
+            if status == 'error' or status >= 400:
+                stats['errors'] += 1
+            if status == 429:
+                stats['throttled'] += 1
+            stats['bytes_sent'] += bytes_sent
+            stats['bytes_received'] += bytes_received
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+                    break
+
+    def count_retry(self, method: str, uri: str, count: int = 1):
+        with self.lock:
+            self._get_endpoint_stats(method, uri)['retries'] += count
+
+    def add_stage_time(self, stage: str, seconds: float, items: int = 1):
+        with self.lock:
+            stats = self.stages.setdefault(stage, {'seconds': 0.0, 'items': 0})
+            stats['seconds'] += seconds
+            stats['items'] += items
+
+    @contextmanager
+    def time_stage(self, stage: str, items: int = 1):
+        """
+        Add the time of the with block to a stage, stages running on several threads add up their busy time
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(stage, time.perf_counter() - start, items)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'elapsed_seconds': round(time.monotonic() - self.started, 3),
+                'endpoints': [
+                    {
+                        'method': method, 'endpoint': endpoint, **stats,
+                        'statuses': dict(stats['statuses']), 'buckets': list(stats['buckets'])
+                    }
+                    for (method, endpoint), stats in sorted(self.endpoints.items())
+                ],
+                'stages': {stage: dict(stats) for stage, stats in self.stages.items()},
+            }
+
+    def save_snapshot(self, filename: str):
+        temp_file = f'{filename}.{os.getpid()}.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(self.snapshot(), fp=f, indent=2)
+        os.replace(temp_file, filename)
+
+    def to_prometheus(self):
+        """
+        Metrics in the prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name: str, metric_type: str, help_text: str, samples: list):
+            # samples: (name suffix, labels, value)
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f'{name}{suffix}{{{label_text}}} {value}')
+
+        endpoints = snapshot['endpoints']
+        labels = [{'method': e['method'], 'endpoint': e['endpoint']} for e in endpoints]
+        metric('ebay_api_calls_total', 'counter', 'Api call attempts by status', [
+            ('', {**label, 'status': status}, count)
+            for label, e in zip(labels, endpoints) for status, count in sorted(e['statuses'].items())
+        ])
+        histogram = []
+        for label, e in zip(labels, endpoints):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, e['buckets']):
+                cumulative += count
+                histogram.append(('_bucket', {**label, 'le': bound}, cumulative))
+            histogram.append(('_bucket', {**label, 'le': '+Inf'}, e['calls']))
+            histogram.append(('_sum', label, round(e['seconds'], 6)))
+            histogram.append(('_count', label, e['calls']))
+        metric('ebay_api_call_seconds', 'histogram', 'Api call latency', histogram)
+        metric('ebay_api_bytes_sent_total', 'counter', 'Request body bytes',
+               [('', label, e['bytes_sent']) for label, e in zip(labels, endpoints)])
+        metric('ebay_api_bytes_received_total', 'counter', 'Response body bytes',
+               [('', label, e['bytes_received']) for label, e in zip(labels, endpoints)])
+        metric('ebay_api_retries_total', 'counter', 'Retried calls & bulk items',
+               [('', label, e['retries']) for label, e in zip(labels, endpoints)])
+        metric('ebay_api_throttled_total', 'counter', '429 responses',
+               [('', label, e['throttled']) for label, e in zip(labels, endpoints)])
+        metric('ebay_stage_seconds_total', 'counter', 'Busy seconds of a stage, summed over its threads',
+               [('', {'stage': stage}, round(stats['seconds'], 6)) for stage, stats in snapshot['stages'].items()])
+        metric('ebay_stage_items_total', 'counter', 'Items processed by a stage',
+               [('', {'stage': stage}, stats['items']) for stage, stats in snapshot['stages'].items()])
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        snapshot = self.snapshot()
+        lines = [f"Run metrics after {snapshot['elapsed_seconds']:.1f}s"]
+        lines.append(f"{'stage':<12} {'busy s':>10} {'items':>8}")
+        for stage, stats in snapshot['stages'].items():
+            lines.append(f"{stage:<12} {stats['seconds']:>10.2f} {stats['items']:>8}")
+        lines.append(f"{'endpoint':<60} {'calls':>6} {'errors':>6} {'429s':>5} {'retries':>7} "
+                     f"{'mean ms':>8} {'max ms':>8} {'MB sent':>8}")
+        for e in snapshot['endpoints']:
+            mean = e['seconds'] / e['calls'] * 1000 if e['calls'] else 0
+            lines.append(
+                f"{(e['method'] + ' ' + e['endpoint'])[:60]:<60} {e['calls']:>6} {e['errors']:>6} "
+                f"{e['throttled']:>5} {e['retries']:>7} {mean:>8.1f} {e['max_seconds'] * 1000:>8.1f} "
+                f"{e['bytes_sent'] / 1024 / 1024:>8.2f}"
+            )
+        return '\n'.join(lines)
+
+    def start_http_server(self, port: int, host: str = '127.0.0.1'):
+        """
+        Serve the prometheus text on http://host:port/metrics from a background thread
+        :return: server
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                data = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        logging.info(f"Metrics served on http://{host}:{port}/metrics")
+        return server
+
+    def start_snapshots(self, filename: str, interval: float = 60):
+        """
+        Write a json snapshot every interval seconds from a background thread, until the returned event is set
+        :return: stop event
+        """
+        stop = threading.Event()
+
+        def write_snapshots():
+            while not stop.wait(interval):
+                try:
+                    self.save_snapshot(filename)
+                except Exception as e:
+                    logging.exception(e)
+
+        threading.Thread(target=write_snapshots, name='metrics-snapshot', daemon=True).start()
+        return stop
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages, each on its own worker threads, connected by bounded queues
+    """
+    _DONE = object()
+
+    def __init__(self, stages: list, queue_size: int = 2, on_error=None):
+        """
+        :param stages: list of (function, workers), the result of a stage is the item of the next one
+        :param queue_size: max items waiting in front of each stage
+        :param on_error: called with the item & the exception when a stage raises, the item is dropped
+        """
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.on_error = on_error
+
+    def _worker(self, index: int, function, finished: list, lock: threading.Lock):
+        while True:
+            item = self.queues[index].get()
+            if item is self._DONE:
+                break
+            try:
+                result = function(item)
+                if index + 1 < len(self.stages):
+                    self.queues[index + 1].put(result)
+            except Exception as ex:
+                logging.exception(ex)
+                if self.on_error:
+                    try:
+                        self.on_error(item, ex)
+                    except Exception as e:
+                        logging.exception(e)
+
+        # the last worker of a stage to finish tells the next stage there is no more work
+        with lock:
+            finished[index] += 1
+            last = finished[index] == self.stages[index][1]
+        if last and index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1][1]):
+                self.queues[index + 1].put(self._DONE)
+
+    def run(self, items):
+        """
+        Feed items to the first stage from the calling thread & wait for all stages to finish
+        :param items: iterable of items
+        :return:
+        """
+        finished = [0] * len(self.stages)
+        lock = threading.Lock()
+        threads = []
+        for index, (function, workers) in enumerate(self.stages):
+            for n in range(workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(index, function, finished, lock),
+                    name=f'{function.__name__}-{n}',
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+        try:
+            for item in items:
+                self.queues[0].put(item)
+        finally:
+            for _ in range(self.stages[0][1]):
+                self.queues[0].put(self._DONE)
+            for thread in threads:
+                thread.join()
+
+
+class FileLock:
+    """
+    Lock shared between processes: a lock file created with O_CREAT | O_EXCL, which works on windows & posix.
+    The holder touches the lock file while it holds it, however long that takes, so a lock file unchanged for
+    stale_seconds is left over by a killed process. It is broken by renaming it away, which only one process can do.
+    """
+
+    def __init__(self, path: str, timeout: float = 60, stale_seconds: float = 120, poll_interval: float = 0.1):
+        self.path = path
+        self.timeout = timeout
+        self.stale_seconds = stale_seconds
+        self.poll_interval = poll_interval
+        # set to stop touching the lock file on release
+        self.heartbeat = None
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._break_stale():
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for lock {self.path}")
+                time.sleep(self.poll_interval)
+            else:
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                self._start_heartbeat()
+                return
+
+    def _start_heartbeat(self):
+        stop = threading.Event()
+
+        def touch():
+            while not stop.wait(self.stale_seconds / 4):
+                try:
+                    os.utime(self.path)
+                except OSError:
+                    return
+
+        threading.Thread(target=touch, name='file-lock', daemon=True).start()
+        self.heartbeat = stop
+
+    def _break_stale(self):
+        """
+        Remove the lock file if it is stale
+        :return: True if the lock file was removed or is gone
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        if time.time() - stat.st_mtime <= self.stale_seconds:
+            return False
+        # of the processes breaking the lock at once, one renames the stale file & the others find it gone
+        stale_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.stale'
+        try:
+            os.rename(self.path, stale_path)
+        except FileNotFoundError:
+            return True
+        renamed = os.stat(stale_path)
+        if (renamed.st_ino, renamed.st_mtime_ns) != (stat.st_ino, stat.st_mtime_ns):
+            # the lock was taken again since the check, give it back to its holder
+            try:
+                os.link(stale_path, self.path)
+            except OSError as e:
+                logging.exception(e)
+        else:
+            logging.warning(f"Removing stale lock {self.path}")
+        os.remove(stale_path)
+        return True
+
+    def release(self):
+        if self.heartbeat:
+            self.heartbeat.set()
+            self.heartbeat = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SqliteStore:
+    """
+    Thread-safe wrapper around a local sqlite database file
+    """
+    SCHEMA = ''
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        with self.lock:
+            self.connection.executescript(self.SCHEMA)
+            self.connection.commit()
+
+    def execute(self, sql: str, params: tuple = ()):
+        with self.lock:
+            rows = self.connection.execute(sql, params).fetchall()
+            self.connection.commit()
+        return rows
+
+    def executemany(self, sql: str, params: list):
+        with self.lock:
+            self.connection.executemany(sql, params)
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class ImageUrlCache(SqliteStore):
+    """
+    Content addressed cache of uploaded picture urls: sha256 of image file -> FullURL,
+    the key of a preprocessed image includes the preprocessing settings
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS image_urls (
+            hash TEXT PRIMARY KEY,
+            full_url TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, filename: str, expiry_days: int = 30):
+        super().__init__(filename)
+        self.expiry_days = expiry_days
+
+    @staticmethod
+    def file_hash(filename: str):
+        sha256 = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def get(self, file_hash: str):
+        rows = self.execute(
+            'SELECT full_url FROM image_urls WHERE hash = ? AND expires_at > ?',
+            (file_hash, time.time())
+        )
+        return rows[0][0] if rows else None
+
+    def set(self, file_hash: str, full_url: str, use_by_date: datetime = None):
+        """
+        Store the url until expiry_days from now, or until eBay's UseByDate if that is earlier
+        :param file_hash:
+        :param full_url:
+        :param use_by_date:
+        :return:
+        """
+        expires_at = time.time() + self.expiry_days * 24 * 3600
+        if use_by_date:
+            expires_at = min(expires_at, use_by_date.timestamp())
+        self.execute(
+            'INSERT OR REPLACE INTO image_urls (hash, full_url, expires_at) VALUES (?, ?, ?)',
+            (file_hash, full_url, expires_at)
+        )
+
+
+class ProgressJournal(SqliteStore):
+    """
+    Durable per sku progress of the runs, so an interrupted run can be resumed.
+    Every run updates the records of the skus it pushes, the journal is only cleared by a restart.
+    """
+    STAGES = ('images', 'inventory', 'offer', 'published')
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS progress (
+            sku TEXT PRIMARY KEY,
+            stage TEXT NOT NULL,
+            image_urls TEXT,
+            offer_id TEXT,
+            listing_id TEXT,
+            updated_at REAL NOT NULL
+        );
+    """
+
+    def get(self, sku: str):
+        rows = self.execute(
+            'SELECT stage, image_urls, offer_id, listing_id FROM progress WHERE sku = ?',
+            (sku,)
+        )
+        if not rows:
+            return None
+        stage, image_urls, offer_id, listing_id = rows[0]
+        return {
+            'stage': stage,
+            'image_urls': json.loads(image_urls) if image_urls else [],
+            'offer_id': offer_id,
+            'listing_id': listing_id,
+        }
+
+    def set_stage(self, sku: str, stage: str, image_urls: list = None, offer_id: str = None,
+                  listing_id: str = None):
+        self.execute(
+            """
+            INSERT INTO progress (sku, stage, image_urls, offer_id, listing_id, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(sku) DO UPDATE SET
+                stage = excluded.stage,
+                image_urls = COALESCE(excluded.image_urls, image_urls),
+                offer_id = COALESCE(excluded.offer_id, offer_id),
+                listing_id = COALESCE(excluded.listing_id, listing_id),
+                updated_at = excluded.updated_at
+            """,
+            (sku, stage, json.dumps(image_urls) if image_urls is not None else None,
+             offer_id, listing_id, time.time())
+        )
+
+    @classmethod
+    def reached(cls, record: dict, stage: str):
+        """
+        True if the journal record has finished the given stage
+        :param record: record returned by get
+        :param stage:
+        :return:
+        """
+        return bool(record) and cls.STAGES.index(record['stage']) >= cls.STAGES.index(stage)
+
+    def reset(self):
+        self.execute('DELETE FROM progress')
+
+
+class FingerprintStore(SqliteStore):
+    """
+    Fingerprints of the payloads last pushed for each sku, used to send only changed skus
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            sku TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            price_quantity_hash TEXT NOT NULL,
+            offer_id TEXT,
+            updated_at REAL NOT NULL
+        );
+    """
+
+    @staticmethod
+    def fingerprint(data):
+        return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, sku: str):
+        rows = self.execute(
+            'SELECT content_hash, price_quantity_hash, offer_id FROM fingerprints WHERE sku = ?',
+            (sku,)
+        )
+        if not rows:
+            return None
+        content_hash, price_quantity_hash, offer_id = rows[0]
+        return {'content_hash': content_hash, 'price_quantity_hash': price_quantity_hash, 'offer_id': offer_id}
+
+    def set(self, sku: str, content_hash: str, price_quantity_hash: str, offer_id: str):
+        self.execute(
+            'INSERT OR REPLACE INTO fingerprints (sku, content_hash, price_quantity_hash, offer_id, updated_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (sku, content_hash, price_quantity_hash, offer_id, time.time())
+        )
+
+
+class PolicyCache(SqliteStore):
+    """
+    Inventory location & business policy ids of each account & marketplace, kept for ttl_hours
+    """
+    FIELDS = ('merchant_location_key', 'fulfillment_policy', 'payment_policy', 'return_policy')
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS policies (
+            account TEXT NOT NULL,
+            marketplace_id TEXT NOT NULL,
+            merchant_location_key TEXT,
+            fulfillment_policy TEXT,
+            payment_policy TEXT,
+            return_policy TEXT,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (account, marketplace_id)
+        );
+    """
+
+    def __init__(self, filename: str, ttl_hours: float = 24):
+        super().__init__(filename)
+        self.ttl_hours = ttl_hours
+
+    def get(self, account: str, marketplace_id: str):
+        rows = self.execute(
+            f'SELECT {", ".join(self.FIELDS)} FROM policies '
+            'WHERE account = ? AND marketplace_id = ? AND expires_at > ?',
+            (account, marketplace_id, time.time())
+        )
+        return dict(zip(self.FIELDS, rows[0])) if rows else None
+
+    def set(self, account: str, marketplace_id: str, policy_ids: dict):
+        self.execute(
+            f'INSERT OR REPLACE INTO policies (account, marketplace_id, {", ".join(self.FIELDS)}, expires_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (account, marketplace_id, *[policy_ids.get(field) for field in self.FIELDS],
+             time.time() + self.ttl_hours * 3600)
+        )
+
+    def invalidate(self, account: str = None, marketplace_id: str = None):
+        """
+        Forget the cached ids, of all accounts & marketplaces unless given
+        :param account:
+        :param marketplace_id:
+        :return:
+        """
+        self.execute(
+            'DELETE FROM policies WHERE (? IS NULL OR account = ?) AND (? IS NULL OR marketplace_id = ?)',
+            (account, account, marketplace_id, marketplace_id)
+        )
+
+
+class AspectStore(SqliteStore):
+    """
+    Aspect metadata of every leaf category of a marketplace, gzip compressed json per categoryId
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS category_trees (
+            marketplace_id TEXT PRIMARY KEY,
+            category_tree_id TEXT,
+            fetched_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS category_aspects (
+            marketplace_id TEXT NOT NULL,
+            category_id TEXT NOT NULL,
+            aspects BLOB NOT NULL,
+            PRIMARY KEY (marketplace_id, category_id)
+        );
+    """
+
+    def __init__(self, filename: str, expiry_days: int = 7):
+        super().__init__(filename)
+        self.expiry_days = expiry_days
+
+    def is_fresh(self, marketplace_id: str):
+        rows = self.execute(
+            'SELECT fetched_at FROM category_trees WHERE marketplace_id = ?',
+            (marketplace_id,)
+        )
+        return bool(rows) and rows[0][0] + self.expiry_days * 24 * 3600 > time.time()
+
+    def get(self, marketplace_id: str, category_id: str):
+        rows = self.execute(
+            'SELECT aspects FROM category_aspects WHERE marketplace_id = ? AND category_id = ?',
+            (marketplace_id, category_id)
+        )
+        return json.loads(gzip.decompress(rows[0][0])) if rows else None
+
+    def replace(self, marketplace_id: str, category_tree_id: str, category_aspects: dict):
+        """
+        Replace the stored aspects of a marketplace
+        :param marketplace_id:
+        :param category_tree_id:
+        :param category_aspects: dict of categoryId & its aspects
+        :return:
+        """
+        self.execute('DELETE FROM category_aspects WHERE marketplace_id = ?', (marketplace_id,))
+        self.executemany(
+            'INSERT INTO category_aspects (marketplace_id, category_id, aspects) VALUES (?, ?, ?)',
+            [
+                (marketplace_id, category_id, gzip.compress(json.dumps(aspects).encode('utf-8')))
+                for category_id, aspects in category_aspects.items()
+            ]
+        )
+        self.execute(
+            'INSERT OR REPLACE INTO category_trees (marketplace_id, category_tree_id, fetched_at) VALUES (?, ?, ?)',
+            (marketplace_id, category_tree_id, time.time())
+        )
+
+
+class ImageIndex:
+    """
+    sku -> sorted image files of the photo directory, built with os.scandir in one pass.
+    The index is saved with the mtime of every sku directory, so later scans only list the directories that changed.
+    """
+    IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
+
+    def __init__(self, photo_directory: str, filename: str = None):
+        self.photo_directory = photo_directory
+        self.filename = filename
+        # sku -> {'mtime': directory mtime, 'images': sorted file names}
+        self.directories = {}
+        self.load()
+
+    def load(self):
+        if not self.filename or not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+            if data.get('photo_directory') == self.photo_directory:
+                self.directories = data.get('directories', {})
+        except Exception as e:
+            logging.exception(e)
+
+    def save(self):
+        if not self.filename:
+            return
+        temp_file = f'{self.filename}.{os.getpid()}.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump({'photo_directory': self.photo_directory, 'directories': self.directories}, fp=f)
+        os.replace(temp_file, self.filename)
+
+    def scan(self):
+        """
+        Index the sku directories, directories with an unchanged mtime keep their saved images
+        :return:
+        """
+        directories = {}
+        listed = 0
+        with os.scandir(self.photo_directory) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                mtime = entry.stat().st_mtime
+                saved = self.directories.get(entry.name)
+                if saved and saved['mtime'] == mtime:
+                    directories[entry.name] = saved
+                    continue
+                directories[entry.name] = {'mtime': mtime, 'images': self.list_images(entry.path)}
+                listed += 1
+        self.directories = directories
+        logging.info(f"Indexed {len(directories)} sku directories, {listed} listed")
+        self.save()
+
+    @classmethod
+    def list_images(cls, directory_path: str):
+        """
+        Sorted names of the image files of a directory
+        """
+        with os.scandir(directory_path) as entries:
+            return sorted(
+                entry.name for entry in entries
+                if os.path.splitext(entry.name)[1].lower() in cls.IMAGE_EXTENSIONS and entry.is_file()
+            )
+
+    def get(self, sku: str):
+        directory = self.directories.get(sku)
+        if not directory:
+            return []
+        return [os.path.join(self.photo_directory, sku, name) for name in directory['images']]
+
+
+def preprocess_image(source: str, target: str, max_size: int = 1600, quality: int = 85):
+    """
+    Downscale an image to fit max_size x max_size & save it as a jpeg without EXIF,
+    runs in the image preprocessing process pool
+    :param source:
+    :param target:
+    :param max_size: longest side in pixels
+    :param quality: jpeg quality
+    :return: target
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        # apply the EXIF orientation before the EXIF is dropped
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        temp_file = f'{target}.{os.getpid()}.tmp'
+        image.save(temp_file, 'JPEG', quality=quality, optimize=True)
+    os.replace(temp_file, target)
+    return target
 
 
 class EbayAPI:
 
-    def __init__(self, client_id: str, client_secret: str, dev_id: str, test: bool = False):
+    def __init__(self, client_id: str, client_secret: str, dev_id: str, test: bool = False,
+                 image_upload_workers: int = 4, image_cache_days: int = 30,
+                 http_pool_size: int = 10, http_timeout: float = 60, rate_limits: dict = None,
+                 max_retries: int = 5, retry_budget_ratio: float = 0.2, retry_budget_min_tokens: float = 10,
+                 retry_budget_max_tokens: float = 100, build_workers: int = 2, send_workers: int = 2,
+                 pipeline_queue_size: int = 2, marketplace_id: str = 'EBAY_GB', currency: str = 'GBP',
+                 photo_directory: str = None, account: str = None, policy_cache_hours: float = 24,
+                 aspect_cache_days: int = 7, image_preprocess_workers: int = 0, image_max_size: int = 1600,
+                 image_quality: int = 85, save_image_index: bool = True, base_url: str = None,
+                 metrics_port: int = 0, metrics_snapshot_file: str = None, metrics_snapshot_interval: float = 60,
+                 reconcile_workers: int = 8):
         self.client_id = client_id
         self.client_secret = client_secret
         self.dev_id = dev_id
@@ -161,6 +1163,8 @@ class EbayAPI:
         self.oauth_client = None
         self.token = None
         self.token_client_credentials = None
+        # serializes token refreshes between threads, the token file lock between processes
+        self.token_lock = threading.RLock()
         self.test = test
         self.state = None
         self.product_aspects_column_list = []
@@ -168,40 +1172,317 @@ class EbayAPI:
         self.fulfillment_policy = None
         self.payment_policy = None
         self.return_policy = None
+        self.marketplace_id = marketplace_id
+        self.currency = currency
+        self.photo_directory = photo_directory
+        self.account = account
 
         self.sku_offer_id_dict = {}
+        self.publish_results = {}
+        # errors of the run that belong to no sku, e.g. a sheet that can't be read to the end
+        self.run_errors = []
+        # one keep-alive session for every api call, large enough for all image upload workers
+        self.http_timeout = http_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=http_pool_size,
+            pool_maxsize=max(http_pool_size, image_upload_workers)
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.rate_limiters = {
+            family: RateLimiter(rate)
+            for family, rate in {**DEFAULT_RATE_LIMITS, **(rate_limits or {})}.items()
+        }
+        self.max_retries = max_retries
+        # one budget per api family, so e.g. image upload retries don't use up the retries of offer calls
+        self.retry_budgets = {
+            family: RetryBudget(retry_budget_ratio, retry_budget_min_tokens, retry_budget_max_tokens)
+            for family in self.rate_limiters
+        }
+        # list_items pipeline
+        self.build_workers = build_workers
+        self.send_workers = send_workers
+        self.pipeline_queue_size = pipeline_queue_size
+        # bounded pool shared by all image uploads of this account
+        self.image_executor = ThreadPoolExecutor(
+            max_workers=image_upload_workers,
+            thread_name_prefix='image-upload'
+        )
+        # images are downscaled & recompressed before upload when image_preprocess_workers > 0
+        self.image_max_size = image_max_size
+        self.image_quality = image_quality
+        self.preprocess_executor = None
+        # image cache key -> future of its upload, so identical images are uploaded once per run
+        self.image_uploads = {}
+        self.image_uploads_lock = threading.Lock()
+        if image_preprocess_workers > 0:
+            try:
+                # optional, only needed to preprocess images before upload
+                import PIL  # noqa: F401
+            except ImportError:
+                logging.warning("Pillow is not installed, images are uploaded as they are")
+            else:
+                self.preprocess_executor = ProcessPoolExecutor(max_workers=image_preprocess_workers)
         if test:
             # sandbox url
             self.base_url = 'https://api.sandbox.ebay.com'
             self.base_auth_url = 'https://auth.sandbox.ebay.com'
             self.redirect_uri = "MB_Nirista-MBNirist-listin-zplsvkijr"
-            self.token_file = 'ebay_sandbox_api_token.json'
         else:
             # production url
             self.base_url = 'https://api.ebay.com'
             self.base_auth_url = 'https://auth.ebay.com'
             self.redirect_uri = ''
-            self.token_file = 'ebay_api_token.json'
+        # e.g. a local mock server
+        if base_url:
+            self.base_url = base_url.rstrip('/')
+        # every account keeps its own token & local state
+        file_prefix = self.get_file_prefix(test, account)
+        # policy ids of all accounts share one cache keyed by account & marketplace
+        self.policy_cache_file = f'{self.get_file_prefix(test)}_policy_cache.db'
+        self.aspects_file = f'{self.get_file_prefix(test)}_aspects.db'
+        self.preprocessed_images_directory = f'{self.get_file_prefix(test)}_images'
+        self.image_index_file = f'{file_prefix}_image_index.json' if save_image_index else None
+        self.token_file = f'{file_prefix}_api_token.json'
+        self.image_cache_file = f'{file_prefix}_image_cache.db'
+        self.journal_file = f'{file_prefix}_progress.db'
+        self.fingerprints_file = f'{file_prefix}_fingerprints.db'
         self.token_url = self.base_url + '/identity/v1/oauth2/token'
+        self.image_cache = None
+        if image_cache_days > 0:
+            self.image_cache = ImageUrlCache(self.image_cache_file, expiry_days=image_cache_days)
+        self.journal = ProgressJournal(self.journal_file)
+        self.resume = False
+        self.fingerprints = FingerprintStore(self.fingerprints_file)
+        self.diff = False
+        self.policy_cache = None
+        if policy_cache_hours > 0:
+            self.policy_cache = PolicyCache(self.policy_cache_file, ttl_hours=policy_cache_hours)
+        # rows are checked against the category aspects before any upload, unless aspect_cache_days is 0
+        self.aspect_store = None
+        if aspect_cache_days > 0:
+            self.aspect_store = AspectStore(self.aspects_file, expiry_days=aspect_cache_days)
+        self.category_aspects = {}
+        self.image_index = None
+        self.metrics = Metrics()
+        self.metrics_port = metrics_port
+        self.metrics_snapshot_file = metrics_snapshot_file
+        self.metrics_snapshot_interval = metrics_snapshot_interval
+        # reconciliation: sku -> inventory item & sku -> offer on eBay, the index is None unless the run reconciles
+        self.reconcile = False
+        self.reconcile_workers = reconcile_workers
+        self.listing_index = None
+        self.remote_inventory = {}
+        # sku -> offers on eBay, None when getOffers can't be paged & offers are fetched sku by sku
+        self.remote_offers = None
         self.token_loader()
 
+    @staticmethod
+    def get_file_prefix(test: bool, account: str = None):
+        prefix = 'ebay_sandbox' if test else 'ebay'
+        if account:
+            prefix += f'_{account}'
+        return prefix
+
+    def _request(self, method: str, uri: str, body_factory=None, min_retries: int = 0, **kwargs):
+        """
+        Send a request to the api over the shared session,
+        connection errors & RETRY_STATUS_CODES responses are retried with jittered exponential backoff
+        :param method:
+        :param uri: path relative to base_url
+        :param body_factory: callable returning a fresh request body for each attempt, for streamed bodies
+        :param min_retries: retries made even when the retry budget is spent
+        :param kwargs: passed to requests.Session.request
+        :return:
+        """
+        kwargs.setdefault('timeout', self.http_timeout)
+        family = self._get_api_family(uri)
+        rate_limiter = self.rate_limiters[family]
+        self.retry_budgets[family].deposit()
+        attempt = 0
+        reauthorized = False
+        while True:
+            if body_factory:
+                kwargs['data'] = body_factory()
+                if hasattr(kwargs['data'], 'content_type'):
+                    kwargs['headers'] = {**kwargs.get('headers', {}), 'Content-Type': kwargs['data'].content_type}
+            # the size of a streamed body can only be taken before it is sent
+            body_size = self._get_body_size(kwargs.get('data'))
+            rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, self.base_url + uri, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.observe_call(method, uri, 'error', time.perf_counter() - start)
+                if not self._can_retry(attempt, family, min_retries):
+                    raise
+                logging.warning(f"{method} {uri} failed: {e}, retry {attempt + 1}")
+            else:
+                self.metrics.observe_call(
+                    method, uri, response.status_code, time.perf_counter() - start,
+                    body_size or self._get_body_size(response.request.body), len(response.content)
+                )
+                rate_limiter.update(response)
+                if response.status_code == 401 and not reauthorized and 'headers' in kwargs:
+                    # token expired or revoked mid run, resend once with a refreshed one
+                    reauthorized = True
+                    if self._refresh_authorization(kwargs['headers']):
+                        logging.warning(f"{method} {uri} returned 401, retrying with a refreshed token")
+                        continue
+                if response.status_code not in RETRY_STATUS_CODES or \
+                        not self._can_retry(attempt, family, min_retries):
+                    return response
+                logging.warning(f"{method} {uri} returned {response.status_code}, retry {attempt + 1}")
+            self.metrics.count_retry(method, uri)
+            time.sleep(self._get_backoff(attempt))
+            attempt += 1
+
+    @staticmethod
+    def _get_body_size(body):
+        if isinstance(body, (bytes, str)):
+            return len(body)
+        # MultipartEncoder
+        return getattr(body, 'len', 0) or 0
+
+    def _can_retry(self, attempt: int, family: str, min_retries: int = 0):
+        """
+        True if a failed call may be retried: below max_retries & within the retry budget of its api family,
+        the first min_retries retries don't draw on the budget
+        """
+        if attempt >= self.max_retries:
+            return False
+        return attempt < min_retries or self.retry_budgets[family].withdraw()
+
+    @staticmethod
+    def _get_backoff(attempt: int, base: float = 1, cap: float = 60):
+        # full jitter
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
+    def _bulk_request(self, uri: str, headers: dict, items: list, key: str):
+        """
+        POST a bulk request, resending only the items whose per item statusCode is in RETRY_STATUS_CODES
+        :param uri:
+        :param headers:
+        :param items: request items
+        :param key: field identifying an item in both the request & response, i.e. sku or offerId
+        :return: response data with the final per item response of every item
+        """
+        family = self._get_api_family(uri)
+        responses = {}
+        errors = []
+        attempt = 0
+        while True:
+            response = self._request('POST', uri, headers=headers, json={'requests': items},
+                                     min_retries=BULK_MIN_RETRIES)
+            data = response.json()
+            log_payload('response', data)
+            errors = data.get('errors', [])
+
+            failed = set()
+            for item in data.get('responses', []):
+                responses[item.get(key)] = item
+                if item.get('statusCode') in RETRY_STATUS_CODES:
+                    failed.add(item.get(key))
+
+            items = [item for item in items if item.get(key) in failed]
+            if not items or not self._can_retry(attempt, family, BULK_MIN_RETRIES):
+                break
+            logging.warning(f"{len(items)} items failed, retry {attempt + 1}: {sorted(failed)}")
+            self.metrics.count_retry('POST', uri, len(items))
+            time.sleep(self._get_backoff(attempt))
+            attempt += 1
+
+        return {'responses': list(responses.values()), 'errors': errors}
+
+    @staticmethod
+    def _get_api_family(uri: str):
+        for prefix, family in API_FAMILIES.items():
+            if uri.startswith(prefix):
+                return family
+        return 'other'
+
     def token_saver(self, token):
         logging.debug("Saving token")
         self.token = token
-        with open(self.token_file, 'w') as f:
+        # write & rename so other processes never read a partial file
+        temp_file = f'{self.token_file}.{os.getpid()}.tmp'
+        with open(temp_file, 'w') as f:
             json.dump(token, fp=f)
+        os.replace(temp_file, self.token_file)
+
+    def token_loader(self):
+        if not os.path.isfile(self.token_file):
+            self.authorize()
+            return
+        logging.debug("Loading token")
+        self._reload_token()
+        if self._is_expiring(self.token):
+            self.refresh_token(expired_token=self.token.get('access_token'))
+
+    def _reload_token(self):
+        with open(self.token_file, 'r') as f:
+            self.token = json.load(f)
+        if 'expires_at' not in self.token:
+            # token saved before expires_at was tracked
+            self.token['expires_at'] = os.path.getmtime(self.token_file) + self.token.get('expires_in', 0)
+
+    @staticmethod
+    def _set_expires_at(token: dict):
+        token['expires_at'] = time.time() + token.get('expires_in', 0)
+        return token
+
+    @staticmethod
+    def _is_expiring(token: dict):
+        return not token or token.get('expires_at', 0) - TOKEN_REFRESH_MARGIN < time.time()
+
+    def get_access_token(self):
+        """
+        User access token, refreshed when it is about to expire
+        :return:
+        """
+        token = self.token.get('access_token')
+        if self._is_expiring(self.token):
+            self.refresh_token(expired_token=token)
+            token = self.token.get('access_token')
+        return token
 
-    def token_loader(self):
-        if not os.path.isfile(self.token_file):
-            self.authorize()
-            return
-        logging.debug("Loading token")
-        with open(self.token_file, 'r') as f:
-            self.token = json.load(f)
+    def get_application_token(self):
+        """
+        Client credentials token, cached until it is about to expire
+        :return:
+        """
+        with self.token_lock:
+            if self._is_expiring(self.token_client_credentials):
+                self.fetch_access_token(body=None)
+            return (self.token_client_credentials or {}).get('access_token')
 
-        #self.refresh_token()
+    def _refresh_authorization(self, headers: dict):
+        """
+        Replace the token of a request rejected with 401 by a refreshed one
+        :param headers: request headers, updated in place
+        :return: True if the request can be resent with a new token
+        """
+        authorization = headers.get('Authorization', '')
+        rejected = authorization.split(' ')[-1]
+        if not rejected:
+            return False
+        if rejected == (self.token_client_credentials or {}).get('access_token'):
+            with self.token_lock:
+                if (self.token_client_credentials or {}).get('access_token') == rejected:
+                    self.token_client_credentials = None
+            token = self.get_application_token()
+        else:
+            self.refresh_token(expired_token=rejected)
+            token = self.get_access_token()
+        if not token or token == rejected:
+            return False
+        headers['Authorization'] = authorization.replace(rejected, token)
+        return True
 
     def authorize(self):
+        from requests_oauthlib import OAuth2Session
+
         AUTHORIZATION_BASE_URL = self.base_auth_url + '/oauth2/authorize'
 
         extra = {
@@ -256,8 +1537,9 @@ class EbayAPI:
         if body:
             payload = body
 
-        response = requests.post(
-            self.base_url + uri,
+        response = self._request(
+            'POST',
+            uri,
             headers=headers,
             auth=(self.client_id, self.client_secret),
             data=payload
@@ -265,59 +1547,172 @@ class EbayAPI:
 
         if response.ok:
             if payload.get('grant_type') == 'client_credentials':
-                self.token_client_credentials = response.json()
+                self.token_client_credentials = self._set_expires_at(response.json())
                 logging.info(self.token_client_credentials)
             else:
-                self.token = response.json()
+                # a refresh response has no refresh_token, keep the one we have
+                self.token = {**(self.token or {}), **self._set_expires_at(response.json())}
                 logging.info(self.token)
                 return True
         else:
             logging.error(response.content)
         return False
 
-    def refresh_token(self):
+    def refresh_token(self, expired_token: str = None):
         """
         https://developer.ebay.com/api-docs/static/oauth-refresh-token-request.html
+        Serialized between threads & processes, a token already refreshed by another worker is reused
+        :param expired_token: access token found expired or rejected, None to always refresh
         :return:
         """
-        logging.debug("Refreshing token...")
-        refresh_token = self.token.get('refresh_token')
-        payload = {
-            'grant_type': 'refresh_token',
-            'refresh_token': refresh_token,
-            'scope': SCOPE
-        }
+        with self.token_lock, FileLock(self.token_file + '.lock'):
+            if os.path.isfile(self.token_file):
+                self._reload_token()
+            if expired_token and self.token.get('access_token') != expired_token \
+                    and not self._is_expiring(self.token):
+                logging.debug("Token already refreshed")
+                return
+
+            logging.debug("Refreshing token...")
+            refresh_token = self.token.get('refresh_token')
+            payload = {
+                'grant_type': 'refresh_token',
+                'refresh_token': refresh_token,
+                'scope': SCOPE
+            }
 
-        if self.fetch_access_token(body=payload):
-            self.token_saver(self.token)
+            if self.fetch_access_token(body=payload):
+                self.token_saver(self.token)
 
     def fetch_item_aspects(self):
         """
         https://developer.ebay.com/api-docs/commerce/taxonomy/resources/category_tree/methods/fetchItemAspects
-        :return:
+        The aspects of all leaf categories are stored in the aspect store
+        :return: True if the aspects were stored
         """
-        url = self.base_url + '/commerce/taxonomy/v1/get_default_category_tree_id?marketplace_id=EBAY_GB'
-        self.fetch_access_token(body=None)
-
-        token = self.token_client_credentials.get('access_token')
+        uri = f'/commerce/taxonomy/v1/get_default_category_tree_id?marketplace_id={self.marketplace_id}'
+        token = self.get_application_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
             'Authorization': f'IAF {token}'
         }
 
-        response = requests.get(url, headers=headers)
-        logging.debug(response.content)
+        response = self._request('GET', uri, headers=headers)
         if response.ok:
             data = response.json()
-            logging.debug(data)
+            log_payload('response', data)
             category_tree_id = data.get('categoryTreeId')
 
-            url = self.base_url + f'/commerce/taxonomy/v1/category_tree/{category_tree_id}/fetch_item_aspects'
+            uri = f'/commerce/taxonomy/v1/category_tree/{category_tree_id}/fetch_item_aspects'
+
+            response = self._request('GET', uri, headers=headers)
+            if not response.ok:
+                logging.error(response.content)
+                return False
+            content = response.content
+            # the aspects come as a gzip file, unless the transport already decoded it
+            if content[:2] == b'\x1f\x8b':
+                content = gzip.decompress(content)
+            data = json.loads(content)
+            category_aspects = {
+                str(item.get('category', {}).get('categoryId')): self._compact_aspects(item.get('aspects', []))
+                for item in data.get('categoryAspects', [])
+            }
+            logging.info(f"Aspects of {len(category_aspects)} categories fetched")
+            self.aspect_store.replace(self.marketplace_id, category_tree_id, category_aspects)
+            self.category_aspects = {}
+            return True
+        logging.error(response.content)
+        return False
 
-            response = requests.get(url, headers=headers)
-            data = response.json()
-            logging.debug(data)
+    @staticmethod
+    def _compact_aspects(aspects: list):
+        """
+        Keep only the constraints needed to validate rows
+        :param aspects: aspects of a category from fetchItemAspects
+        :return:
+        """
+        compact = []
+        for aspect in aspects:
+            constraint = aspect.get('aspectConstraint', {})
+            compact.append({
+                'name': aspect.get('localizedAspectName'),
+                'required': bool(constraint.get('aspectRequired')),
+                'mode': constraint.get('aspectMode', 'FREE_TEXT'),
+                'cardinality': constraint.get('itemToAspectCardinality', 'MULTI'),
+                'values': [value.get('localizedValue') for value in aspect.get('aspectValues', [])],
+            })
+        return compact
+
+    def load_item_aspects(self):
+        """
+        Fetch the category aspects unless the aspect store has them from the last aspect_cache_days
+        :return:
+        """
+        if not self.aspect_store or self.aspect_store.is_fresh(self.marketplace_id):
+            return
+        try:
+            if not self.fetch_item_aspects():
+                logging.warning("Category aspects not fetched, rows are validated against the stored ones")
+        except Exception as e:
+            logging.exception(e)
+
+    def _get_category_aspects(self, category_id: str):
+        if category_id not in self.category_aspects:
+            self.category_aspects[category_id] = self.aspect_store.get(self.marketplace_id, category_id)
+        return self.category_aspects[category_id]
+
+    def _validate_aspects(self, row):
+        """
+        Check the aspects of a prepared row against its category:
+        required aspects present, values allowed for SELECTION_ONLY & one value for SINGLE aspects
+        :param row: from _prepare_rows
+        :return: list of error messages, empty for a valid row or a category without stored aspects
+        """
+        if not self.aspect_store or not row.get('_categoryId'):
+            return []
+        category_aspects = self._get_category_aspects(row['_categoryId'])
+        if not category_aspects:
+            return []
+
+        row_aspects = {name.casefold(): values for name, values in row.get('_aspects', {}).items()}
+        errors = []
+        for aspect in category_aspects:
+            values = row_aspects.get(aspect['name'].casefold())
+            if not values:
+                if aspect['required']:
+                    errors.append(f"Missing required aspect {aspect['name']}")
+                continue
+            if aspect['cardinality'] == 'SINGLE' and len(values) > 1:
+                errors.append(f"Aspect {aspect['name']} takes one value, got {len(values)}")
+            if aspect['mode'] == 'SELECTION_ONLY':
+                allowed = {value.casefold() for value in aspect['values']}
+                for value in values:
+                    if str(value).casefold() not in allowed:
+                        errors.append(f"Value {value} not allowed for aspect {aspect['name']}")
+        return errors
+
+    def _reject_invalid_rows(self, rows: list):
+        """
+        Drop the rows with invalid aspects, their errors go to the publish report
+        :param rows: prepared rows
+        :return: valid rows
+        """
+        valid_rows = []
+        for row in rows:
+            errors = self._validate_aspects(row)
+            if not errors:
+                valid_rows.append(row)
+                continue
+            sku = row.get(EXCEL_COL_MAPPING['sku'])
+            logging.warning(f"sku: {sku} rejected: {'; '.join(errors)}")
+            self.publish_results[sku] = {
+                'offerId': None,
+                'listingId': None,
+                'errors': [{'message': error} for error in errors]
+            }
+        return valid_rows
 
     def read_excel(self, excel_filename: str, sheet: str = 'Listings'):
         """
@@ -326,14 +1721,97 @@ class EbayAPI:
         :param sheet:
         :return:
         """
+        import pandas as pd
+        from python_calamine.pandas import pandas_monkeypatch
+        # registers the calamine engine with pandas
+        pandas_monkeypatch()
+
         logging.info('started')
         self.df = pd.read_excel(excel_filename, sheet_name=sheet, header=3, engine="calamine")
         self.df = self.df.dropna(how='all')
         #print(self.df)
         logging.info('finished')
 
+    @staticmethod
+    def _convert_cell(value):
+        # same conversion as pandas' calamine reader: whole floats to int, dates & durations to pandas types
+        import pandas as pd
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, date):
+            return pd.Timestamp(value)
+        if isinstance(value, timedelta):
+            return pd.Timedelta(value)
+        return value
+
+    @staticmethod
+    def _parse_rows(header_row: list, rows: list):
+        """
+        Dataframe of sheet rows, made by the parser of pd.read_excel:
+        same na values, duplicate header names renamed name.1, name.2 & unnamed columns 'Unnamed: <i>'
+        """
+        from pandas.io.parsers import TextParser
+        return TextParser([header_row] + rows, header=0).read()
+
+    def _iter_workbook(self, excel_filename: str, sheet: str, header: int, chunk_size: int):
+        from python_calamine import CalamineWorkbook
+
+        workbook = CalamineWorkbook.from_path(excel_filename)
+        worksheet = workbook.get_sheet_by_name(sheet)
+        if worksheet.start is None:
+            # empty sheet
+            return
+        # iter_rows starts at the first row of the sheet but at the first used column
+        padding = [''] * worksheet.start[1]
+
+        header_row = None
+        chunk = []
+        for index, row in enumerate(worksheet.iter_rows()):
+            if index < header:
+                continue
+            values = padding + [self._convert_cell(value) for value in row]
+            if header_row is None:
+                header_row = values
+                continue
+            chunk.append(values)
+            if len(chunk) == chunk_size:
+                yield self._parse_rows(header_row, chunk)
+                chunk = []
+        if chunk:
+            yield self._parse_rows(header_row, chunk)
+
+    def iter_sheet(self, filename: str, sheet: str = 'Listings', header: int = 3, chunk_size: int = 100):
+        """
+        Read the listings in chunks of rows instead of loading the whole sheet, csv & parquet files are read too
+        :param filename: excel, csv or parquet file
+        :param sheet: excel sheet name
+        :param header: index of the header row, excel & csv
+        :param chunk_size: rows per chunk
+        :return: generator of dataframes
+        """
+        logging.info('started')
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == '.csv':
+            import pandas as pd
+            chunks = pd.read_csv(filename, header=header, chunksize=chunk_size)
+        elif extension == '.parquet':
+            # optional dependency, only needed for parquet input
+            import pyarrow.parquet as pq
+            chunks = (
+                batch.to_pandas()
+                for batch in pq.ParquetFile(filename).iter_batches(batch_size=chunk_size)
+            )
+        else:
+            chunks = self._iter_workbook(filename, sheet, header, chunk_size)
+
+        for df in chunks:
+            df = df.dropna(how='all')
+            if not df.empty:
+                yield df
+        logging.info('finished')
+
     def _get_xml_request(self):
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         upload_Pictures_XML = (
             '<?xml version="1.0" encoding="utf-8"?>\n'
             '<UploadSiteHostedPicturesRequest xmlns="urn:ebay:apis:eBLBaseComponents">\n\t'
@@ -348,12 +1826,16 @@ class EbayAPI:
 
     @staticmethod
     def add_image_as_attachment(filename, request):
+        """
+        Multipart fields of an upload, the file is given as an open handle so the encoder streams it from disk
+        :param filename:
+        :param request: request xml
+        :return: fields, the caller closes the file handle
+        """
         try:
-            with open(filename, 'rb') as f:
-                file_content = f.read()
             return {
                 'request': request,
-                'file': (os.path.basename(filename), file_content),
+                'file': (os.path.basename(filename), open(filename, 'rb')),
             }
         except Exception as e:
             logging.exception(e)
@@ -365,9 +1847,36 @@ class EbayAPI:
         :param filename:
         :return:
         """
+        from requests_toolbelt.multipart.encoder import MultipartEncoder
+
         logging.info(f"uploading {filename}")
         uri = '/ws/api.dll'
-        headers = {
+        headers = self._get_upload_headers()
+
+        request_xml = self._get_xml_request()
+        files = []
+
+        def body_factory():
+            # the encoder is consumed by a send, so every attempt streams the file from a fresh handle
+            parts = self.add_image_as_attachment(filename, request_xml)
+            if not parts:
+                raise OSError(f"Can't read {filename}")
+            files.append(parts['file'][1])
+            return MultipartEncoder(fields=parts)
+
+        try:
+            response = self._request('POST', uri, headers=headers, body_factory=body_factory)
+            log_payload('response', response.text)
+            return response.text
+        except Exception as ex:
+            logging.exception(ex)
+            return None
+        finally:
+            for f in files:
+                f.close()
+
+    def _get_upload_headers(self):
+        return {
             "SOAPAction": "",
             "X-EBAY-API-SESSION-CERTIFICATE": f"{self.client_id};{self.dev_id};{self.client_secret}",
             "X-EBAY-API-COMPATIBILITY-LEVEL": "967",
@@ -380,31 +1889,16 @@ class EbayAPI:
             'Content-Type': 'application/xml'
         }
 
-        request_xml = self._get_xml_request()
-
-        try:
-            parts = self.add_image_as_attachment(filename, request_xml)
-            if parts:
-                multipart_data = MultipartEncoder(fields=parts)
-                headers['Content-Type'] = multipart_data.content_type
-                response = requests.post(self.base_url + uri, data=multipart_data, headers=headers)
-                logging.info(response.text)
-                return response.text
-            '''files = [('file', (os.path.basename(filename), open(filename, 'rb'), 'image/jpg'))]
-            response = requests.post(self.base_url + uri, data=request_xml, headers=headers, files=files)
-            logging.info(response.content)'''
-        except Exception as ex:
-            logging.exception(ex)
-            return None
-
     def upload_image(self, filename):
         """
         https://developer.ebay.com/devzone/xml/docs/reference/ebay/uploadsitehostedpictures.html
         :param filename:
         :return:
         """
+        from ebaysdk.trading import Connection as Trading
+
         logging.info(f"uploading {filename}")
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         if self.test:
             domain = 'api.sandbox.ebay.com'
         else:
@@ -413,13 +1907,14 @@ class EbayAPI:
                       appid=self.client_id, devid=self.dev_id, certid=self.client_secret,
                       token=token, config_file=None)
 
-        files = [('file', (os.path.basename(filename), open(filename, 'rb'), 'image/jpg'))]
+        with open(filename, 'rb') as f:
+            files = [('file', (os.path.basename(filename), f, 'image/jpg'))]
 
-        response = api.execute('UploadSiteHostedPictures',
-                               {"PictureSet": "Supersize"},
-                               files=files
-                               )
-        logging.debug(response.text)
+            response = api.execute('UploadSiteHostedPictures',
+                                   {"PictureSet": "Supersize"},
+                                   files=files
+                                   )
+        log_payload('response', response.text)
         return response
 
     def bulk_create_or_replace_inventory_item(self, inventory_items: list):
@@ -427,26 +1922,31 @@ class EbayAPI:
         https://developer.ebay.com/api-docs/sell/inventory/resources/inventory_item/methods/bulkCreateOrReplaceInventoryItem#h3-request-headers
 
         :param inventory_items:
-        :return:
+        :return: dict of sku & True if its inventory item was created or replaced
         """
         logging.info("started")
         uri = '/sell/inventory/v1/bulk_create_or_replace_inventory_item'
 
-        payload = {
-            "requests": inventory_items
-        }
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
             'Authorization': f'IAF {token}'
         }
 
+        sku_status_dict = dict.fromkeys([item.get('sku') for item in inventory_items], False)
         try:
-            response = requests.post(self.base_url + uri, headers=headers, json=payload)
-            logging.debug(response.json())
+            data = self._bulk_request(uri, headers, inventory_items, 'sku')
+            for item in data.get('responses', []):
+                if item.get('errors'):
+                    logging.error(f"Inventory item not created for sku: {item.get('sku')}: {item.get('errors')}")
+                else:
+                    sku_status_dict[item.get('sku')] = True
+            if data.get('errors'):
+                logging.error(f"Inventory items not created: {data.get('errors')}")
         except Exception as e:
             logging.exception(e)
+        return sku_status_dict
 
     def create_offers(self, offer_items: list):
         """
@@ -457,7 +1957,7 @@ class EbayAPI:
         logging.info("started")
         uri = '/sell/inventory/v1/offer'
 
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
@@ -467,8 +1967,8 @@ class EbayAPI:
         for payload in offer_items:
             try:
                 sku = payload.get('sku')
-                response = requests.post(self.base_url + uri, headers=headers, json=payload)
-                logging.debug(response.json())
+                response = self._request('POST', uri, headers=headers, json=payload)
+                log_payload('response', response.json)
                 if response.ok:
                     data = response.json()
                     self.sku_offer_id_dict[sku] = data.get("offerId")
@@ -477,30 +1977,60 @@ class EbayAPI:
             except Exception as e:
                 logging.exception(e)
 
+    @staticmethod
+    def _parse_bulk_offer_responses(data: dict):
+        """
+        Map each sku of a bulkCreateOffer response to its offerId, None for failed skus
+        :param data:
+        :return:
+        """
+        sku_offer_id_dict = {}
+        for item in data.get('responses', []):
+            sku = item.get('sku')
+            offer_id = item.get('offerId')
+            errors = item.get('errors', [])
+            if not offer_id:
+                # an offer already exists for the sku, eBay returns its offerId in the error parameters
+                for error in errors:
+                    for parameter in error.get('parameters', []):
+                        if parameter.get('name') == 'offerId':
+                            offer_id = parameter.get('value')
+            if errors and offer_id:
+                logging.warning(f"Offer already exists for sku: {sku}, offerId: {offer_id}")
+            elif errors:
+                logging.error(f"Offer not created for sku: {sku}: {errors}")
+            sku_offer_id_dict[sku] = offer_id
+        return sku_offer_id_dict
+
     def bulk_create_offer(self, offer_items: list):
         """
         https://developer.ebay.com/api-docs/sell/inventory/resources/offer/methods/bulkCreateOffer
         :param offer_items:
-        :return:
+        :return: dict of sku & offerId, None for skus whose offer was not created
         """
         logging.info("started")
         uri = '/sell/inventory/v1/bulk_create_offer'
 
-        payload = {
-            "requests": offer_items
-        }
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
             'Authorization': f'IAF {token}'
         }
 
-        try:
-            response = requests.post(self.base_url + uri, headers=headers, json=payload)
-            logging.debug(response.json())
-        except Exception as e:
-            logging.exception(e)
+        sku_offer_id_dict = {}
+        for i in range(0, len(offer_items), BULK_OFFER_LIMIT):
+            chunk = offer_items[i:i + BULK_OFFER_LIMIT]
+            chunk_offer_ids = dict.fromkeys([item.get('sku') for item in chunk])
+            try:
+                data = self._bulk_request(uri, headers, chunk, 'sku')
+                if data.get('errors'):
+                    logging.error(f"Offers not created: {data.get('errors')}")
+                chunk_offer_ids.update(self._parse_bulk_offer_responses(data))
+            except Exception as e:
+                logging.exception(e)
+            sku_offer_id_dict.update(chunk_offer_ids)
+        return sku_offer_id_dict
 
     def publish_offer(self, offer_id: str):
         """
@@ -511,39 +2041,188 @@ class EbayAPI:
         logging.info("started")
         uri = f'/sell/inventory/v1/offer/{offer_id}/publish'
 
-        token = self.token.get('access_token')
+        token = self.get_access_token()
+        headers = {
+            'Content-Language': 'en-US',
+            'Content-Type': 'application/json',
+            'Authorization': f'IAF {token}'
+        }
+
+        try:
+            response = self._request('POST', uri, headers=headers)
+            log_payload('response', response.json)
+        except Exception as e:
+            logging.exception(e)
+
+    def update_offer(self, offer_id: str, offer_payload: dict):
+        """
+        https://developer.ebay.com/api-docs/sell/inventory/resources/offer/methods/updateOffer
+        A published offer's listing is revised by this call.
+        :param offer_id:
+        :param offer_payload: payload from _generate_offer_payload
+        :return: True if the offer was updated
+        """
+        logging.info("started")
+        uri = f'/sell/inventory/v1/offer/{offer_id}'
+
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
             'Authorization': f'IAF {token}'
         }
+        # fields that can not be changed by updateOffer
+        payload = {
+            key: val for key, val in offer_payload.items()
+            if key not in ('sku', 'marketplaceId', 'format', 'listingStartDate')
+        }
 
         try:
-            response = requests.post(self.base_url + uri, headers=headers)
-            logging.debug(response.json())
+            response = self._request('PUT', uri, headers=headers, json=payload)
+            if response.ok:
+                logging.debug(f"{offer_id} updated successfully.")
+                return True
+            logging.error(f"{offer_id} not updated: {response.content}")
         except Exception as e:
             logging.exception(e)
+        return False
+
+    def bulk_update_price_quantity(self, items: list):
+        """
+        https://developer.ebay.com/api-docs/sell/inventory/resources/inventory_item/methods/bulkUpdatePriceQuantity
+        :param items: payloads from _generate_price_quantity_payload
+        :return: dict of sku & True if its price & quantity were updated
+        """
+        logging.info("started")
+        uri = '/sell/inventory/v1/bulk_update_price_quantity'
+
+        token = self.get_access_token()
+        headers = {
+            'Content-Language': 'en-US',
+            'Content-Type': 'application/json',
+            'Authorization': f'IAF {token}'
+        }
+
+        sku_status_dict = dict.fromkeys([item.get('sku') for item in items], False)
+        for i in range(0, len(items), BULK_OFFER_LIMIT):
+            chunk = items[i:i + BULK_OFFER_LIMIT]
+            try:
+                data = self._bulk_request(uri, headers, chunk, 'sku')
+                for item in data.get('responses', []):
+                    if item.get('errors'):
+                        logging.error(f"Price & quantity not updated for sku: {item.get('sku')}: {item.get('errors')}")
+                    else:
+                        sku_status_dict[item.get('sku')] = True
+                if data.get('errors'):
+                    logging.error(f"Price & quantity not updated: {data.get('errors')}")
+            except Exception as e:
+                logging.exception(e)
+        return sku_status_dict
+
+    def bulk_publish_offer(self, offer_ids: list):
+        """
+        https://developer.ebay.com/api-docs/sell/inventory/resources/offer/methods/bulkPublishOffer
+        :param offer_ids:
+        :return: dict of offerId & its result: {'listingId': ..., 'errors': [...]}
+        """
+        logging.info("started")
+        uri = '/sell/inventory/v1/bulk_publish_offer'
+
+        token = self.get_access_token()
+        headers = {
+            'Content-Language': 'en-US',
+            'Content-Type': 'application/json',
+            'Authorization': f'IAF {token}'
+        }
+
+        results = {}
+        for i in range(0, len(offer_ids), BULK_OFFER_LIMIT):
+            chunk = offer_ids[i:i + BULK_OFFER_LIMIT]
+            try:
+                data = self._bulk_request(uri, headers, [{'offerId': offer_id} for offer_id in chunk], 'offerId')
+                for item in data.get('responses', []):
+                    results[item.get('offerId')] = {
+                        'listingId': item.get('listingId'),
+                        'errors': item.get('errors', []),
+                    }
+                if not data.get('responses'):
+                    for offer_id in chunk:
+                        results[offer_id] = {'listingId': None, 'errors': data.get('errors', [])}
+            except Exception as e:
+                logging.exception(e)
+                for offer_id in chunk:
+                    results[offer_id] = {'listingId': None, 'errors': [{'message': str(e)}]}
+        return results
+
+    def publish_offers(self, sku_offer_id_dict: dict = None):
+        """
+        Publish offers in bulk
+        :param sku_offer_id_dict: dict of sku & offerId, defaults to self.sku_offer_id_dict which is cleared afterwards
+        :return: dict of sku & its result: {'offerId': ..., 'listingId': ..., 'errors': [...]}
+        """
+        clear = sku_offer_id_dict is None
+        if clear:
+            sku_offer_id_dict = self.sku_offer_id_dict
 
-    def publish_offers(self):
-        for key, val in self.sku_offer_id_dict.items():
+        publish_results = {}
+        offer_id_sku_dict = {}
+        for key, val in sku_offer_id_dict.items():
             if val:
-                logging.info(f"Publishing offerId: {val} for sku: {key}")
-                self.publish_offer(val)
+                offer_id_sku_dict[val] = key
             else:
                 logging.warning(f"No offerId found for sku: {key}")
+                publish_results[key] = {'offerId': None, 'listingId': None, 'errors': [{'message': 'No offerId'}]}
+
+        if offer_id_sku_dict:
+            logging.info(f"Publishing {len(offer_id_sku_dict)} offers")
+            results = self.bulk_publish_offer(list(offer_id_sku_dict))
+            for offer_id, key in offer_id_sku_dict.items():
+                result = results.get(offer_id, {'listingId': None, 'errors': [{'message': 'No response'}]})
+                if result.get('listingId'):
+                    logging.info(f"Published offerId: {offer_id} for sku: {key}, listingId: {result['listingId']}")
+                else:
+                    logging.error(f"offerId: {offer_id} for sku: {key} not published: {result.get('errors')}")
+                publish_results[key] = {'offerId': offer_id, **result}
+
+        self.publish_results.update(publish_results)
+        if clear:
+            self.sku_offer_id_dict.clear()
+        return publish_results
 
-        self.sku_offer_id_dict.clear()
+    def save_publish_report(self, filename: str):
+        """
+        Write the publish result of every sku of the run to a csv file
+        :param filename:
+        :return:
+        """
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['sku', 'offerId', 'listingId', 'status', 'errors'])
+            for sku, result in self.publish_results.items():
+                errors = '; '.join(str(e.get('message', e)) for e in result.get('errors', []))
+                # skus skipped or updated by diff & reconcile runs have a status of their own
+                status = result.get('status') or ('published' if result.get('listingId') else 'failed')
+                writer.writerow([sku, result.get('offerId'), result.get('listingId'), status, errors])
+            for error in self.run_errors:
+                writer.writerow(['', '', '', 'failed', error])
+
+        published = sum(1 for result in self.publish_results.values() if result.get('listingId'))
+        message = f"Published {published} of {len(self.publish_results)} offers, report: {filename}"
+        if self.run_errors:
+            message += f", {len(self.run_errors)} errors of the run: {'; '.join(self.run_errors)}"
+        print(message)
+        logging.info(message)
 
     def get_offers(self, sku):
         """
         https://developer.ebay.com/api-docs/sell/inventory/resources/offer/methods/getOffers
         :param sku:
-        :return:
+        :return: list of the offers of the sku, None if they could not be fetched
         """
-        logging.info("started")
-        uri = f'/sell/inventory/v1/offer?sku={sku}'
+        logging.debug(f"started {sku}")
+        uri = f'/sell/inventory/v1/offer?sku={urlparse.quote(str(sku))}'
 
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
@@ -551,11 +2230,210 @@ class EbayAPI:
         }
 
         try:
-            response = requests.get(self.base_url + uri, headers=headers)
+            response = self._request('GET', uri, headers=headers)
+            if response.status_code == 404:
+                # no offer for the sku
+                return []
+            log_payload('response', response.json)
             if response.ok:
-                print(response.json())
+                return response.json().get('offers', [])
+            logging.error(f"Offers of sku: {sku} not fetched: {response.content}")
+        except Exception as e:
+            logging.exception(e)
+        return None
+
+    def get_inventory_items(self, page: int = 0):
+        """
+        https://developer.ebay.com/api-docs/sell/inventory/resources/inventory_item/methods/getInventoryItems
+        :param page: offset of getInventoryItems, which is the page number
+        :return: response data: total & inventoryItems of the page
+        """
+        logging.debug(f"started page {page}")
+        uri = f'/sell/inventory/v1/inventory_item?limit={INVENTORY_PAGE_LIMIT}&offset={page}'
+
+        token = self.get_access_token()
+        headers = {
+            'Content-Language': 'en-US',
+            'Content-Type': 'application/json',
+            'Authorization': f'IAF {token}'
+        }
+
+        response = self._request('GET', uri, headers=headers)
+        response.raise_for_status()
+        log_payload('response', response.json)
+        return response.json()
+
+    def get_offers_page(self, page: int = 0):
+        """
+        https://developer.ebay.com/api-docs/sell/inventory/resources/offer/methods/getOffers
+        :param page: offset of getOffers, which is the page number
+        :return: response data: total & offers of the page
+        """
+        logging.debug(f"started page {page}")
+        uri = f'/sell/inventory/v1/offer?limit={OFFER_PAGE_LIMIT}&offset={page}'
+
+        token = self.get_access_token()
+        headers = {
+            'Content-Language': 'en-US',
+            'Content-Type': 'application/json',
+            'Authorization': f'IAF {token}'
+        }
+
+        response = self._request('GET', uri, headers=headers)
+        response.raise_for_status()
+        log_payload('response', response.json)
+        return response.json()
+
+    def fetch_offers(self):
+        """
+        Every offer of the seller, paged through like fetch_inventory_items
+        :return: dict of sku & its offers
+        """
+        first_page = self.get_offers_page(0)
+        pages = [first_page]
+        page_count = -(-first_page.get('total', 0) // OFFER_PAGE_LIMIT)
+        if page_count > 1:
+            with ThreadPoolExecutor(max_workers=self.reconcile_workers, thread_name_prefix='reconcile') as executor:
+                pages.extend(executor.map(self.get_offers_page, range(1, page_count)))
+        sku_offers = {}
+        for page in pages:
+            for offer in page.get('offers', []):
+                sku_offers.setdefault(str(offer.get('sku')), []).append(offer)
+        return sku_offers
+
+    def fetch_inventory_items(self):
+        """
+        Every inventory item of the seller, the first page gives the total & the other pages are fetched in parallel
+        :return: dict of sku & inventory item
+        """
+        first_page = self.get_inventory_items(0)
+        pages = [first_page]
+        page_count = -(-first_page.get('total', 0) // INVENTORY_PAGE_LIMIT)
+        if page_count > 1:
+            with ThreadPoolExecutor(max_workers=self.reconcile_workers, thread_name_prefix='reconcile') as executor:
+                pages.extend(executor.map(self.get_inventory_items, range(1, page_count)))
+        return {item['sku']: item for page in pages for item in page.get('inventoryItems', [])}
+
+    @staticmethod
+    def _get_listing(offers: list, inventory_item: dict, marketplace_id: str):
+        """
+        Listing index entry of a sku from its offers & inventory item
+        :return: {'offer_id', 'status', 'listing_id', 'price', 'quantity', 'offer', 'inventory_item'},
+                 offer_id is None if there is no offer on the marketplace
+        """
+        quantity = inventory_item.get('availability', {}).get('shipToLocationAvailability', {}).get('quantity')
+        offer = next((o for o in offers or [] if o.get('marketplaceId', marketplace_id) == marketplace_id), {})
+        return {
+            'offer_id': offer.get('offerId'),
+            'status': offer.get('status'),
+            'listing_id': offer.get('listing', {}).get('listingId'),
+            'price': offer.get('pricingSummary', {}).get('price', {}).get('value'),
+            'quantity': offer.get('availableQuantity', quantity),
+            # compared with the payloads of skus without a fingerprint
+            'offer': offer,
+            'inventory_item': inventory_item,
+        }
+
+    def reconcile_inventory(self, skus: list = None):
+        """
+        Start the index of what already exists on eBay: the inventory items & offers are paged through,
+        the skus given are indexed right away & streamed skus batch by batch
+        :param skus: skus of the sheet, when it is read upfront
+        :return: True if the inventory items were fetched
+        """
+        logging.info("started")
+        self.listing_index = None
+        try:
+            with self.metrics.time_stage('reconcile', 0):
+                self.remote_inventory = self.fetch_inventory_items()
         except Exception as e:
             logging.exception(e)
+            logging.error("Inventory not reconciled, offers are created as without reconciliation")
+            return False
+        logging.info(f"{len(self.remote_inventory)} inventory items on eBay")
+        self.remote_offers = None
+        try:
+            with self.metrics.time_stage('reconcile', 0):
+                self.remote_offers = self.fetch_offers()
+            logging.info(f"{sum(map(len, self.remote_offers.values()))} offers on eBay")
+        except Exception as e:
+            logging.warning(f"Offers not paged, they are fetched sku by sku: {e!r}")
+        self.listing_index = {}
+        if skus:
+            self.index_offers(skus)
+        return True
+
+    def index_offers(self, skus: list):
+        """
+        Add the offers of the skus with an inventory item on eBay to the listing index,
+        from the paged offers or else fetched in parallel with a getOffers call per sku
+        :param skus:
+        :return:
+        """
+        skus = [
+            sku for sku in dict.fromkeys(str(sku) for sku in skus)
+            if sku in self.remote_inventory and sku not in self.listing_index
+        ]
+        if not skus:
+            return
+        with self.metrics.time_stage('reconcile', len(skus)):
+            if self.remote_offers is not None:
+                sku_offers = [self.remote_offers.get(sku, []) for sku in skus]
+            else:
+                with ThreadPoolExecutor(max_workers=self.reconcile_workers,
+                                        thread_name_prefix='reconcile') as executor:
+                    sku_offers = list(executor.map(self.get_offers, skus))
+            for sku, offers in zip(skus, sku_offers):
+                # skus whose offers could not be fetched are pushed as without reconciliation
+                if offers is not None:
+                    self.listing_index[sku] = self._get_listing(offers, self.remote_inventory[sku],
+                                                                self.marketplace_id)
+        with_offer = sum(1 for sku in skus if self.listing_index.get(sku, {}).get('offer_id'))
+        logging.info(f"Reconciled {len(skus)} skus, {with_offer} with an offer")
+
+    @staticmethod
+    def _is_price_quantity_current(listing: dict, inventory_payload: dict, offer_payload: dict):
+        """
+        True if the offer on eBay has the price & quantity of the payloads
+        """
+        price = offer_payload.get('pricingSummary', {}).get('price', {}).get('value')
+        try:
+            same_price = price is None or float(listing['price']) == float(price)
+        except (TypeError, ValueError):
+            same_price = False
+        quantity = inventory_payload['availability']['shipToLocationAvailability']['quantity']
+        return same_price and listing['quantity'] == quantity
+
+    @staticmethod
+    def _is_content_current(listing: dict, inventory_payload: dict, offer_payload: dict):
+        """
+        True if the inventory item & offer on eBay have the content of the payloads, price & quantity aside,
+        for skus without a fingerprint, e.g. listed from another machine
+        """
+        inventory = {
+            key: val for key, val in inventory_payload.items() if key not in ('availability', 'availableQuantity')
+        }
+        offer = {
+            key: val for key, val in offer_payload.items()
+            if key not in ('listingStartDate', 'pricingSummary', 'availableQuantity')
+        }
+        return EbayAPI._payload_matches(listing['inventory_item'], inventory) and \
+            EbayAPI._payload_matches(listing['offer'], offer)
+
+    @staticmethod
+    def _payload_matches(remote, payload):
+        """
+        True if remote, as read back from eBay, has every value of payload.
+        eBay adds fields of its own & returns numbers as strings, so only the fields sent are compared
+        """
+        if isinstance(payload, dict):
+            return isinstance(remote, dict) and all(
+                EbayAPI._payload_matches(remote.get(key), val) for key, val in payload.items()
+            )
+        if isinstance(payload, list):
+            return isinstance(remote, list) and len(remote) == len(payload) and \
+                all(EbayAPI._payload_matches(r, p) for r, p in zip(remote, payload))
+        return remote == payload or str(remote) == str(payload)
 
     def delete_offer(self, offer_id: str):
         """
@@ -566,7 +2444,7 @@ class EbayAPI:
         logging.info("started")
         uri = f'/sell/inventory/v1/offer/{offer_id}'
 
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
@@ -574,7 +2452,7 @@ class EbayAPI:
         }
 
         try:
-            response = requests.delete(self.base_url + uri, headers=headers)
+            response = self._request('DELETE', uri, headers=headers)
             if response.ok:
                 logging.debug(f"{offer_id} deleted successfully.")
         except Exception as e:
@@ -589,7 +2467,7 @@ class EbayAPI:
         merchant_location_key = 'Klaipeda'
         uri = f'/sell/inventory/v1/location/{merchant_location_key}'
 
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
@@ -618,7 +2496,7 @@ class EbayAPI:
         }
 
         try:
-            response = requests.post(self.base_url + uri, headers=headers, json=payload)
+            response = self._request('POST', uri, headers=headers, json=payload)
             if response.ok:
                 logging.info(f"Inventory location: {merchant_location_key} created")
                 self.merchant_location_key = merchant_location_key
@@ -637,7 +2515,7 @@ class EbayAPI:
         logging.info("started")
         uri = '/sell/inventory/v1/location'
 
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
@@ -645,8 +2523,8 @@ class EbayAPI:
         }
 
         try:
-            response = requests.get(self.base_url + uri, headers=headers)
-            logging.debug(response.json())
+            response = self._request('GET', uri, headers=headers)
+            log_payload('response', response.json)
             data = response.json()
             if data.get('total', 0) == 0:
                 logging.error("No inventory location found")
@@ -670,7 +2548,7 @@ class EbayAPI:
         logging.info("started")
         uri = '/sell/account/v1/fulfillment_policy'
 
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
@@ -684,13 +2562,13 @@ class EbayAPI:
                 }
             ],
             'name': 'fulfillment_policy_1',
-            'marketplaceId': 'EBAY_GB'
+            'marketplaceId': self.marketplace_id
         }
 
         try:
-            response = requests.post(self.base_url + uri, headers=headers, json=payload)
+            response = self._request('POST', uri, headers=headers, json=payload)
             if response.ok:
-                logging.debug(response.json())
+                log_payload('response', response.json)
                 data = response.json()
 
                 if data.get('fulfillmentPolicyId'):
@@ -708,9 +2586,9 @@ class EbayAPI:
         :return:
         """
         logging.info("started")
-        uri = '/sell/account/v1/fulfillment_policy?marketplace_id=EBAY_GB'
+        uri = f'/sell/account/v1/fulfillment_policy?marketplace_id={self.marketplace_id}'
 
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
@@ -718,8 +2596,8 @@ class EbayAPI:
         }
 
         try:
-            response = requests.get(self.base_url + uri, headers=headers)
-            logging.debug(response.json())
+            response = self._request('GET', uri, headers=headers)
+            log_payload('response', response.json)
             data = response.json()
             if data.get('total', 0) == 0:
                 logging.error("No Fulfillment Policy found")
@@ -740,9 +2618,9 @@ class EbayAPI:
         :return:
         """
         logging.info("started")
-        uri = '/sell/account/v1/payment_policy?marketplace_id=EBAY_GB'
+        uri = f'/sell/account/v1/payment_policy?marketplace_id={self.marketplace_id}'
 
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
@@ -750,8 +2628,8 @@ class EbayAPI:
         }
 
         try:
-            response = requests.get(self.base_url + uri, headers=headers)
-            logging.debug(response.json())
+            response = self._request('GET', uri, headers=headers)
+            log_payload('response', response.json)
             data = response.json()
             if data.get('total', 0) == 0:
                 logging.error("No Payment Policy found")
@@ -772,9 +2650,9 @@ class EbayAPI:
         :return:
         """
         logging.info("started")
-        uri = '/sell/account/v1/return_policy?marketplace_id=EBAY_GB'
+        uri = f'/sell/account/v1/return_policy?marketplace_id={self.marketplace_id}'
 
-        token = self.token.get('access_token')
+        token = self.get_access_token()
         headers = {
             'Content-Language': 'en-US',
             'Content-Type': 'application/json',
@@ -782,8 +2660,8 @@ class EbayAPI:
         }
 
         try:
-            response = requests.get(self.base_url + uri, headers=headers)
-            logging.debug(response.json())
+            response = self._request('GET', uri, headers=headers)
+            log_payload('response', response.json)
             data = response.json()
             if data.get('total', 0) == 0:
                 logging.error("No Return Policy found")
@@ -798,26 +2676,153 @@ class EbayAPI:
             # self.create_fulfillment_policy()
             return None
 
+    def bootstrap_policies(self):
+        """
+        Set the inventory location & business policy ids from the policy cache,
+        on a miss they are fetched in parallel & cached
+        :return:
+        """
+        policy_ids = self.policy_cache.get(self.account or '', self.marketplace_id) if self.policy_cache else None
+        if policy_ids:
+            self.set_policy_ids(policy_ids)
+            logging.info(f"Policies loaded from cache: {policy_ids}")
+            return
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [
+                executor.submit(fetch) for fetch in (
+                    self.fetch_inventory_location,
+                    self.fetch_fulfillment_policy,
+                    self.fetch_payment_policy,
+                    self.fetch_return_policy
+                )
+            ]
+            for future in futures:
+                future.result()
+
+        self.cache_policy_ids()
+
+    def get_policy_ids(self):
+        return {field: getattr(self, field) for field in PolicyCache.FIELDS}
+
+    def set_policy_ids(self, policy_ids: dict):
+        for field in PolicyCache.FIELDS:
+            setattr(self, field, policy_ids.get(field))
+
+    def cache_policy_ids(self):
+        # only complete sets are cached, a missing id is looked up again next run
+        policy_ids = self.get_policy_ids()
+        if self.policy_cache and all(policy_ids.values()):
+            self.policy_cache.set(self.account or '', self.marketplace_id, policy_ids)
+
     @staticmethod
-    def _get_condition_enum(condition_id: str):
-        for key, val in Condition_ID_MAPPING.items():
-            if key in condition_id:
-                return val
+    def _parse_use_by_date(value: str):
+        for fmt in ('%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ'):
+            try:
+                return datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+            except (TypeError, ValueError):
+                pass
         return None
 
     def _get_image_full_url(self, image_name_path: str):
         """
-        Upload image & return full url of image
-        :param sku:
+        Upload image & return full url of image, uploads are skipped for images found in the image cache
+        :param image_name_path:
         :return:
         """
+        with self.metrics.time_stage('images'):
+            return self._upload_image_or_get_cached(image_name_path)
+
+    def _get_image_cache_key(self, file_hash: str):
+        """
+        Image cache key of an image: its sha256, with the preprocessing settings when images are preprocessed
+        """
+        if self.preprocess_executor:
+            return f'{file_hash}_{self.image_max_size}_{self.image_quality}'
+        return file_hash
+
+    def _upload_image_or_get_cached(self, image_name_path: str):
+        file_hash = ImageUrlCache.file_hash(image_name_path)
+        cache_key = self._get_image_cache_key(file_hash)
+        if self.image_cache:
+            cached_url = self.image_cache.get(cache_key)
+            if cached_url:
+                logging.debug(f"{image_name_path} found in image cache: {cached_url}")
+                return cached_url
+
+        # an image with the same content uploaded by another worker is waited for instead of uploaded again
+        with self.image_uploads_lock:
+            future = self.image_uploads.get(cache_key)
+            uploading = future is None
+            if uploading:
+                future = self.image_uploads[cache_key] = Future()
+        if not uploading:
+            logging.debug(f"{image_name_path} uploaded by another worker, waiting for it")
+            return future.result()
+
+        full_url = None
+        try:
+            full_url = self._upload_image(image_name_path, file_hash, cache_key)
+            future.set_result(full_url)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if not full_url:
+                # failed uploads are tried again by the next sku with the image
+                with self.image_uploads_lock:
+                    self.image_uploads.pop(cache_key, None)
+        return full_url
+
+    def _upload_image(self, image_name_path: str, file_hash: str, cache_key: str):
+        upload_path = image_name_path
+        if self.preprocess_executor:
+            upload_path = self._preprocess_image(image_name_path, file_hash)
 
         # upload image
-        response = self.upload_image1(image_name_path)
+        response = self.upload_image1(upload_path)
 
         if not response:
             return None
 
+        full_url, use_by_date = self._parse_upload_response(response)
+        if full_url and self.image_cache:
+            self.image_cache.set(cache_key, full_url, use_by_date)
+        return full_url
+
+    def _preprocess_image(self, image_name_path: str, file_hash: str = None):
+        """
+        Downscaled copy of an image, made in the preprocessing process pool & kept on disk by source hash
+        :param image_name_path:
+        :param file_hash: sha256 of the image, computed if not given
+        :return: path of the file to upload, the original if it is smaller or preprocessing failed
+        """
+        try:
+            if not file_hash:
+                file_hash = ImageUrlCache.file_hash(image_name_path)
+            target = os.path.join(
+                self.preprocessed_images_directory,
+                f'{file_hash}_{self.image_max_size}_{self.image_quality}.jpg'
+            )
+            if not os.path.isfile(target):
+                os.makedirs(self.preprocessed_images_directory, exist_ok=True)
+                self.preprocess_executor.submit(
+                    preprocess_image, image_name_path, target, self.image_max_size, self.image_quality
+                ).result()
+            if os.path.getsize(target) < os.path.getsize(image_name_path):
+                logging.debug(f"{image_name_path} preprocessed: {target}")
+                return target
+        except Exception as e:
+            logging.exception(e)
+        return image_name_path
+
+    @classmethod
+    def _parse_upload_response(cls, response: str):
+        """
+        Parse an UploadSiteHostedPictures response
+        :param response: response xml
+        :return: (FullURL, UseByDate), None for missing elements
+        """
         # Parse the XML data
         tree = ET.ElementTree(ET.fromstring(response))
         root = tree.getroot()
@@ -828,72 +2833,184 @@ class EbayAPI:
         # Find the FullURL element
         full_url = root.find('.//ns:FullURL', namespace)
         # Print the FullURL value
-        if full_url is not None:
-            logging.debug(full_url.text)
-            return full_url.text
-        else:
+        if full_url is None:
             logging.error("FullURL element not found.")
-            return None
+            return None, None
+        logging.debug(full_url.text)
+        use_by_date = root.find('.//ns:UseByDate', namespace)
+        return full_url.text, cls._parse_use_by_date(use_by_date.text) if use_by_date is not None else None
 
     @staticmethod
     def list_images_in_directory(directory_path):
-        # List of image file extensions to filter
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
+        return [os.path.join(directory_path, name) for name in ImageIndex.list_images(directory_path)]
 
-        # List all files in the given directory
-        files = [f for f in os.listdir(directory_path) if os.path.isfile(os.path.join(directory_path, f))
-                 and os.path.splitext(f)[1].lower() in image_extensions]
-        files.sort()
+    def index_images(self, skus: list = ()):
+        """
+        Index the photo directory & report the skus without photos
+        :param skus: skus of the run, if known upfront
+        :return:
+        """
+        try:
+            self.image_index = ImageIndex(self.photo_directory, self.image_index_file)
+            self.image_index.scan()
+        except Exception as e:
+            logging.exception(e)
+            self.image_index = None
+            return
+        self.report_missing_photos(skus)
 
-        files = list(map(lambda f: os.path.join(directory_path, f), files))
+    def report_missing_photos(self, skus: list):
+        """
+        Print & log the skus without a photo directory in the image index
+        :param skus:
+        :return:
+        """
+        if not self.image_index:
+            return
+        missing = [str(sku) for sku in skus if sku and not self.image_index.get(str(sku))]
+        if missing:
+            message = f"{len(missing)} skus without photos: {', '.join(missing)}"
+            print(message)
+            logging.warning(message)
 
-        return files
+    def _get_images(self, sku: str):
+        """
+        Image files of sku, from the image index when there is one
+        """
+        # numeric skus are read as numbers, their directories are named by the string
+        sku = str(sku)
+        if self.image_index:
+            return self.image_index.get(sku)
+        return self.list_images_in_directory(os.path.join(self.photo_directory, sku))
 
-    def _generate_images_urls(self, sku: str):
-        images_urls = []
+    def _submit_image_uploads(self, sku: str):
+        """
+        Queue the upload of every image of sku on the image upload pool
+        :param sku:
+        :return: list of futures, in image order
+        """
+        futures = []
         try:
-            images_base_directory = CONFIG[environment]['photo_directory']
-            images_directory = os.path.join(images_base_directory, sku)
-            for image in self.list_images_in_directory(images_directory):
-                try:
-                    image_full_url = self._get_image_full_url(image)
-                    if image_full_url:
-                        images_urls.append(image_full_url)
-                except Exception as e:
-                    logging.exception(e)
+            for image in self._get_images(sku):
+                futures.append(self.image_executor.submit(self._get_image_full_url, image))
         except Exception as e:
             logging.exception(e)
+        return futures
+
+    def _generate_images_urls(self, sku: str, futures: list = None):
+        """
+        Wait for the image uploads of sku & return the urls in image order
+        :param sku:
+        :param futures: futures from _submit_image_uploads, uploads are submitted if not given
+        :return:
+        """
+        if futures is None:
+            futures = self._submit_image_uploads(sku)
+        images_urls = []
+        for future in futures:
+            try:
+                image_full_url = future.result()
+                if image_full_url:
+                    images_urls.append(image_full_url)
+            except Exception as e:
+                logging.exception(e)
         return images_urls
 
-    def _generate_product_aspects_column_list(self):
+    def _generate_product_aspects_column_list(self, df=None):
         logging.debug("generating product.aspects column list")
         try:
             # Get list of column names
-            column_names = self.df.columns.tolist()
+            column_names = (self.df if df is None else df).columns.tolist()
             self.product_aspects_column_list = [c for c in column_names if c.startswith('C:')]
         except Exception as e:
             logging.exception(e)
 
-    def _generate_product_aspects(self, row):
-        aspects = {}
-        for col in self.product_aspects_column_list:
-            key = col[2:]
-            value = row.get(col)
-            if not value or pd.isnull(value):
-                continue
-            if isinstance(value, str):
-                value = value.split('||')
-                aspects[key] = value
-            else:
-                try:
-                    value = int(value)
-                except:
-                    pass
-                aspects[key] = [value]
+    @staticmethod
+    def _to_int(column):
+        """
+        Numeric values of a column truncated to int, None for empty, zero & non numeric cells
+        """
+        import pandas as pd
+        import numpy as np
+        numbers = pd.to_numeric(column, errors='coerce')
+        numbers = numbers.where(numbers != 0)
+        return np.trunc(numbers).astype('Int64').astype(object)
+
+    @staticmethod
+    def _to_text(column):
+        """
+        Values of a column as text, whole numbers without decimals, None for empty cells
+        """
+        import pandas as pd
+        import numpy as np
+        numbers = pd.to_numeric(column, errors='coerce')
+        whole_numbers = numbers.notna() & (numbers == np.trunc(numbers))
+        text = column.where(~whole_numbers, np.trunc(numbers).astype('Int64').astype(str))
+        text = text.where(column.isna(), text.astype(str))
+        return text.where(column.notna() & (column != ''))
+
+    @staticmethod
+    def _prepare_aspect_column(column):
+        """
+        Aspect values of a column: text split on ||, numbers as [int], None for empty cells
+        """
+        import pandas as pd
+        import numpy as np
+        try:
+            text = column.str.split('||', regex=False)
+        except AttributeError:
+            # column without any text
+            text = pd.Series(np.nan, index=column.index, dtype=object)
+        text = text.where(column != '')
+        numbers = EbayAPI._to_int(column.where(text.isna() & (column != '')))
+        aspects = text.where(text.notna(), numbers.map(lambda v: [v], na_action='ignore'))
+        return aspects.where(aspects.notna(), None).tolist()
+
+    def _prepare_rows(self, df):
+        """
+        Map & coerce the columns used by the payloads once per column
+        :param df:
+        :return: list of row dicts with the prepared values in the _condition, _quantity, _categoryId,
+                 _format, _vatPercentage, _mpn & _aspects keys
+        """
+        import pandas as pd
+        import numpy as np
+        df = df.astype(object).where(df.notna(), None)
+        empty = pd.Series(None, index=df.index, dtype=object)
+
+        def column(key):
+            name = EXCEL_COL_MAPPING[key]
+            return df[name] if name in df.columns else empty
+
+        prepared = pd.DataFrame(index=df.index)
+        prepared['_condition'] = column('condition').astype(str).str.extract(
+            '(' + '|'.join(Condition_ID_MAPPING) + ')', expand=False
+        ).map(Condition_ID_MAPPING)
+        prepared['_quantity'] = self._to_int(column('availableQuantity'))
+        prepared['_categoryId'] = self._to_text(column('categoryId'))
+        listing_format = column('format')
+        fixed_price = listing_format.isna() | (listing_format == '') | \
+            listing_format.astype(str).str.lower().str.contains('fixed', regex=False)
+        prepared['_format'] = np.where(fixed_price, 'FIXED_PRICE', 'AUCTION')
+        prepared['_vatPercentage'] = self._to_int(column('tax.vatPercentage'))
+        mpn = self._to_text(column('product.mpn'))
+        prepared['_mpn'] = mpn.where(mpn.str.lower() != 'does not apply')
+        prepared = prepared.astype(object).where(prepared.notna(), None)
+
+        aspect_columns = {
+            col[2:]: self._prepare_aspect_column(df[col]) for col in self.product_aspects_column_list
+        }
+        prepared['_aspects'] = [
+            {key: value for key, value in zip(aspect_columns, values) if value is not None}
+            for values in zip(*aspect_columns.values())
+        ] if aspect_columns else [{} for _ in range(len(df))]
 
-        return aspects
+        # aspect columns are only needed in _aspects from now on, unless a payload field reads them too
+        mapped_columns = set(EXCEL_COL_MAPPING.values())
+        df = df.drop(columns=[col for col in self.product_aspects_column_list if col not in mapped_columns])
+        return df.join(prepared).to_dict('records')
 
-    def _generate_inventory_payload(self, row):
+    def _generate_inventory_payload(self, row, image_futures: list = None, image_urls: list = None):
         sku = row.get(EXCEL_COL_MAPPING['sku'])
         if not sku:
             return None
@@ -903,7 +3020,7 @@ class EbayAPI:
             'conditionDescription': row.get(EXCEL_COL_MAPPING['conditionDescription']),
         }
 
-        condition_enum = self._get_condition_enum(row.get(EXCEL_COL_MAPPING['condition']))
+        condition_enum = row.get('_condition')
         if condition_enum:
             payload['condition'] = condition_enum
 
@@ -912,28 +3029,25 @@ class EbayAPI:
         if title:
             product['title'] = title
         epid = row.get(EXCEL_COL_MAPPING['product.epid'])
-        if epid and not pd.isnull(epid):
+        if epid:
             product['epid'] = epid
 
-        mpn = row.get(EXCEL_COL_MAPPING['product.mpn'])
-        if mpn and mpn.lower() != 'does not apply' and not pd.isnull(mpn):
+        mpn = row.get('_mpn')
+        if mpn:
             product['mpn'] = mpn
 
-        image_urls = self._generate_images_urls(sku)
+        if image_urls is None:
+            image_urls = self._generate_images_urls(sku, image_futures)
         if image_urls:
             product['imageUrls'] = image_urls
-        product['aspects'] = self._generate_product_aspects(row)
+        product['aspects'] = row.get('_aspects', {})
         product['description'] = row.get(EXCEL_COL_MAPPING['conditionDescription'])
         product['brand'] = row.get(EXCEL_COL_MAPPING['product.brand'])
         payload['product'] = product
 
-        quantity = row.get(EXCEL_COL_MAPPING['availableQuantity'])
+        quantity = row.get('_quantity')
         if quantity:
-            try:
-                quantity = int(quantity)
-                payload['availableQuantity'] = quantity
-            except:
-                pass
+            payload['availableQuantity'] = quantity
         else:
             quantity = 1
 
@@ -944,7 +3058,7 @@ class EbayAPI:
         }
         payload['availability'] = availability
 
-        logging.debug(pformat(payload))
+        log_payload('payload', payload)
         return payload
 
     def _generate_offer_payload(self, row):
@@ -957,34 +3071,19 @@ class EbayAPI:
         formatted_datetime = future_datetime_utc.strftime('%Y-%m-%dT%H:%M:%SZ')
         payload = {
             'sku': sku,
-            'marketplaceId': 'EBAY_GB',
+            'marketplaceId': self.marketplace_id,
             'listingStartDate': formatted_datetime,
             'merchantLocationKey': self.merchant_location_key
         }
-        quantity = row.get(EXCEL_COL_MAPPING['availableQuantity'])
+        quantity = row.get('_quantity')
         if quantity:
-            try:
-                quantity = int(quantity)
-                payload['availableQuantity'] = quantity
-            except:
-                pass
+            payload['availableQuantity'] = quantity
 
-        categoryId = row.get(EXCEL_COL_MAPPING['categoryId'])
+        categoryId = row.get('_categoryId')
         if categoryId:
-            try:
-                categoryId = str(int(categoryId))
-            except:
-                pass
             payload['categoryId'] = categoryId
 
-        format = row.get(EXCEL_COL_MAPPING['format'])
-        if format:
-            if 'fixed' in format.lower():
-                payload['format'] = 'FIXED_PRICE'
-            else:
-                payload['format'] = 'AUCTION'
-        else:
-            payload['format'] = 'FIXED_PRICE'
+        payload['format'] = row.get('_format')
 
         listingDuration = row.get(EXCEL_COL_MAPPING['listingDuration'])
         if listingDuration:
@@ -1007,7 +3106,7 @@ class EbayAPI:
             try:
                 payload['pricingSummary'] = {
                     'price': {
-                        'currency': 'GBP',
+                        'currency': self.currency,
                         'value': str(price)
                     }
                 }
@@ -1134,79 +3233,849 @@ class EbayAPI:
         if storeCategoryNames:
             payload['storeCategoryNames'] = [storeCategoryNames]'''
 
-        vatPercentage = row.get(EXCEL_COL_MAPPING['tax.vatPercentage'])
+        vatPercentage = row.get('_vatPercentage')
         if vatPercentage:
-            try:
-                vatPercentage = int(vatPercentage)
-                payload['tax'] = {
-                    'vatPercentage': vatPercentage,
-                    'applyTax': True
-                }
-            except:
-                pass
+            payload['tax'] = {
+                'vatPercentage': vatPercentage,
+                'applyTax': True
+            }
 
-        logging.debug(pformat(payload))
+        log_payload('payload', payload)
         return payload
 
-    def list_items(self):
-        logging.info("Started")
-
-        self._generate_product_aspects_column_list()
-        self.fetch_inventory_location()
-        self.fetch_fulfillment_policy()
-        self.fetch_payment_policy()
-        self.fetch_return_policy()
+    @staticmethod
+    def _get_fingerprints(inventory_payload: dict, offer_payload: dict):
+        """
+        Fingerprints of the payloads of a sku
+        :param inventory_payload:
+        :param offer_payload:
+        :return: (hash of everything but price & quantity, hash of price & quantity)
+        """
+        content = {
+            'inventory': {
+                key: val for key, val in inventory_payload.items()
+                if key not in ('availability', 'availableQuantity')
+            },
+            'offer': {
+                key: val for key, val in offer_payload.items()
+                if key not in ('listingStartDate', 'pricingSummary', 'availableQuantity')
+            },
+        }
+        price_quantity = {
+            'availability': inventory_payload.get('availability'),
+            'availableQuantity': offer_payload.get('availableQuantity'),
+            'pricingSummary': offer_payload.get('pricingSummary'),
+        }
+        return FingerprintStore.fingerprint(content), FingerprintStore.fingerprint(price_quantity)
 
-        inventory_items = []
-        offer_payloads = []
+    @staticmethod
+    def _generate_price_quantity_payload(inventory_payload: dict, offer_payload: dict, offer_id: str):
+        quantity = inventory_payload['availability']['shipToLocationAvailability']['quantity']
+        offer = {
+            'offerId': offer_id,
+            'availableQuantity': quantity,
+        }
+        if offer_payload.get('pricingSummary'):
+            offer['price'] = offer_payload['pricingSummary']['price']
+        return {
+            'sku': inventory_payload['sku'],
+            'shipToLocationAvailability': {
+                'quantity': quantity
+            },
+            'offers': [offer],
+        }
 
-        # iterate over dataframe
-        for index, row in self.df.iterrows():
+    def _start_batch(self, rows: list):
+        """
+        Validate the rows, look up the journal & queue the image uploads of a batch of rows
+        :param rows:
+        :return: batch for _build_batch
+        """
+        # invalid rows are dropped here, before their images are uploaded
+        rows = self._reject_invalid_rows(rows)
+        records = {}
+        for row in rows:
+            sku = row.get(EXCEL_COL_MAPPING['sku'])
+            if sku and sku not in records:
+                records[sku] = self.journal.get(sku) if self.resume else None
+        if self.listing_index is not None:
+            # offers of streamed skus, skus read upfront are indexed already
+            self.index_offers(list(records))
+
+        # queue the images of every sku in the batch before building any payload,
+        # so the uploads of all skus run in parallel on the image upload pool
+        image_futures = {}
+        for sku, record in records.items():
+            if not ProgressJournal.reached(record, 'images'):
+                image_futures[sku] = self._submit_image_uploads(sku)
+
+        return {'rows': rows, 'skus': list(records), 'records': records, 'image_futures': image_futures}
+
+    def _build_batch(self, batch: dict):
+        """
+        Build the payloads of a batch, waiting for its image uploads,
+        stages already finished according to the journal are skipped when resuming
+        :param batch: from _start_batch
+        :return: plan for _send_batch
+        """
+        with self.metrics.time_stage('build', len(batch['rows'])):
+            return self._build_plan(batch)
+
+    def _build_plan(self, batch: dict):
+        records = batch['records']
+        image_futures = batch['image_futures']
+        plan = {
+            'skus': batch['skus'],
+            'inventory_items': [],
+            'offer_payloads': [],
+            'sku_offer_id_dict': {},
+            # diff & reconcile modes: skus with only price / quantity changes &
+            # skus with an existing offer to update: sku -> (offerId, payload, published)
+            'price_quantity_items': [],
+            'offer_updates': {},
+            # listing ids of the skus already published, for the publish report
+            'listing_ids': {},
+            # fingerprints to store once the sku is pushed
+            'sku_fingerprints': {},
+        }
+        for row in batch['rows']:
             try:
-                # print(row)
-                payload = self._generate_inventory_payload(row)
-                # payload = None
-                if payload:
-                    inventory_items.append(payload)
+                sku = row.get(EXCEL_COL_MAPPING['sku'])
+                record = records.get(sku)
+                if ProgressJournal.reached(record, 'published'):
+                    logging.info(f"sku: {sku} already published, skipping")
+                    continue
+
+                payload = None
+                if not ProgressJournal.reached(record, 'inventory'):
+                    image_urls = record['image_urls'] if ProgressJournal.reached(record, 'images') else None
+                    payload = self._generate_inventory_payload(row, image_futures.get(sku), image_urls)
+
+                if ProgressJournal.reached(record, 'offer') and record['offer_id']:
+                    if payload:
+                        self._plan_inventory_item(plan, sku, payload)
+                    plan['sku_offer_id_dict'][sku] = record['offer_id']
+                    continue
                 offer_payload = self._generate_offer_payload(row)
+
+                if payload and offer_payload:
+                    content_hash, price_quantity_hash = self._get_fingerprints(payload, offer_payload)
+                    plan['sku_fingerprints'][sku] = (content_hash, price_quantity_hash)
+                    fingerprint = self.fingerprints.get(sku) if self.diff or self.listing_index is not None else None
+                    listing = None
+                    if self.listing_index is not None:
+                        # the offer on eBay decides, the fingerprint only tells if the content changed
+                        listing = self.listing_index.get(str(sku))
+                        offer_id = listing['offer_id'] if listing else None
+                        published = bool(listing) and listing['status'] == 'PUBLISHED'
+                        price_quantity_changed = bool(listing) and \
+                            not self._is_price_quantity_current(listing, payload, offer_payload)
+                    else:
+                        offer_id = fingerprint['offer_id'] if fingerprint else None
+                        published = True
+                        price_quantity_changed = bool(fingerprint) and \
+                            fingerprint['price_quantity_hash'] != price_quantity_hash
+                    if offer_id:
+                        if fingerprint:
+                            content_current = fingerprint['content_hash'] == content_hash
+                        else:
+                            # no fingerprint of the sku here: the offer on eBay tells if the content changed
+                            content_current = bool(listing) and \
+                                self._is_content_current(listing, payload, offer_payload)
+                        if listing:
+                            listing_id = listing['listing_id']
+                        else:
+                            # the journal is only read upfront when resuming
+                            listing_id = (record or self.journal.get(sku) or {}).get('listing_id')
+                        plan['listing_ids'][sku] = listing_id
+                        if published and content_current:
+                            if price_quantity_changed:
+                                plan['price_quantity_items'].append(
+                                    self._generate_price_quantity_payload(payload, offer_payload, offer_id)
+                                )
+                                continue
+                            logging.debug(f"sku: {sku} unchanged, skipping")
+                            if not fingerprint:
+                                self.fingerprints.set(sku, content_hash, price_quantity_hash, offer_id)
+                            self.journal.set_stage(sku, 'published', offer_id=offer_id, listing_id=listing_id)
+                            self.publish_results[sku] = {
+                                'offerId': offer_id, 'listingId': listing_id, 'status': 'unchanged', 'errors': []
+                            }
+                            continue
+                        self._plan_inventory_item(plan, sku, payload)
+                        plan['offer_updates'][sku] = (offer_id, offer_payload, published)
+                        continue
+
+                if payload:
+                    self._plan_inventory_item(plan, sku, payload)
                 if offer_payload:
-                    offer_payloads.append(offer_payload)
-                # for each 20 items, send a listing request
-                if (index+1) % 20 == 0:
-                    self.bulk_create_or_replace_inventory_item(inventory_items)
-                    # empty the inventory_items
-                    inventory_items.clear()
-                    time.sleep(2)
-
-                    self.create_offers(offer_payloads)
-                    offer_payloads.clear()
-
-                    time.sleep(2)
-                    self.publish_offers()
-
-                # 2-minute pause after every 145 listings
-                if (index+1) % 145 == 0:
-                    print("Sleeping for 2 min...")
-                    logging.info("Sleeping for 2 min...")
-                    time.sleep(120)
+                    plan['offer_payloads'].append(offer_payload)
+            except Exception as ex:
+                logging.exception(ex)
+        return plan
+
+    def _plan_inventory_item(self, plan: dict, sku: str, payload: dict):
+        """
+        Add the inventory item of sku to the plan & journal its image urls, so a resumed run doesn't upload them again.
+        Skus that are skipped keep their stage.
+        """
+        self.journal.set_stage(sku, 'images', image_urls=payload['product'].get('imageUrls', []))
+        plan['inventory_items'].append(payload)
+
+    def _send_batch(self, plan: dict):
+        """
+        Create inventory items, offers & publish them for a batch
+        :param plan: from _build_batch
+        :return:
+        """
+        sku_fingerprints = plan['sku_fingerprints']
+        sku_offer_id_dict = dict(plan['sku_offer_id_dict'])
+        if plan['inventory_items']:
+            with self.metrics.time_stage('inventory', len(plan['inventory_items'])):
+                inventory_results = self.bulk_create_or_replace_inventory_item(plan['inventory_items'])
+            for sku, created in inventory_results.items():
+                if created:
+                    self.journal.set_stage(sku, 'inventory')
+        with self.metrics.time_stage('offer', len(plan['price_quantity_items']) + len(plan['offer_updates']) +
+                                     len(plan['offer_payloads'])):
+            sku_offer_id_dict.update(self._send_offers(plan))
+        if sku_offer_id_dict:
+            with self.metrics.time_stage('publish', len(sku_offer_id_dict)):
+                publish_results = self.publish_offers(sku_offer_id_dict)
+            for sku, result in publish_results.items():
+                if result.get('listingId'):
+                    self.journal.set_stage(sku, 'published', listing_id=result['listingId'])
+                    if sku in sku_fingerprints:
+                        self.fingerprints.set(sku, *sku_fingerprints[sku], result['offerId'])
+
+    def _send_offers(self, plan: dict):
+        """
+        Update prices & quantities, update changed offers & create the new offers of a batch
+        :param plan: from _build_batch
+        :return: dict of sku & offerId of the offers to publish: created & updated unpublished offers
+        """
+        sku_fingerprints = plan['sku_fingerprints']
+        sku_offer_id_dict = {}
+        if plan['price_quantity_items']:
+            offer_ids = {item['sku']: item['offers'][0]['offerId'] for item in plan['price_quantity_items']}
+            for sku, updated in self.bulk_update_price_quantity(plan['price_quantity_items']).items():
+                if updated:
+                    self.fingerprints.set(sku, *sku_fingerprints[sku], offer_ids[sku])
+                    self.journal.set_stage(sku, 'published', offer_id=offer_ids[sku],
+                                           listing_id=plan['listing_ids'].get(sku))
+                self.publish_results[sku] = {
+                    'offerId': offer_ids[sku],
+                    'listingId': plan['listing_ids'].get(sku),
+                    'status': 'price_quantity_updated' if updated else 'failed',
+                    'errors': [] if updated else [{'message': 'Price & quantity not updated'}]
+                }
+        for sku, (offer_id, offer_payload, published) in plan['offer_updates'].items():
+            updated = self.update_offer(offer_id, offer_payload)
+            if published or not updated:
+                self.publish_results[sku] = {
+                    'offerId': offer_id,
+                    'listingId': plan['listing_ids'].get(sku) if published else None,
+                    'status': 'updated' if updated else 'failed',
+                    'errors': [] if updated else [{'message': 'Offer not updated'}]
+                }
+            if not updated:
+                continue
+            if published:
+                self.journal.set_stage(sku, 'published', offer_id=offer_id)
+                self.fingerprints.set(sku, *sku_fingerprints[sku], offer_id)
+            else:
+                self.journal.set_stage(sku, 'offer', offer_id=offer_id)
+                sku_offer_id_dict[sku] = offer_id
+        if plan['offer_payloads']:
+            for sku, offer_id in self.bulk_create_offer(plan['offer_payloads']).items():
+                sku_offer_id_dict[sku] = offer_id
+                if offer_id:
+                    self.journal.set_stage(sku, 'offer', offer_id=offer_id)
+        return sku_offer_id_dict
+
+    def _list_batch(self, rows: list):
+        """
+        Upload images, create inventory items, offers & publish them for a batch of rows
+        :param rows:
+        :return:
+        """
+        self._send_batch(self._build_batch(self._start_batch(rows)))
+
+    def _iter_batches(self, chunks, batch_size: int = 20):
+        batch = []
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            df = next(chunks, None)
+            if df is None:
+                break
+            if not self.product_aspects_column_list:
+                self._generate_product_aspects_column_list(df)
+            rows = self._prepare_rows(df)
+            self.metrics.add_stage_time('read', time.perf_counter() - start, len(rows))
+            # iterate over the prepared rows
+            for row in rows:
+                batch.append(row)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+        # rows left
+        if batch:
+            yield batch
+
+    def list_items(self, chunks=None):
+        """
+        List the rows of the sheet in batches of 20.
+        Batches run through a pipeline, so while a batch is sent to eBay the next ones are read,
+        their images uploaded & their payloads built.
+        :param chunks: iterable of dataframes, e.g. from iter_sheet, defaults to self.df
+        :return:
+        """
+        logging.info("Started")
+        if chunks is None:
+            chunks = [self.df]
+
+        self.bootstrap_policies()
+        self.load_item_aspects()
+        # skus without photos are reported before the run when the rows are read upfront,
+        # after it for streamed rows
+        skus = []
+        streamed_skus = None
+        if isinstance(chunks, list):
+            sku_column = EXCEL_COL_MAPPING['sku']
+            skus = [sku for df in chunks if sku_column in df.columns for sku in df[sku_column].dropna()]
+        else:
+            streamed_skus = []
+        self.index_images(skus)
+        if self.reconcile:
+            self.reconcile_inventory(skus)
+
+        pipeline = Pipeline(
+            [(self._build_batch, self.build_workers), (self._send_batch, self.send_workers)],
+            queue_size=self.pipeline_queue_size,
+            on_error=lambda batch, ex: self._fail_batch(batch['skus'], ex)
+        )
+        pipeline.run(self._start_batches(chunks, streamed_skus))
+        if streamed_skus:
+            self.report_missing_photos(streamed_skus)
+
+    def _start_batches(self, chunks, skus: list = None):
+        """
+        Batches of the chunks started by _start_batch, a batch that fails to start is recorded as failed
+        :param chunks:
+        :param skus: list the skus of the rows are added to
+        """
+        batches = self._iter_batches(chunks)
+        while True:
+            try:
+                rows = next(batches, None)
             except Exception as ex:
+                # the batches read so far are still listed & the report written
                 logging.exception(ex)
+                self.run_errors.append(f'Sheet read failed: {ex!r}')
+                return
+            if rows is None:
+                return
+            if skus is not None:
+                skus.extend(row.get(EXCEL_COL_MAPPING['sku']) for row in rows)
+            try:
+                yield self._start_batch(rows)
+            except Exception as ex:
+                logging.exception(ex)
+                sku_column = EXCEL_COL_MAPPING['sku']
+                self._fail_batch([row.get(sku_column) for row in rows if row.get(sku_column)], ex)
+
+    def _fail_batch(self, skus: list, exception: Exception):
+        """
+        Record the skus of a batch that raised as failed in the publish results,
+        skus with a result of their own, e.g. published before the error, keep it.
+        The journal keeps the stages they finished, so --resume picks them up.
+        :param skus:
+        :param exception:
+        :return:
+        """
+        logging.error(f"Batch of {len(skus)} skus failed: {exception!r}")
+        for sku in skus:
+            self.publish_results.setdefault(sku, {
+                'offerId': None,
+                'listingId': None,
+                'errors': [{'message': f'Batch failed: {exception!r}'}]
+            })
+
+    def run(self, chunks=None, resume: bool = False, diff: bool = False, reconcile: bool = False,
+            restart: bool = False):
+        """
+        List the rows & write the publish report
+        :param chunks: iterable of dataframes, defaults to self.df
+        :param resume: skip the stages the journal records as finished
+        :param diff: only push skus changed since they were last published
+        :param reconcile: index the inventory items & offers on eBay first, existing offers are updated
+                          instead of created & published skus with unchanged content, price & quantity are skipped
+        :param restart: clear the journal first, so a later resume does not skip what earlier runs finished
+        :return:
+        """
+        self.resume = resume
+        self.diff = diff
+        self.reconcile = reconcile
+        self.listing_index = None
+        if restart:
+            self.journal.reset()
+        self.metrics = Metrics()
+        metrics_server = None
+        stop_snapshots = None
+        try:
+            if self.metrics_port:
+                metrics_server = self.metrics.start_http_server(self.metrics_port)
+            if self.metrics_snapshot_file:
+                stop_snapshots = self.metrics.start_snapshots(self.metrics_snapshot_file,
+                                                              self.metrics_snapshot_interval)
+        except OSError as e:
+            logging.exception(e)
+
+        try:
+            self.list_items(chunks)
+        finally:
+            summary = self.metrics.summary()
+            print(summary)
+            logging.info(summary)
+            if stop_snapshots:
+                stop_snapshots.set()
+                self.metrics.save_snapshot(self.metrics_snapshot_file)
+            if metrics_server:
+                metrics_server.shutdown()
+                metrics_server.server_close()
+
+        self.save_publish_report(self.get_report_filename())
+
+    def get_report_filename(self):
+        return os.path.splitext(os.path.basename(__file__))[0] + '_report' + \
+            (f'_{self.account}_' if self.account else '') + datetime.now().strftime("%y%m%d%H%M%S") + '.csv'
+
+    def workflow(self, excel_file, resume: bool = False, diff: bool = False, stream: bool = False,
+                 chunk_size: int = 100, reconcile: bool = False, restart: bool = False):
+        chunks = None
+        if stream or os.path.splitext(excel_file)[1].lower() in ('.csv', '.parquet'):
+            chunks = self.iter_sheet(excel_file, chunk_size=chunk_size)
+        else:
+            self.read_excel(excel_file)
+        self.run(chunks, resume=resume, diff=diff, reconcile=reconcile, restart=restart)
+
+    def close(self):
+        self.image_executor.shutdown()
+        if self.preprocess_executor:
+            self.preprocess_executor.shutdown()
+        self.session.close()
+        for store in (self.image_cache, self.journal, self.fingerprints, self.policy_cache, self.aspect_store):
+            if store:
+                store.close()
+
+
+class AsyncEbayAPI:
+    """
+    asyncio counterpart of the EbayAPI network calls, on aiohttp.
+    Uses the credentials, token, rate limiters, caches & payload builders of an EbayAPI instance.
+
+        async with AsyncEbayAPI(ebay, concurrency=50) as api:
+            await api.fetch_policies()
+            await api.list_items(rows)
+    """
+
+    def __init__(self, ebay: EbayAPI, concurrency: int = 20):
+        try:
+            # optional, only needed for AsyncEbayAPI
+            import aiohttp  # noqa: F401
+        except ImportError:
+            raise ImportError("aiohttp is required for AsyncEbayAPI: pip install aiohttp")
+        self.ebay = ebay
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = None
+        # image cache key -> task of its upload
+        self.uploads = {}
+
+    async def __aenter__(self):
+        import aiohttp
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.ebay.http_timeout)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def _get_headers(self):
+        # a token refresh blocks on requests & the token file lock, kept off the event loop
+        token = await asyncio.to_thread(self.ebay.get_access_token)
+        return {
+            'Content-Language': 'en-US',
+            'Content-Type': 'application/json',
+            'Authorization': f'IAF {token}'
+        }
+
+    async def _request(self, method: str, uri: str, body_factory=None, min_retries: int = 0, **kwargs):
+        """
+        Send a request with the same rate limiting & retries as EbayAPI._request
+        :param method:
+        :param uri: path relative to base_url
+        :param body_factory: callable returning a fresh request body for each attempt
+        :param min_retries: retries made even when the retry budget is spent
+        :param kwargs: passed to aiohttp.ClientSession.request
+        :return: (status, body text)
+        """
+        import aiohttp
+
+        family = self.ebay._get_api_family(uri)
+        rate_limiter = self.ebay.rate_limiters[family]
+        self.ebay.retry_budgets[family].deposit()
+        attempt = 0
+        reauthorized = False
+        while True:
+            if body_factory:
+                kwargs['data'] = body_factory()
+            # the size of a streamed body can only be taken before it is sent
+            body_size = self._encode_body(kwargs)
+            await rate_limiter.acquire_async()
+            metrics = self.ebay.metrics
+            try:
+                async with self.semaphore:
+                    # latency of the call, without the wait for a slot
+                    start = time.perf_counter()
+                    async with self.session.request(method, self.ebay.base_url + uri, **kwargs) as response:
+                        status = response.status
+                        text = await response.text()
+                        metrics.observe_call(method, uri, status, time.perf_counter() - start,
+                                             body_size, len(text))
+                        rate_limiter.update(_AsyncResponse(status, response.headers))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.observe_call(method, uri, 'error', time.perf_counter() - start)
+                if not self.ebay._can_retry(attempt, family, min_retries):
+                    raise
+                logging.warning(f"{method} {uri} failed: {e}, retry {attempt + 1}")
+            else:
+                if status == 401 and not reauthorized and 'headers' in kwargs:
+                    reauthorized = True
+                    if await asyncio.to_thread(self.ebay._refresh_authorization, kwargs['headers']):
+                        logging.warning(f"{method} {uri} returned 401, retrying with a refreshed token")
+                        continue
+                if status not in RETRY_STATUS_CODES or not self.ebay._can_retry(attempt, family, min_retries):
+                    return status, text
+                logging.warning(f"{method} {uri} returned {status}, retry {attempt + 1}")
+            metrics.count_retry(method, uri)
+            await asyncio.sleep(self.ebay._get_backoff(attempt))
+            attempt += 1
+
+    @staticmethod
+    def _encode_body(kwargs: dict):
+        """
+        Replace the json, form or FormData body in kwargs by the aiohttp payload it is sent as
+        :param kwargs: request kwargs, changed in place
+        :return: size of the body in bytes, 0 if unknown
+        """
+        import aiohttp
+
+        if 'json' in kwargs:
+            kwargs['data'] = aiohttp.JsonPayload(kwargs.pop('json'))
+        data = kwargs.get('data')
+        if isinstance(data, dict):
+            data = aiohttp.FormData(data)
+        if isinstance(data, aiohttp.FormData):
+            data = data()
+        if data is None:
+            return 0
+        kwargs['data'] = data
+        if isinstance(data, (bytes, str)):
+            return len(data)
+        return data.size or 0
+
+    async def _request_json(self, method: str, uri: str, **kwargs):
+        status, text = await self._request(method, uri, **kwargs)
+        return status, json.loads(text) if text else {}
+
+    async def _bulk_request(self, uri: str, items: list, key: str):
+        """
+        Async EbayAPI._bulk_request
+        """
+        family = self.ebay._get_api_family(uri)
+        responses = {}
+        errors = []
+        attempt = 0
+        while True:
+            headers = await self._get_headers()
+            status, data = await self._request_json('POST', uri, headers=headers, json={'requests': items},
+                                                    min_retries=BULK_MIN_RETRIES)
+            log_payload('response', data)
+            errors = data.get('errors', [])
+
+            failed = set()
+            for item in data.get('responses', []):
+                responses[item.get(key)] = item
+                if item.get('statusCode') in RETRY_STATUS_CODES:
+                    failed.add(item.get(key))
+
+            items = [item for item in items if item.get(key) in failed]
+            if not items or not self.ebay._can_retry(attempt, family, BULK_MIN_RETRIES):
+                break
+            logging.warning(f"{len(items)} items failed, retry {attempt + 1}: {sorted(failed)}")
+            self.ebay.metrics.count_retry('POST', uri, len(items))
+            await asyncio.sleep(self.ebay._get_backoff(attempt))
+            attempt += 1
+
+        return {'responses': list(responses.values()), 'errors': errors}
+
+    async def fetch_access_token(self, body: dict = None):
+        """
+        https://developer.ebay.com/api-docs/static/oauth-auth-code-grant-request.html
+        :param body: defaults to a client credentials grant
+        :return: True if a user token was fetched
+        """
+        import aiohttp
+
+        payload = body or {
+            'scope': ' '.join(SCOPE),
+            'grant_type': 'client_credentials'
+        }
+        status, data = await self._request_json(
+            'POST',
+            '/identity/v1/oauth2/token',
+            headers={'Content-Type': 'application/x-www-form-urlencoded'},
+            auth=aiohttp.BasicAuth(self.ebay.client_id, self.ebay.client_secret),
+            data=payload
+        )
+        if status != 200:
+            logging.error(data)
+            return False
+        if payload.get('grant_type') == 'client_credentials':
+            self.ebay.token_client_credentials = self.ebay._set_expires_at(data)
+            return False
+        self.ebay.token = {**(self.ebay.token or {}), **self.ebay._set_expires_at(data)}
+        return True
+
+    async def refresh_token(self, expired_token: str = None):
+        """
+        https://developer.ebay.com/api-docs/static/oauth-refresh-token-request.html
+        Runs EbayAPI.refresh_token in a thread, so refreshes share its thread & file locks
+        :param expired_token:
+        :return:
+        """
+        await asyncio.to_thread(self.ebay.refresh_token, expired_token)
+
+    async def _fetch_first(self, uri: str, list_key: str, id_key: str):
+        status, data = await self._request_json('GET', uri, headers=await self._get_headers())
+        log_payload('response', data)
+        items = data.get(list_key) or [{}]
+        return items[0].get(id_key)
+
+    async def fetch_policies(self):
+        """
+        Fetch the inventory location & business policies concurrently, unless they are in the policy cache
+        :return:
+        """
+        cache = self.ebay.policy_cache
+        policy_ids = None
+        if cache:
+            policy_ids = await asyncio.to_thread(cache.get, self.ebay.account or '', self.ebay.marketplace_id)
+        if policy_ids:
+            self.ebay.set_policy_ids(policy_ids)
+            logging.info(f"Policies loaded from cache: {policy_ids}")
+            return
+
+        location, fulfillment, payment, return_ = await asyncio.gather(
+            self._fetch_first('/sell/inventory/v1/location', 'locations', 'merchantLocationKey'),
+            self._fetch_first(f'/sell/account/v1/fulfillment_policy?marketplace_id={self.ebay.marketplace_id}',
+                              'fulfillmentPolicies', 'fulfillmentPolicyId'),
+            self._fetch_first(f'/sell/account/v1/payment_policy?marketplace_id={self.ebay.marketplace_id}',
+                              'paymentPolicies', 'paymentPolicyId'),
+            self._fetch_first(f'/sell/account/v1/return_policy?marketplace_id={self.ebay.marketplace_id}',
+                              'returnPolicies', 'returnPolicyId'),
+        )
+        self.ebay.merchant_location_key = location
+        self.ebay.fulfillment_policy = fulfillment
+        self.ebay.payment_policy = payment
+        self.ebay.return_policy = return_
+        # location & fulfillment policy are created when missing, like the sync fetchers do
+        if not location:
+            await asyncio.to_thread(self.ebay.create_inventory_location)
+        if not fulfillment:
+            await asyncio.to_thread(self.ebay.create_fulfillment_policy)
+        await asyncio.to_thread(self.ebay.cache_policy_ids)
+        logging.info(f"Location: {location}, policies: {fulfillment}, {payment}, {return_}")
+
+    async def upload_image(self, filename: str):
+        """
+        https://developer.ebay.com/devzone/xml/docs/reference/ebay/uploadsitehostedpictures.html
+        Uploads are skipped for images found in the image cache, identical images are uploaded once
+        :param filename:
+        :return: FullURL of the image
+        """
+        image_cache = self.ebay.image_cache
+        file_hash = await asyncio.to_thread(ImageUrlCache.file_hash, filename)
+        cache_key = self.ebay._get_image_cache_key(file_hash)
+        if image_cache:
+            # sqlite, like the other blocking calls run in a thread
+            cached_url = await asyncio.to_thread(image_cache.get, cache_key)
+            if cached_url:
+                return cached_url
+
+        upload = self.uploads.get(cache_key)
+        if upload is None:
+            upload = asyncio.ensure_future(self._upload_image(filename, file_hash, cache_key))
+            self.uploads[cache_key] = upload
+        full_url = await upload
+        if not full_url:
+            # failed uploads are tried again by the next sku with the image
+            self.uploads.pop(cache_key, None)
+        return full_url
+
+    async def _upload_image(self, filename: str, file_hash: str, cache_key: str):
+        import aiohttp
+
+        image_cache = self.ebay.image_cache
+        upload_path = filename
+        if self.ebay.preprocess_executor:
+            upload_path = await asyncio.to_thread(self.ebay._preprocess_image, filename, file_hash)
+
+        logging.info(f"uploading {upload_path}")
+        headers = self.ebay._get_upload_headers()
+        headers.pop('Content-Type')
+        request_xml = await asyncio.to_thread(self.ebay._get_xml_request)
+        files = []
+
+        def body_factory():
+            # a file handle per attempt, aiohttp streams it in chunks
+            f = open(upload_path, 'rb')
+            files.append(f)
+            form = aiohttp.FormData()
+            form.add_field('request', request_xml)
+            form.add_field('file', f, filename=os.path.basename(filename))
+            return form
+
+        try:
+            status, text = await self._request('POST', '/ws/api.dll', headers=headers, body_factory=body_factory)
+            full_url, use_by_date = self.ebay._parse_upload_response(text)
+        except Exception as ex:
+            logging.exception(ex)
+            return None
+        finally:
+            for f in files:
+                f.close()
+        if full_url and image_cache:
+            await asyncio.to_thread(image_cache.set, cache_key, full_url, use_by_date)
+        return full_url
+
+    async def generate_images_urls(self, sku: str):
+        """
+        Upload all images of sku concurrently
+        :param sku:
+        :return: urls in image order
+        """
+        images = await asyncio.to_thread(self.ebay._get_images, sku)
+        urls = await asyncio.gather(*[self.upload_image(image) for image in images])
+        return [url for url in urls if url]
+
+    async def bulk_create_or_replace_inventory_item(self, inventory_items: list):
+        """
+        https://developer.ebay.com/api-docs/sell/inventory/resources/inventory_item/methods/bulkCreateOrReplaceInventoryItem
+        :param inventory_items:
+        :return: dict of sku & True if its inventory item was created or replaced
+        """
+        uri = '/sell/inventory/v1/bulk_create_or_replace_inventory_item'
+        sku_status_dict = dict.fromkeys([item.get('sku') for item in inventory_items], False)
+        data = await self._bulk_request(uri, inventory_items, 'sku')
+        for item in data.get('responses', []):
+            if item.get('errors'):
+                logging.error(f"Inventory item not created for sku: {item.get('sku')}: {item.get('errors')}")
+            else:
+                sku_status_dict[item.get('sku')] = True
+        return sku_status_dict
+
+    async def bulk_create_offer(self, offer_items: list):
+        """
+        https://developer.ebay.com/api-docs/sell/inventory/resources/offer/methods/bulkCreateOffer
+        :param offer_items:
+        :return: dict of sku & offerId, None for skus whose offer was not created
+        """
+        uri = '/sell/inventory/v1/bulk_create_offer'
+        chunks = [offer_items[i:i + BULK_OFFER_LIMIT] for i in range(0, len(offer_items), BULK_OFFER_LIMIT)]
+        results = await asyncio.gather(*[self._bulk_request(uri, chunk, 'sku') for chunk in chunks])
+        sku_offer_id_dict = dict.fromkeys([item.get('sku') for item in offer_items])
+        for data in results:
+            sku_offer_id_dict.update(EbayAPI._parse_bulk_offer_responses(data))
+        return sku_offer_id_dict
+
+    async def bulk_publish_offer(self, offer_ids: list):
+        """
+        https://developer.ebay.com/api-docs/sell/inventory/resources/offer/methods/bulkPublishOffer
+        :param offer_ids:
+        :return: dict of offerId & its result: {'listingId': ..., 'errors': [...]}
+        """
+        uri = '/sell/inventory/v1/bulk_publish_offer'
+        chunks = [offer_ids[i:i + BULK_OFFER_LIMIT] for i in range(0, len(offer_ids), BULK_OFFER_LIMIT)]
+        responses = await asyncio.gather(*[
+            self._bulk_request(uri, [{'offerId': offer_id} for offer_id in chunk], 'offerId') for chunk in chunks
+        ])
+        results = {offer_id: {'listingId': None, 'errors': [{'message': 'No response'}]} for offer_id in offer_ids}
+        for data in responses:
+            for item in data.get('responses', []):
+                results[item.get('offerId')] = {
+                    'listingId': item.get('listingId'),
+                    'errors': item.get('errors', []),
+                }
+        return results
+
+    async def _list_batch(self, rows: list):
+        # the aspect checks read the sqlite aspect store
+        rows = await asyncio.to_thread(self.ebay._reject_invalid_rows, rows)
+        skus = [row.get(EXCEL_COL_MAPPING['sku']) for row in rows]
+        images_urls = await asyncio.gather(*[self.generate_images_urls(sku) for sku in skus])
+
+        inventory_items = []
+        offer_payloads = []
+        for row, image_urls in zip(rows, images_urls):
+            payload = self.ebay._generate_inventory_payload(row, image_urls=image_urls)
+            if payload:
+                inventory_items.append(payload)
+            offer_payload = self.ebay._generate_offer_payload(row)
+            if offer_payload:
+                offer_payloads.append(offer_payload)
 
-        # if items in inventory_items then list them
         if inventory_items:
-            self.bulk_create_or_replace_inventory_item(inventory_items)
-            # empty the inventory_items
-            inventory_items.clear()
-        if offer_payloads:
-            time.sleep(2)
-            self.create_offers(offer_payloads)
-            offer_payloads.clear()
-            time.sleep(2)
-            self.publish_offers()
+            await self.bulk_create_or_replace_inventory_item(inventory_items)
+        if not offer_payloads:
+            return
+        sku_offer_id_dict = await self.bulk_create_offer(offer_payloads)
+        offer_id_sku_dict = {offer_id: sku for sku, offer_id in sku_offer_id_dict.items() if offer_id}
+        results = await self.bulk_publish_offer(list(offer_id_sku_dict))
+        for offer_id, result in results.items():
+            self.ebay.publish_results[offer_id_sku_dict[offer_id]] = {'offerId': offer_id, **result}
+
+    async def list_items(self, rows: list, batch_size: int = 20):
+        """
+        List prepared rows (EbayAPI._prepare_rows), all batches concurrently within the request concurrency
+        :param rows:
+        :param batch_size:
+        :return:
+        """
+        await asyncio.to_thread(self.ebay.load_item_aspects)
+        # refreshed once here rather than by the first requests of every batch
+        await asyncio.to_thread(self.ebay.get_access_token)
+        await asyncio.to_thread(self.ebay.index_images, [row.get(EXCEL_COL_MAPPING['sku']) for row in rows])
+        batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+        results = await asyncio.gather(*[self._list_batch(batch) for batch in batches], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error(f"Batch failed: {result!r}")
+
+
+class _AsyncResponse:
+    """
+    Status & headers of an aiohttp response, as RateLimiter.update expects of a requests response
+    """
 
-    def workflow(self, excel_file):
-        self.read_excel(excel_file)
-        self.list_items()
+    def __init__(self, status_code: int, headers):
+        self.status_code = status_code
+        self.headers = headers
 
 
 def load_config(config_file):
@@ -1216,6 +4085,148 @@ def load_config(config_file):
     return config
 
 
+def configure_logging_from_config(settings):
+    configure_logging(
+        log_format=settings.get('log_format', fallback='text'),
+        level=settings.get('log_level', fallback='DEBUG').upper(),
+        payload_sample_rate=settings.getfloat('log_payload_sample_rate', fallback=1.0)
+    )
+
+
+def get_account_config(config, account: str = None):
+    """
+    Settings of an account: its [<environment>:<account>] section over the [<environment>] section
+    :param config:
+    :param account:
+    :return: section proxy
+    """
+    settings = {**config[environment]}
+    if account:
+        settings.update(config[f'{environment}:{account}'])
+    merged = configparser.RawConfigParser()
+    merged.optionxform = lambda option: option
+    merged.read_dict({'settings': settings})
+    return merged['settings']
+
+
+def get_accounts(config):
+    """
+    Accounts of the [<environment>:<account>] sections of the config
+    :param config:
+    :return: list of account names
+    """
+    return [section.split(':', 1)[1] for section in config.sections() if section.startswith(f'{environment}:')]
+
+
+def create_ebay_api(settings, test: bool, account: str = None):
+    return EbayAPI(
+        client_id=settings['client_id'],
+        client_secret=settings['client_secret'],
+        dev_id=settings['dev_id'],
+        test=test,
+        image_upload_workers=settings.getint('image_upload_workers', fallback=4),
+        image_cache_days=settings.getint('image_cache_days', fallback=30),
+        http_pool_size=settings.getint('http_pool_size', fallback=10),
+        http_timeout=settings.getfloat('http_timeout', fallback=60),
+        rate_limits={
+            family: settings.getfloat(f'rate_limit_{family}', fallback=rate)
+            for family, rate in DEFAULT_RATE_LIMITS.items()
+        },
+        max_retries=settings.getint('max_retries', fallback=5),
+        retry_budget_ratio=settings.getfloat('retry_budget_ratio', fallback=0.2),
+        retry_budget_min_tokens=settings.getfloat('retry_budget_min_tokens', fallback=10),
+        retry_budget_max_tokens=settings.getfloat('retry_budget_max_tokens', fallback=100),
+        build_workers=settings.getint('build_workers', fallback=2),
+        send_workers=settings.getint('send_workers', fallback=2),
+        pipeline_queue_size=settings.getint('pipeline_queue_size', fallback=2),
+        marketplace_id=settings.get('marketplace_id', fallback='EBAY_GB'),
+        currency=settings.get('currency', fallback='GBP'),
+        photo_directory=settings['photo_directory'],
+        account=account,
+        policy_cache_hours=settings.getfloat('policy_cache_hours', fallback=24),
+        aspect_cache_days=settings.getint('aspect_cache_days', fallback=7),
+        image_preprocess_workers=settings.getint('image_preprocess_workers', fallback=0),
+        image_max_size=settings.getint('image_max_size', fallback=1600),
+        image_quality=settings.getint('image_quality', fallback=85),
+        save_image_index=settings.getboolean('save_image_index', fallback=True),
+        base_url=settings.get('base_url', fallback=None) or None,
+        metrics_port=settings.getint('metrics_port', fallback=0),
+        metrics_snapshot_file=settings.get('metrics_snapshot_file', fallback=None) or None,
+        metrics_snapshot_interval=settings.getfloat('metrics_snapshot_interval', fallback=60),
+        reconcile_workers=settings.getint('reconcile_workers', fallback=8)
+    )
+
+
+def run_account_shard(config_file: str, test: bool, account: str, df, resume: bool, diff: bool,
+                      reconcile: bool = False, restart: bool = False):
+    """
+    Worker process: list the rows of one account with its own token & rate limits
+    :return: (account, published, total)
+    """
+    global CONFIG, environment
+    CONFIG = load_config(config_file)
+    environment = 'sandbox' if test else 'production'
+    configure_logging_from_config(CONFIG[environment])
+
+    ebay = create_ebay_api(get_account_config(CONFIG, account), test, account)
+    try:
+        ebay.run([df], resume=resume, diff=diff, reconcile=reconcile, restart=restart)
+    finally:
+        ebay.close()
+    published = sum(1 for result in ebay.publish_results.values() if result.get('listingId'))
+    return account, published, len(ebay.publish_results)
+
+
+def run_accounts(config_file: str, args):
+    """
+    List the sheet for every [<environment>:<account>] section of the config, each account in its own process.
+    Rows are sharded on the account column of the sheet, 'Account' unless set by account_column.
+    :param config_file:
+    :param args:
+    :return:
+    """
+    import pandas as pd
+
+    accounts = get_accounts(CONFIG)
+    if not accounts:
+        logging.error(f"No [{environment}:<account>] sections in {config_file}")
+        print(f"No [{environment}:<account>] sections in {config_file}")
+        return
+
+    # load or authorize the token of every account here, worker processes can't prompt
+    apis = {account: create_ebay_api(get_account_config(CONFIG, account), args.test, account) for account in accounts}
+    excel_file = CONFIG[environment]['excel_name_with_path']
+    reader = apis[accounts[0]]
+    if os.path.splitext(excel_file)[1].lower() in ('.csv', '.parquet'):
+        df = pd.concat(list(reader.iter_sheet(excel_file)))
+    else:
+        reader.read_excel(excel_file)
+        df = reader.df
+    for api in apis.values():
+        api.close()
+
+    account_column = CONFIG[environment].get('account_column', 'Account')
+    row_accounts = df[account_column].astype(str) if account_column in df.columns else pd.Series('', index=df.index)
+    skipped = (~row_accounts.isin(accounts)).sum()
+    if skipped:
+        logging.warning(f"{skipped} rows without a configured account in column '{account_column}' are skipped")
+
+    with ProcessPoolExecutor(max_workers=len(accounts)) as executor:
+        futures = [
+            executor.submit(run_account_shard, config_file, args.test, account, df[row_accounts == account],
+                            args.resume, args.diff, args.reconcile, args.restart)
+            for account in accounts if (row_accounts == account).any()
+        ]
+        for future in as_completed(futures):
+            try:
+                account, published, total = future.result()
+                message = f"Account {account}: published {published} of {total} offers"
+                print(message)
+                logging.info(message)
+            except Exception as ex:
+                logging.exception(ex)
+
+
 def main(args):
     global CONFIG, environment
 
@@ -1223,6 +4234,7 @@ def main(args):
     config_file = args.ini
 
     CONFIG = load_config(config_file)
+    configure_logging_from_config(CONFIG['sandbox' if args.test else 'production'])
 
     if args.test:
         logging.info(f"Running in sandbox environment: {__version__}")
@@ -1232,13 +4244,31 @@ def main(args):
         logging.info(f"Running in production environment: {__version__}")
         environment = 'production'
 
-    ebay = EbayAPI(
-        client_id=CONFIG[environment]['client_id'],
-        client_secret=CONFIG[environment]['client_secret'],
-        dev_id=CONFIG[environment]['dev_id'],
-        test=args.test
-    )
-    ebay.workflow(CONFIG[environment]['excel_name_with_path'])
+    if args.clear_policy_cache:
+        policy_cache = PolicyCache(f'{EbayAPI.get_file_prefix(args.test)}_policy_cache.db')
+        policy_cache.invalidate()
+        policy_cache.close()
+        print("Policy cache cleared")
+        return
+
+    if args.multi_account:
+        run_accounts(config_file, args)
+        return
+
+    ebay = create_ebay_api(get_account_config(CONFIG), args.test)
+    try:
+        ebay.workflow(
+            CONFIG[environment]['excel_name_with_path'],
+            resume=args.resume,
+            diff=args.diff,
+            stream=args.stream,
+            chunk_size=CONFIG[environment].getint('stream_chunk_size', fallback=100),
+            reconcile=args.reconcile,
+            restart=args.restart
+        )
+    finally:
+        # flush & close the stores & worker pools, also when the run fails
+        ebay.close()
 
 
 if __name__ == '__main__':
@@ -1249,6 +4279,26 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Ebay Listing Script')
     parser.add_argument('-i', '--ini', help='config filename', type=str, required=False, default='ebay_listing.ini')
     parser.add_argument('-t', '--test', action='store_true', help="To run in sandbox environment, provide this flag")
+    progress = parser.add_mutually_exclusive_group()
+    progress.add_argument('-r', '--resume', action='store_true',
+                          help="Resume the previous runs, skipping the stages they finished for each sku")
+    progress.add_argument('--restart', action='store_true',
+                          help="Clear the progress journal first, a later --resume then only skips what this run "
+                               "finished")
+    parser.add_argument('-d', '--diff', action='store_true',
+                        help="Only push skus changed since they were last published, "
+                             "price & quantity changes are sent as a price & quantity update")
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help="Read the excel sheet in chunks & start listing before it is fully read, "
+                             "csv & parquet files are always read in chunks")
+    parser.add_argument('-c', '--reconcile', action='store_true',
+                        help="Fetch the inventory items & offers already on eBay first, "
+                             "existing offers are updated instead of created & unchanged listings are skipped")
+    parser.add_argument('-m', '--multi-account', action='store_true',
+                        help="List the rows of every [<environment>:<account>] section of the config, "
+                             "sharded on the Account column, each account in its own process")
+    parser.add_argument('--clear-policy-cache', action='store_true',
+                        help="Forget the cached inventory location & business policy ids and exit")
 
     args = parser.parse_args()
 
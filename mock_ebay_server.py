@@ -0,0 +1,365 @@
+import logging
+import time
+import json
+import gzip
+import random
+import re
+import threading
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+__version__ = "v1.0.0"
+
+
+class MockStats:
+    """
+    Thread-safe counters of the calls & bytes received by the mock server
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}
+            self.bytes_received = 0
+            self.bytes_uploaded = 0
+            self.errors = 0
+            self.throttled = 0
+
+    def count(self, endpoint: str, bytes_received: int):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            self.bytes_received += bytes_received
+            if endpoint == 'UploadSiteHostedPictures':
+                self.bytes_uploaded += bytes_received
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'calls': dict(self.calls),
+                'total_calls': sum(self.calls.values()),
+                'bytes_received': self.bytes_received,
+                'bytes_uploaded': self.bytes_uploaded,
+                'errors': self.errors,
+                'throttled': self.throttled,
+            }
+
+
+class MockEbayServer(ThreadingHTTPServer):
+    """
+    Local stand in of the eBay endpoints used by ebay_listing.EbayAPI:
+    identity token, account policies, inventory location, taxonomy aspects,
+    inventory bulk / offer / publish calls, inventory item & offer lookups & Trading UploadSiteHostedPictures.
+    Every call waits latency (+- jitter) seconds, error_rate of the calls answer 500 &
+    throttle_rate answer 429 with a Retry-After of retry_after seconds.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0, jitter: float = 0, error_rate: float = 0,
+                 throttle_rate: float = 0, item_error_rate: float = 0, retry_after: float = 1):
+        super().__init__(address, MockEbayHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.item_error_rate = item_error_rate
+        self.retry_after = retry_after
+        self.stats = MockStats()
+        self.picture_ids = iter(range(1, 1 << 62))
+        self.picture_ids_lock = threading.Lock()
+        # sku -> inventory item & sku -> offer, for getInventoryItems, getOffers & updateOffer
+        self.inventory_items = {}
+        self.offers = {}
+        self.offers_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def next_picture_id(self):
+        with self.picture_ids_lock:
+            return next(self.picture_ids)
+
+    def find_offer(self, offer_id: str):
+        # call with offers_lock held
+        return next((offer for offer in self.offers.values() if offer['offerId'] == offer_id), None)
+
+
+class MockEbayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers & body are separate writes, with Nagle every response would wait for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def _send(self, status: int, body=None, content_type: str = 'application/json', headers: dict = None):
+        if body is None:
+            data = b''
+        elif isinstance(body, bytes):
+            data = body
+        else:
+            data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _simulate(self, endpoint: str, body: bytes):
+        """
+        Count the call, wait the latency & fail it by the configured rates
+        :return: True if a failure was sent
+        """
+        server = self.server
+        server.stats.count(endpoint, len(body))
+        if server.latency or server.jitter:
+            time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        draw = random.random()
+        if draw < server.throttle_rate:
+            with server.stats.lock:
+                server.stats.throttled += 1
+            self._send(429, {'errors': [{'errorId': 2001, 'message': 'Too many requests'}]},
+                       headers={'Retry-After': str(server.retry_after)})
+            return True
+        if draw < server.throttle_rate + server.error_rate:
+            with server.stats.lock:
+                server.stats.errors += 1
+            self._send(500, {'errors': [{'errorId': 25001, 'message': 'Internal error'}]})
+            return True
+        return False
+
+    def _item_status(self):
+        return 500 if random.random() < self.server.item_error_rate else 200
+
+    def _send_bulk(self, responses: list):
+        # 207 Multi-Status when some items failed
+        status = 200 if all(response['statusCode'] == 200 for response in responses) else 207
+        self._send(status, {'responses': responses})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path
+        query = parse_qs(url.query)
+        endpoint = path.rsplit('/', 1)[-1]
+        policy = re.search(r'/sell/account/v1/(fulfillment|payment|return)_policy$', path)
+        offer = path.startswith('/sell/inventory/v1/offer/')
+        if offer:
+            endpoint = 'getOffer'
+
+        # control endpoints of the mock, not counted
+        if path == '/mock/stats':
+            return self._send(200, self.server.stats.to_dict())
+        if path == '/mock/reset':
+            self.server.stats.reset()
+            return self._send(200, {})
+
+        if self._simulate(endpoint, b''):
+            return
+        if path == '/sell/inventory/v1/location':
+            return self._send(200, {'total': 1, 'locations': [{'merchantLocationKey': 'MOCK_LOCATION'}]})
+        if policy:
+            kind = policy.group(1)
+            return self._send(200, {
+                'total': 1,
+                f'{kind}Policies': [{f'{kind}PolicyId': f'MOCK_{kind.upper()}_POLICY'}]
+            })
+        if path == '/commerce/taxonomy/v1/get_default_category_tree_id':
+            return self._send(200, {'categoryTreeId': '3'})
+        if path.endswith('/fetch_item_aspects'):
+            return self._send(200, gzip.compress(json.dumps({'categoryAspects': []}).encode('utf-8')),
+                              content_type='application/octet-stream')
+        if path == '/sell/inventory/v1/inventory_item':
+            # offset is the page number, like getInventoryItems
+            limit = int(query.get('limit', ['25'])[0])
+            page = int(query.get('offset', ['0'])[0])
+            with self.server.offers_lock:
+                items = list(self.server.inventory_items.values())
+            return self._send(200, {
+                'total': len(items),
+                'limit': limit,
+                'inventoryItems': items[page * limit:(page + 1) * limit]
+            })
+        if path == '/sell/inventory/v1/offer':
+            if 'sku' not in query:
+                # every offer, paged like getInventoryItems
+                limit = int(query.get('limit', ['25'])[0])
+                page = int(query.get('offset', ['0'])[0])
+                with self.server.offers_lock:
+                    offers = list(self.server.offers.values())
+                return self._send(200, {
+                    'total': len(offers),
+                    'limit': limit,
+                    'offers': offers[page * limit:(page + 1) * limit]
+                })
+            sku = query.get('sku', [''])[0]
+            with self.server.offers_lock:
+                offers = [self.server.offers[sku]] if sku in self.server.offers else []
+            return self._send(200, {'total': len(offers), 'offers': offers})
+        if offer:
+            with self.server.offers_lock:
+                found = self.server.find_offer(path.rsplit('/', 1)[-1])
+            return self._send(200, found) if found else self._send(404, {'errors': [{'errorId': 25713}]})
+        self._send(404, {'errors': [{'message': f'Unknown endpoint {path}'}]})
+
+    def do_PUT(self):
+        path = urlparse(self.path).path
+        body = self._read_body()
+        if self._simulate('updateOffer', body):
+            return
+        if path.startswith('/sell/inventory/v1/offer/'):
+            with self.server.offers_lock:
+                found = self.server.find_offer(path.rsplit('/', 1)[-1])
+                if found:
+                    found.update(json.loads(body or b'{}'))
+            if not found:
+                return self._send(404, {'errors': [{'errorId': 25713}]})
+            return self._send(200, {'warnings': []})
+        self._send(404, {'errors': [{'message': f'Unknown endpoint {path}'}]})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_body()
+        endpoint = 'UploadSiteHostedPictures' if path == '/ws/api.dll' else path.rsplit('/', 1)[-1]
+        if self._simulate(endpoint, body):
+            return
+
+        if path == '/identity/v1/oauth2/token':
+            return self._send(200, {
+                'access_token': 'MOCK_ACCESS_TOKEN',
+                'expires_in': 7200,
+                'refresh_token': 'MOCK_REFRESH_TOKEN',
+                'token_type': 'User Access Token'
+            })
+        if path == '/ws/api.dll':
+            picture_id = self.server.next_picture_id()
+            return self._send(
+                200,
+                (
+                    '<?xml version="1.0" encoding="UTF-8"?>'
+                    '<UploadSiteHostedPicturesResponse xmlns="urn:ebay:apis:eBLBaseComponents">'
+                    '<Ack>Success</Ack><SiteHostedPictureDetails>'
+                    f'<FullURL>https://i.ebayimg.mock/images/{picture_id}.jpg</FullURL>'
+                    '<UseByDate>2099-01-01T00:00:00.000Z</UseByDate>'
+                    '</SiteHostedPictureDetails></UploadSiteHostedPicturesResponse>'
+                ).encode('utf-8'),
+                content_type='text/xml'
+            )
+
+        try:
+            items = json.loads(body or b'{}').get('requests', [])
+        except ValueError:
+            return self._send(400, {'errors': [{'message': 'Invalid json'}]})
+
+        if endpoint == 'bulk_create_or_replace_inventory_item':
+            responses = []
+            for item in items:
+                status = self._item_status()
+                if status == 200:
+                    with self.server.offers_lock:
+                        self.server.inventory_items[item.get('sku')] = item
+                responses.append({'statusCode': status, 'sku': item.get('sku')})
+            return self._send_bulk(responses)
+        if endpoint == 'bulk_create_offer':
+            responses = []
+            for item in items:
+                status = self._item_status()
+                response = {'statusCode': status, 'sku': item.get('sku')}
+                with self.server.offers_lock:
+                    existing = self.server.offers.get(item.get('sku'))
+                    if status == 200 and existing:
+                        # like eBay, the offerId of the existing offer is in the error parameters
+                        response = {'statusCode': 400, 'sku': item.get('sku'), 'errors': [{
+                            'errorId': 25002,
+                            'message': 'Offer entity already exists',
+                            'parameters': [{'name': 'offerId', 'value': existing['offerId']}]
+                        }]}
+                    elif status == 200:
+                        response['offerId'] = f"MOCK-{item.get('sku')}"
+                        self.server.offers[item.get('sku')] = {
+                            **item, 'offerId': response['offerId'], 'status': 'UNPUBLISHED'
+                        }
+                responses.append(response)
+            return self._send_bulk(responses)
+        if endpoint == 'bulk_publish_offer':
+            responses = []
+            for item in items:
+                status = self._item_status()
+                response = {'statusCode': status, 'offerId': item.get('offerId')}
+                if status == 200:
+                    response['listingId'] = f"L{item.get('offerId')}"
+                    with self.server.offers_lock:
+                        found = self.server.find_offer(item.get('offerId'))
+                        if found:
+                            found.update({'status': 'PUBLISHED', 'listing': {'listingId': response['listingId']}})
+                responses.append(response)
+            return self._send_bulk(responses)
+        if endpoint == 'bulk_update_price_quantity':
+            responses = []
+            for item in items:
+                status = self._item_status()
+                offer_update = (item.get('offers') or [{}])[0]
+                if status == 200:
+                    with self.server.offers_lock:
+                        found = self.server.find_offer(offer_update.get('offerId'))
+                        if found:
+                            found['availableQuantity'] = offer_update.get('availableQuantity')
+                            if offer_update.get('price'):
+                                found['pricingSummary'] = {'price': offer_update['price']}
+                responses.append({'statusCode': status, 'sku': item.get('sku'), 'offerId': offer_update.get('offerId')})
+            return self._send_bulk(responses)
+        self._send(404, {'errors': [{'message': f'Unknown endpoint {path}'}]})
+
+
+def start_server(host: str = '127.0.0.1', port: int = 0, **options):
+    """
+    Start a mock server on a background thread
+    :param host:
+    :param port: 0 for a free port
+    :param options: MockEbayServer options
+    :return: server, its url is server.url
+    """
+    server = MockEbayServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mock eBay API server for offline runs & benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0, help="Seconds every call waits")
+    parser.add_argument('--jitter', type=float, default=0, help="Random +- seconds added to the latency")
+    parser.add_argument('--error-rate', type=float, default=0, help="Share of calls answered with 500")
+    parser.add_argument('--throttle-rate', type=float, default=0, help="Share of calls answered with 429")
+    parser.add_argument('--item-error-rate', type=float, default=0,
+                        help="Share of bulk request items answered with statusCode 500")
+    parser.add_argument('--retry-after', type=float, default=1, help="Retry-After seconds of 429 responses")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s : %(levelname)s : %(message)s')
+    mock_server = MockEbayServer(
+        (args.host, args.port),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        item_error_rate=args.item_error_rate,
+        retry_after=args.retry_after
+    )
+    print(f"Mock eBay server {__version__} on {mock_server.url}, stats on {mock_server.url}/mock/stats")
+    print(f"Set base_url={mock_server.url} in the ini file to use it")
+    try:
+        mock_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,112 @@
+import os
+import csv
+import json
+import time
+import pytest
+
+from ebay_listing import EbayAPI, EXCEL_COL_MAPPING, DEFAULT_RATE_LIMITS
+from mock_ebay_server import start_server
+
+SHEET_COLUMNS = ['sku', 'product.title', 'pricingSummary.auctionStartPrice', 'availableQuantity', 'condition',
+                 'categoryId', 'format', 'product.brand', 'product.mpn']
+
+
+def listing_rows(count: int, prefix: str = 'SKU'):
+    """
+    Sheet rows keyed by EXCEL_COL_MAPPING key
+    """
+    return [
+        {
+            'sku': f'{prefix}{i:04d}',
+            'product.title': f'Item {i}',
+            'pricingSummary.auctionStartPrice': 10 + i,
+            'availableQuantity': 1 + i % 5,
+            'condition': 1000,
+            'categoryId': 11483,
+            'format': 'FixedPrice',
+            'product.brand': 'Brand',
+            'product.mpn': 'Does not apply',
+        }
+        for i in range(count)
+    ]
+
+
+def write_sheet(directory, rows: list, filename: str = 'sheet.csv', columns: list = SHEET_COLUMNS):
+    """
+    Write rows as a csv with the header on the 4th row, like the eBay file exchange template
+    :param columns: EXCEL_COL_MAPPING keys, other columns keep their name
+    :return: path of the csv
+    """
+    path = os.path.join(directory, filename)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for _ in range(3):
+            writer.writerow(['info'])
+        writer.writerow([EXCEL_COL_MAPPING.get(key, key) for key in columns])
+        for row in rows:
+            writer.writerow([row.get(key) for key in columns])
+    return path
+
+
+def write_photos(photo_directory, skus: list, images_per_sku: int = 1, content: bytes = None):
+    """
+    One directory of images per sku, every image has its own content unless content is given
+    """
+    for sku in skus:
+        sku_directory = os.path.join(photo_directory, str(sku))
+        os.makedirs(sku_directory, exist_ok=True)
+        for n in range(images_per_sku):
+            with open(os.path.join(sku_directory, f'{n}.jpg'), 'wb') as f:
+                f.write(content if content is not None else f'{sku}-{n}'.encode() + os.urandom(64))
+
+
+@pytest.fixture
+def mock_server():
+    server = start_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Working directory of the local state files, with a valid saved token
+    """
+    monkeypatch.chdir(tmp_path)
+    with open('ebay_sandbox_api_token.json', 'w') as f:
+        json.dump({
+            'access_token': 'TEST', 'refresh_token': 'TEST', 'expires_in': 7200,
+            'expires_at': time.time() + 7200
+        }, fp=f)
+    # retries wait milliseconds instead of seconds
+    monkeypatch.setattr(EbayAPI, '_get_backoff', staticmethod(lambda attempt, base=1, cap=60: 0.001))
+    os.makedirs('photos')
+    return tmp_path
+
+
+@pytest.fixture
+def create_api(workdir, mock_server):
+    """
+    Factory of EbayAPI instances listing against the mock server, closed after the test
+    """
+    apis = []
+
+    def create(**options):
+        settings = {
+            'test': True,
+            'base_url': mock_server.url,
+            'photo_directory': str(workdir / 'photos'),
+            'policy_cache_hours': 0,
+            'aspect_cache_days': 0,
+            'save_image_index': False,
+            'rate_limits': {family: 1000 for family in DEFAULT_RATE_LIMITS},
+            **options
+        }
+        api = EbayAPI('test', 'test', 'test', **settings)
+        apis.append(api)
+        return api
+
+    yield create
+    for api in apis:
+        api.close()
@@ -0,0 +1,56 @@
+import argparse
+import json
+import time
+
+import ebay_listing
+from ebay_listing import DEFAULT_RATE_LIMITS
+from tests.conftest import SHEET_COLUMNS, listing_rows, write_sheet, write_photos
+
+
+def write_config(workdir, base_url, sheet, accounts):
+    rate_limits = '\n'.join(f'rate_limit_{family} = 1000' for family in DEFAULT_RATE_LIMITS)
+    sections = [f"""[sandbox]
+client_id = test
+client_secret = test
+dev_id = test
+photo_directory = {workdir / 'photos'}
+excel_name_with_path = {sheet}
+base_url = {base_url}
+policy_cache_hours = 0
+aspect_cache_days = 0
+save_image_index = false
+log_level = INFO
+{rate_limits}
+"""]
+    for account in accounts:
+        sections.append(f'[sandbox:{account}]\nclient_id = test-{account}\n')
+        with open(f'ebay_sandbox_{account}_api_token.json', 'w') as f:
+            json.dump({
+                'access_token': 'TEST', 'refresh_token': 'TEST', 'expires_in': 7200,
+                'expires_at': time.time() + 7200
+            }, fp=f)
+    config_file = workdir / 'ebay_listing.ini'
+    config_file.write_text('\n'.join(sections))
+    return str(config_file)
+
+
+def test_rows_sharded_over_two_accounts(workdir, mock_server, monkeypatch, capsys):
+    rows = listing_rows(12)
+    for i, row in enumerate(rows):
+        # the last row has no configured account & is skipped
+        row['Account'] = 'unknown' if i == 11 else 'ab'[i % 2]
+    skus = [row['sku'] for row in rows]
+    write_photos(workdir / 'photos', skus)
+    sheet = write_sheet(workdir, rows, columns=SHEET_COLUMNS + ['Account'])
+    config_file = write_config(workdir, mock_server.url, sheet, ['a', 'b'])
+
+    monkeypatch.setattr(ebay_listing, 'CONFIG', ebay_listing.load_config(config_file))
+    monkeypatch.setattr(ebay_listing, 'environment', 'sandbox')
+    ebay_listing.run_accounts(config_file, argparse.Namespace(
+        test=True, resume=False, diff=False, reconcile=False, restart=False
+    ))
+
+    assert set(mock_server.offers) == set(skus[:11])
+    assert all(offer['status'] == 'PUBLISHED' for offer in mock_server.offers.values())
+    lines = capsys.readouterr().out.splitlines()
+    assert sorted(lines) == ['Account a: published 6 of 6 offers', 'Account b: published 5 of 5 offers']
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from ebay_listing import AsyncEbayAPI
+from tests.conftest import listing_rows, write_sheet, write_photos
+
+pytest.importorskip('aiohttp')
+
+
+def prepare_rows(api, sheet):
+    df = pd.concat(api.iter_sheet(sheet), ignore_index=True)
+    api._generate_product_aspects_column_list(df)
+    return api._prepare_rows(df)
+
+
+async def list_items(api, rows):
+    async with AsyncEbayAPI(api) as client:
+        await client.fetch_policies()
+        await client.list_items(rows)
+
+
+def test_async_listing_records_bytes_sent(create_api, workdir, mock_server):
+    rows = listing_rows(30)
+    skus = [row['sku'] for row in rows]
+    write_photos(workdir / 'photos', skus)
+    api = create_api()
+
+    asyncio.run(list_items(api, prepare_rows(api, write_sheet(workdir, rows))))
+
+    assert {sku for sku, result in api.publish_results.items() if result.get('listingId')} == set(skus)
+    sent = {endpoint: stats['bytes_sent'] for (method, endpoint), stats in api.metrics.endpoints.items()
+            if method == 'POST'}
+    assert sent['/ws/api.dll'] > 30 * len(b'image')
+    assert sent['/sell/inventory/v1/bulk_create_offer'] > 0
+
+
+def test_token_refresh_off_the_event_loop(create_api, workdir):
+    api = create_api()
+    get_access_token = api.get_access_token
+
+    def slow_get_access_token():
+        # a refresh blocking on the token endpoint & file lock
+        time.sleep(0.3)
+        return get_access_token()
+
+    api.get_access_token = slow_get_access_token
+
+    async def count_ticks(client):
+        ticks = 0
+        headers = asyncio.ensure_future(client._get_headers())
+        while not headers.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        return ticks, headers.result()
+
+    ticks, headers = asyncio.run(count_ticks(AsyncEbayAPI(api)))
+    assert headers['Authorization'].startswith('IAF ')
+    assert ticks > 10
+
+
+def test_invalid_rows_checked_off_the_event_loop(create_api, workdir, monkeypatch):
+    api = create_api()
+    threads = []
+
+    def reject_invalid_rows(rows):
+        threads.append(threading.current_thread())
+        return []
+
+    monkeypatch.setattr(api, '_reject_invalid_rows', reject_invalid_rows)
+    asyncio.run(AsyncEbayAPI(api)._list_batch([{}]))
+    assert threads and threads[0] is not threading.main_thread()
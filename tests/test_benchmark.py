@@ -0,0 +1,20 @@
+import os
+
+from benchmark import generate_sheet
+from ebay_listing import ImageUrlCache
+
+
+def image_hashes(photo_directory):
+    return {
+        ImageUrlCache.file_hash(os.path.join(root, name))
+        for root, _, names in os.walk(photo_directory) for name in names
+    }
+
+
+def test_generated_images_are_unique(tmp_path):
+    _, photo_directory = generate_sheet(str(tmp_path / 'unique'), 20, images_per_sku=2, image_kb=1)
+    assert len(image_hashes(photo_directory)) == 40
+
+    _, photo_directory = generate_sheet(str(tmp_path / 'shared'), 20, images_per_sku=2, image_kb=1,
+                                        shared_images=True)
+    assert len(image_hashes(photo_directory)) == 2
@@ -0,0 +1,11 @@
+import os
+import subprocess
+import sys
+
+
+def test_import_skips_heavy_dependencies():
+    code = ("import sys, ebay_listing; "
+            "print(sorted({'PIL', 'pandas', 'numpy', 'aiohttp', 'python_calamine'} & set(sys.modules)))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == '[]'
@@ -0,0 +1,51 @@
+import json
+import logging
+
+import pytest
+
+import ebay_listing
+from ebay_listing import configure_logging, close_logging
+
+
+@pytest.fixture
+def root_logger():
+    """
+    Root logger restored after configure_logging replaced its handlers
+    """
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    close_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_close_flushes_the_queue(tmp_path, root_logger):
+    log_file = tmp_path / 'run.log'
+    configure_logging(log_file=str(log_file), log_format='json', level='INFO')
+    for i in range(500):
+        logging.info(f'record {i}')
+    logging.debug('below the level')
+    close_logging()
+
+    messages = [json.loads(line)['message'] for line in log_file.read_text(encoding='utf-8').splitlines()]
+    assert messages == [f'record {i}' for i in range(500)]
+    assert ebay_listing._log_listener is None
+    # as atexit does after an explicit close
+    close_logging()
+
+
+def test_reconfigure_closes_the_previous_file(tmp_path, root_logger):
+    configure_logging(log_file=str(tmp_path / 'first.log'), level='INFO')
+    file_handler = ebay_listing._log_listener.handlers[0]
+    logging.info('first')
+    configure_logging(log_file=str(tmp_path / 'second.log'), level='INFO')
+    logging.info('second')
+    close_logging()
+
+    assert file_handler.stream is None
+    assert (tmp_path / 'first.log').read_text(encoding='utf-8').rstrip().endswith(' : first')
+    assert (tmp_path / 'second.log').read_text(encoding='utf-8').rstrip().endswith(' : second')
@@ -0,0 +1,136 @@
+import json
+import re
+
+import requests
+
+from ebay_listing import Metrics, LATENCY_BUCKETS
+from tests.conftest import listing_rows, write_sheet, write_photos
+
+# name{labels} value
+SAMPLE = re.compile(r'^([a-z_]+)\{((?:[a-z]+="[^"]*",?)*)\} (-?[0-9.e+-]+)$')
+
+
+def parse_prometheus(text: str):
+    """
+    Check the text exposition format
+    :return: (metric name -> type, list of (sample name, labels, value))
+    """
+    assert text.endswith('\n')
+    types = {}
+    samples = []
+    helped = set()
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            helped.add(line.split(' ')[2])
+        elif line.startswith('# TYPE '):
+            name, metric_type = line.split(' ')[2:]
+            assert name in helped and name not in types
+            types[name] = metric_type
+        else:
+            match = SAMPLE.match(line)
+            assert match, line
+            name, label_text, value = match.groups()
+            assert any(name == metric or name.startswith(metric + '_') for metric in types), line
+            labels = dict(re.findall(r'([a-z]+)="([^"]*)"', label_text))
+            samples.append((name, labels, float(value)))
+    return types, samples
+
+
+def sample_metrics():
+    metrics = Metrics()
+    metrics.observe_call('POST', '/sell/inventory/v1/offer/123/publish', 200, 0.02, bytes_sent=10)
+    metrics.observe_call('POST', '/sell/inventory/v1/offer/456/publish?x=1', 429, 0.3, bytes_sent=10)
+    metrics.observe_call('POST', '/sell/inventory/v1/offer/456/publish', 200, 70, bytes_sent=10,
+                         bytes_received=5)
+    metrics.observe_call('GET', '/sell/account/v1/return_policy', 'error', 0.1)
+    metrics.count_retry('POST', '/sell/inventory/v1/offer/456/publish')
+    metrics.add_stage_time('build', 1.5, items=3)
+    return metrics
+
+
+def test_prometheus_text():
+    types, samples = parse_prometheus(sample_metrics().to_prometheus())
+    assert types == {
+        'ebay_api_calls_total': 'counter',
+        'ebay_api_call_seconds': 'histogram',
+        'ebay_api_bytes_sent_total': 'counter',
+        'ebay_api_bytes_received_total': 'counter',
+        'ebay_api_retries_total': 'counter',
+        'ebay_api_throttled_total': 'counter',
+        'ebay_stage_seconds_total': 'counter',
+        'ebay_stage_items_total': 'counter',
+    }
+    publish = {'method': 'POST', 'endpoint': '/sell/inventory/v1/offer/{id}/publish'}
+
+    def value(name, **labels):
+        matches = [v for n, sample_labels, v in samples if n == name and sample_labels == labels]
+        assert len(matches) == 1, (name, labels)
+        return matches[0]
+
+    # the offer ids & query are folded into one endpoint label
+    assert value('ebay_api_calls_total', **publish, status='200') == 2
+    assert value('ebay_api_calls_total', **publish, status='429') == 1
+    assert value('ebay_api_calls_total', method='GET', endpoint='/sell/account/v1/return_policy',
+                 status='error') == 1
+    assert value('ebay_api_bytes_sent_total', **publish) == 30
+    assert value('ebay_api_bytes_received_total', **publish) == 5
+    assert value('ebay_api_retries_total', **publish) == 1
+    assert value('ebay_api_throttled_total', **publish) == 1
+    assert value('ebay_stage_seconds_total', stage='build') == 1.5
+    assert value('ebay_stage_items_total', stage='build') == 3
+
+    # cumulative buckets, the call slower than the last bound is only in +Inf
+    buckets = [value('ebay_api_call_seconds_bucket', **publish, le=str(bound)) for bound in LATENCY_BUCKETS]
+    assert buckets == sorted(buckets)
+    assert buckets[0] == 1 and buckets[-1] == 2
+    assert value('ebay_api_call_seconds_bucket', **publish, le='+Inf') == 3
+    assert value('ebay_api_call_seconds_count', **publish) == 3
+    assert value('ebay_api_call_seconds_sum', **publish) == 70.32
+
+
+def test_metrics_http_server():
+    metrics = sample_metrics()
+    server = metrics.start_http_server(0)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        response = requests.get(url + '/metrics')
+        assert response.status_code == 200
+        assert response.headers['Content-Type'].startswith('text/plain')
+        assert response.text == metrics.to_prometheus()
+        assert requests.get(url + '/other').status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_json_snapshot(tmp_path):
+    filename = str(tmp_path / 'metrics.json')
+    sample_metrics().save_snapshot(filename)
+    with open(filename) as f:
+        snapshot = json.load(f)
+    assert snapshot['stages'] == {'build': {'seconds': 1.5, 'items': 3}}
+    assert [(e['method'], e['endpoint']) for e in snapshot['endpoints']] == [
+        ('GET', '/sell/account/v1/return_policy'), ('POST', '/sell/inventory/v1/offer/{id}/publish')
+    ]
+    publish = snapshot['endpoints'][1]
+    assert publish['calls'] == 3 and publish['errors'] == 1 and publish['throttled'] == 1
+    assert publish['statuses'] == {'200': 2, '429': 1}
+    assert publish['max_seconds'] == 70
+    assert len(publish['buckets']) == len(LATENCY_BUCKETS) and sum(publish['buckets']) == 2
+    # no temp file is left behind
+    assert [path.name for path in tmp_path.iterdir()] == ['metrics.json']
+
+
+def test_workflow_writes_snapshot(create_api, workdir, mock_server):
+    rows = listing_rows(10)
+    write_photos(workdir / 'photos', [row['sku'] for row in rows])
+    api = create_api(metrics_snapshot_file=str(workdir / 'metrics.json'))
+    api.workflow(write_sheet(workdir, rows))
+
+    with open(workdir / 'metrics.json') as f:
+        snapshot = json.load(f)
+    calls = {e['endpoint']: e['calls'] for e in snapshot['endpoints'] if e['method'] == 'POST'}
+    mock_calls = mock_server.stats.to_dict()['calls']
+    assert calls['/ws/api.dll'] == mock_calls['UploadSiteHostedPictures'] == 10
+    assert calls['/sell/inventory/v1/bulk_create_offer'] == mock_calls['bulk_create_offer']
+    assert snapshot['stages']
@@ -0,0 +1,115 @@
+import pandas as pd
+
+from ebay_listing import EbayAPI, EXCEL_COL_MAPPING
+from tests.conftest import listing_rows, write_sheet, write_photos
+
+
+def test_parse_bulk_offer_responses():
+    data = {'responses': [
+        {'statusCode': 200, 'sku': 'A', 'offerId': 'O1'},
+        # the offer exists already, its offerId is in the error parameters
+        {'statusCode': 400, 'sku': 'B', 'errors': [{
+            'errorId': 25002, 'parameters': [{'name': 'offerId', 'value': 'O2'}]
+        }]},
+        {'statusCode': 400, 'sku': 'C', 'errors': [{'errorId': 25709, 'parameters': [{'name': 'sku', 'value': 'C'}]}]},
+    ]}
+    assert EbayAPI._parse_bulk_offer_responses(data) == {'A': 'O1', 'B': 'O2', 'C': None}
+    assert EbayAPI._parse_bulk_offer_responses({}) == {}
+
+
+def test_prepare_rows(create_api):
+    api = create_api()
+    df = pd.DataFrame({
+        EXCEL_COL_MAPPING['sku']: ['A', 'B', 'C'],
+        EXCEL_COL_MAPPING['condition']: [1000.0, '3000 - Used', None],
+        EXCEL_COL_MAPPING['availableQuantity']: [3.0, 0, ''],
+        EXCEL_COL_MAPPING['categoryId']: [11483.0, '261', None],
+        EXCEL_COL_MAPPING['format']: ['FixedPrice', 'Auction', None],
+        EXCEL_COL_MAPPING['tax.vatPercentage']: [20.0, 'x', None],
+        EXCEL_COL_MAPPING['product.mpn']: ['Does not apply', 12345.0, 'AB-1'],
+        'C:Colour': ['Red||Blue', 42.0, ''],
+    })
+    api._generate_product_aspects_column_list(df)
+    rows = api._prepare_rows(df)
+
+    assert [row['_condition'] for row in rows] == ['NEW', 'USED_EXCELLENT', None]
+    assert [row['_quantity'] for row in rows] == [3, None, None]
+    assert [row['_categoryId'] for row in rows] == ['11483', '261', None]
+    assert [row['_format'] for row in rows] == ['FIXED_PRICE', 'AUCTION', 'FIXED_PRICE']
+    assert [row['_vatPercentage'] for row in rows] == [20, None, None]
+    assert [row['_mpn'] for row in rows] == [None, '12345', 'AB-1']
+    # C:MPN is an aspect column too
+    assert [row['_aspects'] for row in rows] == [
+        {'MPN': ['Does not apply'], 'Colour': ['Red', 'Blue']},
+        {'MPN': [12345], 'Colour': [42]},
+        {'MPN': ['AB-1']},
+    ]
+    # aspect columns are only kept in _aspects, unless a payload field reads them
+    assert 'C:Colour' not in rows[0]
+    assert EXCEL_COL_MAPPING['product.mpn'] in rows[0]
+
+
+def test_price_quantity_payload():
+    inventory_payload = {'sku': 'A', 'availability': {'shipToLocationAvailability': {'quantity': 4}}}
+    offer_payload = {'pricingSummary': {'price': {'currency': 'GBP', 'value': '9.5'}}}
+    assert EbayAPI._generate_price_quantity_payload(inventory_payload, offer_payload, 'O1') == {
+        'sku': 'A',
+        'shipToLocationAvailability': {'quantity': 4},
+        'offers': [{'offerId': 'O1', 'availableQuantity': 4, 'price': {'currency': 'GBP', 'value': '9.5'}}],
+    }
+
+
+def seed_aspects(api, category_id='11483'):
+    """
+    Store the aspects of a category as fetchItemAspects returns them
+    """
+    aspects = [
+        {'localizedAspectName': 'Brand', 'aspectConstraint': {'aspectRequired': True}},
+        {'localizedAspectName': 'Department', 'aspectConstraint': {'aspectRequired': True}},
+        {'localizedAspectName': 'Colour',
+         'aspectConstraint': {'aspectMode': 'SELECTION_ONLY', 'itemToAspectCardinality': 'SINGLE'},
+         'aspectValues': [{'localizedValue': 'Red'}, {'localizedValue': 'Blue'}]},
+    ]
+    api.aspect_store.replace(api.marketplace_id, '3', {category_id: EbayAPI._compact_aspects(aspects)})
+
+
+def test_invalid_rows_rejected(create_api):
+    api = create_api(aspect_cache_days=7)
+    seed_aspects(api)
+    df = pd.DataFrame({
+        EXCEL_COL_MAPPING['sku']: ['OK', 'MISSING', 'TWO', 'OTHER', 'UNCHECKED'],
+        EXCEL_COL_MAPPING['categoryId']: [11483, 11483, 11483, 11483, 261],
+        EXCEL_COL_MAPPING['product.brand']: ['Brand', '', 'Brand', 'Brand', ''],
+        'C:Department': ['Men', 'Men', 'Men', 'Men', ''],
+        'C:Colour': ['red', '', 'Red||Blue', 'Green', 'Green'],
+    })
+    api._generate_product_aspects_column_list(df)
+
+    valid_rows = api._reject_invalid_rows(api._prepare_rows(df))
+
+    # aspect names & selection values match case insensitive, categories without stored aspects aren't checked
+    assert [row[EXCEL_COL_MAPPING['sku']] for row in valid_rows] == ['OK', 'UNCHECKED']
+    errors = {sku: [e['message'] for e in result['errors']] for sku, result in api.publish_results.items()}
+    assert errors == {
+        'MISSING': ['Missing required aspect Brand'],
+        'TWO': ['Aspect Colour takes one value, got 2'],
+        'OTHER': ['Value Green not allowed for aspect Colour'],
+    }
+    assert all(result['listingId'] is None for result in api.publish_results.values())
+
+
+def test_rejected_rows_not_listed(create_api, workdir, mock_server):
+    rows = listing_rows(4)
+    rows[1]['product.brand'] = ''
+    write_photos(workdir / 'photos', [row['sku'] for row in rows])
+    api = create_api(aspect_cache_days=7)
+    api.aspect_store.replace(api.marketplace_id, '3', {'11483': [{
+        'name': 'Brand', 'required': True, 'mode': 'FREE_TEXT', 'cardinality': 'SINGLE', 'values': []
+    }]})
+
+    api.workflow(write_sheet(workdir, rows))
+
+    assert set(mock_server.offers) == {'SKU0000', 'SKU0002', 'SKU0003'}
+    assert api.publish_results['SKU0001']['errors'] == [{'message': 'Missing required aspect Brand'}]
+    # the images of rejected rows aren't uploaded
+    assert mock_server.stats.to_dict()['calls']['UploadSiteHostedPictures'] == 3
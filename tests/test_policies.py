@@ -0,0 +1,62 @@
+import time
+
+from ebay_listing import PolicyCache
+
+POLICY_ENDPOINTS = ('location', 'fulfillment_policy', 'payment_policy', 'return_policy')
+POLICY_IDS = {'merchant_location_key': 'L', 'fulfillment_policy': 'F', 'payment_policy': 'P', 'return_policy': 'R'}
+
+
+def policy_calls(mock_server):
+    calls = mock_server.stats.to_dict()['calls']
+    return {endpoint: calls[endpoint] for endpoint in POLICY_ENDPOINTS if endpoint in calls}
+
+
+def test_policy_cache_expiry(tmp_path):
+    cache = PolicyCache(str(tmp_path / 'policy_cache.db'), ttl_hours=1)
+    cache.set('', 'EBAY_GB', POLICY_IDS)
+    cache.set('other', 'EBAY_GB', POLICY_IDS)
+    assert cache.get('', 'EBAY_GB') == POLICY_IDS
+    assert cache.get('', 'EBAY_US') is None
+
+    cache.invalidate(account='')
+    assert cache.get('', 'EBAY_GB') is None
+    assert cache.get('other', 'EBAY_GB') == POLICY_IDS
+
+    # expired a second after it was cached
+    cache.ttl_hours = 1 / 3600
+    cache.set('', 'EBAY_GB', POLICY_IDS)
+    assert cache.get('', 'EBAY_GB') == POLICY_IDS
+    time.sleep(1.1)
+    assert cache.get('', 'EBAY_GB') is None
+    cache.close()
+
+
+def test_policies_fetched_on_miss_only(create_api, mock_server):
+    api = create_api(policy_cache_hours=24)
+    api.bootstrap_policies()
+    assert policy_calls(mock_server) == {endpoint: 1 for endpoint in POLICY_ENDPOINTS}
+    api.close()
+
+    # the next run reads the ids from the cache file
+    mock_server.stats.reset()
+    api = create_api(policy_cache_hours=24)
+    api.bootstrap_policies()
+    assert policy_calls(mock_server) == {}
+    assert api.get_policy_ids() == {
+        'merchant_location_key': 'MOCK_LOCATION',
+        'fulfillment_policy': 'MOCK_FULFILLMENT_POLICY',
+        'payment_policy': 'MOCK_PAYMENT_POLICY',
+        'return_policy': 'MOCK_RETURN_POLICY',
+    }
+
+    # expired or cleared ids are fetched again
+    api.policy_cache.invalidate()
+    api.bootstrap_policies()
+    assert policy_calls(mock_server) == {endpoint: 1 for endpoint in POLICY_ENDPOINTS}
+
+
+def test_incomplete_policies_not_cached(create_api, mock_server):
+    api = create_api(policy_cache_hours=24)
+    api.fetch_return_policy = lambda: None
+    api.bootstrap_policies()
+    assert api.policy_cache.get('', api.marketplace_id) is None
@@ -0,0 +1,55 @@
+from ebay_listing import RateLimiter, RetryBudget
+
+
+class Response:
+
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_rate_limiter_bucket():
+    limiter = RateLimiter(2)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    # bucket empty, next token in about 1 / rate seconds
+    assert 0 < limiter.reserve() <= 0.5
+
+
+def test_rate_limiter_backoff_and_recovery():
+    limiter = RateLimiter(10, min_rate=1)
+    limiter.update(Response(429))
+    assert limiter.rate == 5
+    limiter.update(Response(503))
+    limiter.update(Response(503))
+    limiter.update(Response(503))
+    assert limiter.rate == 1
+    for _ in range(20):
+        limiter.update(Response(200))
+    assert limiter.rate == 10
+
+
+def test_rate_limiter_headers():
+    limiter = RateLimiter(100)
+    limiter.update(Response(429, {'Retry-After': '5'}))
+    assert limiter.reserve() > 4
+
+    limiter = RateLimiter(100)
+    limiter.update(Response(200, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '3'}))
+    assert limiter.reserve() > 2
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_tokens=2, max_tokens=3)
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    # two requests earn one retry
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    # deposits are capped
+    for _ in range(100):
+        budget.deposit()
+    assert budget.tokens == 3
@@ -0,0 +1,100 @@
+import csv
+import glob
+
+import requests
+
+from ebay_listing import EbayAPI
+from tests.conftest import listing_rows, write_sheet, write_photos
+from tests.test_workflow import listing_calls
+
+
+def list_elsewhere(create_api, workdir, rows):
+    """
+    List the rows & forget the fingerprints & journal, as if they were listed from another machine
+    """
+    write_photos(workdir / 'photos', [row['sku'] for row in rows])
+    api = create_api()
+    api.workflow(write_sheet(workdir, rows))
+    api.fingerprints.execute('DELETE FROM fingerprints')
+    api.journal.reset()
+
+
+def statuses(api):
+    return {sku: result.get('status') for sku, result in api.publish_results.items()}
+
+
+def test_reconcile_without_fingerprints_sends_price_changes_only(create_api, workdir, mock_server):
+    rows = listing_rows(45)
+    list_elsewhere(create_api, workdir, rows)
+
+    rows[3]['pricingSummary.auctionStartPrice'] = 99
+    rows[30]['availableQuantity'] = 7
+    mock_server.stats.reset()
+    api = create_api()
+    api.workflow(write_sheet(workdir, rows), reconcile=True)
+
+    calls = mock_server.stats.to_dict()['calls']
+    # the offers are paged through instead of fetched sku by sku
+    assert calls['offer'] == 1
+    assert set(listing_calls(mock_server)) == {'bulk_update_price_quantity'}
+    assert mock_server.offers['SKU0003']['pricingSummary']['price']['value'] == '99'
+    assert statuses(api) == {
+        row['sku']: 'price_quantity_updated' if row['sku'] in ('SKU0003', 'SKU0030') else 'unchanged'
+        for row in rows
+    }
+    assert all(result['listingId'] for result in api.publish_results.values())
+
+    with open(sorted(glob.glob('ebay_listing_report*.csv'))[-1], newline='') as f:
+        report = {row['sku']: row['status'] for row in csv.DictReader(f)}
+    assert report == statuses(api)
+
+    # the fingerprints taken on the way make the next reconciled run skip the unchanged skus locally
+    mock_server.stats.reset()
+    create_api().workflow(write_sheet(workdir, rows), reconcile=True)
+    assert listing_calls(mock_server) == {}
+
+
+def test_resume_after_reconcile_sends_nothing(create_api, workdir, mock_server):
+    rows = listing_rows(25)
+    list_elsewhere(create_api, workdir, rows)
+
+    rows[4]['pricingSummary.auctionStartPrice'] = 99
+    api = create_api()
+    api.workflow(write_sheet(workdir, rows), reconcile=True)
+    # skipped & price updated skus are journaled as published
+    assert all(api.journal.get(row['sku'])['stage'] == 'published' for row in rows)
+
+    mock_server.stats.reset()
+    create_api().workflow(write_sheet(workdir, rows), resume=True)
+    assert listing_calls(mock_server) == {}
+
+
+def test_reconcile_fetches_offers_by_sku_when_not_paged(create_api, workdir, mock_server):
+    rows = listing_rows(10)
+    list_elsewhere(create_api, workdir, rows)
+
+    rows[2]['product.title'] = 'New title'
+    mock_server.stats.reset()
+    api = create_api()
+
+    def get_offers_page(page=0):
+        raise requests.HTTPError('400 Client Error: sku is required')
+
+    api.get_offers_page = get_offers_page
+    api.workflow(write_sheet(workdir, rows), reconcile=True)
+
+    calls = mock_server.stats.to_dict()['calls']
+    assert calls['offer'] == 10
+    assert calls['updateOffer'] == 1
+    assert 'bulk_create_offer' not in calls
+    assert statuses(api)['SKU0002'] == 'updated'
+    assert mock_server.offers['SKU0002']['status'] == 'PUBLISHED'
+
+
+def test_payload_matches():
+    remote = {'sku': 'A', 'categoryId': '11483', 'locale': 'en_US',
+              'product': {'title': 'T', 'imageUrls': ['u1', 'u2']}}
+    assert EbayAPI._payload_matches(remote, {'categoryId': 11483, 'product': {'imageUrls': ['u1', 'u2']}})
+    assert not EbayAPI._payload_matches(remote, {'product': {'imageUrls': ['u1']}})
+    assert not EbayAPI._payload_matches(remote, {'product': {'title': 'Other'}})
+    assert not EbayAPI._payload_matches(remote, {'condition': 'NEW'})
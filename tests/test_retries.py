@@ -0,0 +1,39 @@
+import pytest
+
+from mock_ebay_server import start_server
+from tests.conftest import listing_rows, write_sheet, write_photos
+
+
+@pytest.fixture
+def faulty_server():
+    # the fault rates of a flaky day, Retry-After short so the test runs fast
+    server = start_server(error_rate=0.1, throttle_rate=0.05, item_error_rate=0.1, retry_after=0.01)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_every_sku_published_under_faults(create_api, workdir, faulty_server):
+    rows = listing_rows(300)
+    skus = [row['sku'] for row in rows]
+    write_photos(workdir / 'photos', skus)
+    api = create_api(base_url=faulty_server.url, image_upload_workers=8)
+
+    api.workflow(write_sheet(workdir, rows))
+
+    published = {sku for sku, result in api.publish_results.items() if result.get('listingId')}
+    assert published == set(skus)
+    assert faulty_server.stats.to_dict()['errors'] > 0
+
+
+def test_retry_budget_per_api_family(create_api):
+    api = create_api(retry_budget_ratio=0, retry_budget_min_tokens=2, retry_budget_max_tokens=2)
+    assert api._can_retry(0, 'trading')
+    assert api._can_retry(1, 'trading')
+    assert not api._can_retry(2, 'trading')
+    # image upload retries don't spend the retries of the offer calls
+    assert api._can_retry(0, 'inventory')
+    # bulk calls get their first retry even with the budget spent
+    assert not api._can_retry(0, 'trading')
+    assert api._can_retry(0, 'trading', min_retries=1)
+    assert not api._can_retry(api.max_retries, 'trading', min_retries=10)
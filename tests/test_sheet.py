@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from ebay_listing import EXCEL_COL_MAPPING
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+def write_workbook(path):
+    """
+    Listings sheet starting at column B, header on the 4th row, with the cells read_excel converts:
+    duplicate & empty header names, dates, whole floats, empty cells, na strings & an empty row
+    """
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'Listings'
+    for row in range(1, 4):
+        sheet.cell(row=row, column=2, value='info')
+    header = [EXCEL_COL_MAPPING['sku'], EXCEL_COL_MAPPING['product.title'], EXCEL_COL_MAPPING['product.title'],
+              None, EXCEL_COL_MAPPING['pricingSummary.auctionStartPrice'], EXCEL_COL_MAPPING['availableQuantity'],
+              'Listed', 'C:Colour']
+    rows = [
+        ['A1', 'First', 'First again', 'x', 10.0, 3, datetime(2024, 5, 1, 12, 30), 'Red||Blue'],
+        ['A2', 'Second', None, None, 12.5, None, datetime(2024, 6, 1), 'NA'],
+        [None] * 8,
+        [1003, 'Third', 'Third again', 'y', 7, 1.0, None, 42],
+        ['A4', None, 'Fourth', None, None, 2, datetime(2025, 1, 2), None],
+        ['A5', 'Fifth', 'N/A', 'z', 9.99, 4, datetime(2025, 1, 3), 'Green'],
+    ]
+    for r, values in enumerate([header] + rows, start=4):
+        for c, value in enumerate(values, start=2):
+            if value is not None:
+                sheet.cell(row=r, column=c, value=value)
+    workbook.create_sheet('Empty')
+    workbook.save(path)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 100])
+def test_streamed_rows_match_read_excel(create_api, workdir, chunk_size):
+    path = str(workdir / 'listings.xlsx')
+    write_workbook(path)
+    api = create_api()
+    api.read_excel(path)
+    expected = api.df.reset_index(drop=True)
+
+    chunks = list(api.iter_sheet(path, chunk_size=chunk_size))
+    streamed = pd.concat(chunks, ignore_index=True)
+
+    assert list(streamed.columns) == list(expected.columns)
+    assert EXCEL_COL_MAPPING['product.title'] + '.1' in streamed.columns
+    # a chunk infers the dtypes of its own rows, e.g. int where the whole sheet has float
+    pd.testing.assert_frame_equal(streamed, expected, check_dtype=False)
+
+    api._generate_product_aspects_column_list(expected)
+    expected_rows = api._prepare_rows(expected)
+    streamed_rows = [row for df in chunks for row in api._prepare_rows(df.reset_index(drop=True))]
+    assert streamed_rows == expected_rows
+
+
+def test_empty_sheet_streams_nothing(create_api, workdir):
+    path = str(workdir / 'listings.xlsx')
+    write_workbook(path)
+    assert list(create_api().iter_sheet(path, sheet='Empty')) == []
@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from ebay_listing import FileLock, ProgressJournal, FingerprintStore, ImageUrlCache
+
+
+def test_journal_stages(tmp_path):
+    journal = ProgressJournal(str(tmp_path / 'progress.db'))
+    assert journal.get('A') is None
+
+    journal.set_stage('A', 'images', image_urls=['https://i/1.jpg'])
+    journal.set_stage('A', 'offer', offer_id='O1')
+    record = journal.get('A')
+    # later stages keep the image urls & ids of the earlier ones
+    assert record == {'stage': 'offer', 'image_urls': ['https://i/1.jpg'], 'offer_id': 'O1', 'listing_id': None}
+    assert ProgressJournal.reached(record, 'images')
+    assert ProgressJournal.reached(record, 'offer')
+    assert not ProgressJournal.reached(record, 'published')
+    assert not ProgressJournal.reached(None, 'images')
+
+    journal.reset()
+    assert journal.get('A') is None
+    journal.close()
+
+
+def test_journal_survives_reopen(tmp_path):
+    filename = str(tmp_path / 'progress.db')
+    journal = ProgressJournal(filename)
+    journal.set_stage('A', 'published', offer_id='O1', listing_id='L1')
+    journal.close()
+
+    journal = ProgressJournal(filename)
+    assert journal.get('A')['listing_id'] == 'L1'
+    journal.close()
+
+
+def test_fingerprints(tmp_path):
+    store = FingerprintStore(str(tmp_path / 'fingerprints.db'))
+    assert FingerprintStore.fingerprint({'a': 1, 'b': 2}) == FingerprintStore.fingerprint({'b': 2, 'a': 1})
+    assert FingerprintStore.fingerprint({'a': 1}) != FingerprintStore.fingerprint({'a': 2})
+
+    assert store.get('A') is None
+    store.set('A', 'content', 'price', 'O1')
+    store.set('A', 'content2', 'price2', 'O1')
+    assert store.get('A') == {'content_hash': 'content2', 'price_quantity_hash': 'price2', 'offer_id': 'O1'}
+    store.close()
+
+
+def test_image_url_cache_expiry(tmp_path):
+    cache = ImageUrlCache(str(tmp_path / 'cache.db'), expiry_days=30)
+    cache.set('h1', 'https://i/1.jpg')
+    assert cache.get('h1') == 'https://i/1.jpg'
+    # eBay's UseByDate wins when it is earlier
+    cache.set('h2', 'https://i/2.jpg', use_by_date=datetime.now(timezone.utc) - timedelta(minutes=1))
+    assert cache.get('h2') is None
+    cache.close()
+
+
+def test_file_lock_excludes(tmp_path):
+    path = str(tmp_path / 'token.lock')
+    entered = []
+
+    def hold():
+        with FileLock(path):
+            entered.append('other')
+
+    with FileLock(path):
+        thread = threading.Thread(target=hold)
+        thread.start()
+        time.sleep(0.3)
+        assert entered == []
+    thread.join(5)
+    assert entered == ['other']
+    assert not os.path.exists(path)
+
+
+def test_file_lock_timeout_and_stale(tmp_path):
+    path = str(tmp_path / 'token.lock')
+    with open(path, 'w') as f:
+        f.write('1')
+    with pytest.raises(TimeoutError):
+        FileLock(path, timeout=0.2, poll_interval=0.05).acquire()
+
+    # left over by a killed process
+    os.utime(path, (time.time() - 600, time.time() - 600))
+    with FileLock(path, timeout=1, stale_seconds=120):
+        assert os.path.exists(path)
+    assert not os.path.exists(path)
+
+
+def test_file_lock_held_longer_than_stale_seconds(tmp_path):
+    path = str(tmp_path / 'token.lock')
+    with FileLock(path, stale_seconds=0.2):
+        # the holder keeps the lock file fresh, e.g. through a slow token refresh
+        time.sleep(0.5)
+        with pytest.raises(TimeoutError):
+            FileLock(path, timeout=0.3, stale_seconds=0.2, poll_interval=0.05).acquire()
+        assert os.path.exists(path)
+    assert not os.path.exists(path)
+
+
+def test_stale_lock_broken_once(tmp_path):
+    path = str(tmp_path / 'token.lock')
+    with open(path, 'w') as f:
+        f.write('1')
+    os.utime(path, (time.time() - 600, time.time() - 600))
+    holders = []
+    active = []
+
+    def hold(name):
+        with FileLock(path, timeout=5, stale_seconds=120, poll_interval=0.01):
+            active.append(name)
+            holders.append(len(active))
+            time.sleep(0.05)
+            active.remove(name)
+
+    threads = [threading.Thread(target=hold, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert holders == [1] * 8
+    assert os.listdir(tmp_path) == []
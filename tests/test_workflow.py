@@ -0,0 +1,222 @@
+import csv
+import glob
+
+from ebay_listing import EXCEL_COL_MAPPING
+from tests.conftest import listing_rows, write_sheet, write_photos
+
+
+LISTING_ENDPOINTS = {'UploadSiteHostedPictures', 'bulk_create_or_replace_inventory_item', 'bulk_create_offer',
+                     'updateOffer', 'bulk_update_price_quantity', 'bulk_publish_offer'}
+
+
+def listing_calls(mock_server):
+    """
+    Calls of the listing endpoints, policy & aspect lookups left out
+    """
+    calls = mock_server.stats.to_dict()['calls']
+    return {endpoint: count for endpoint, count in calls.items() if endpoint in LISTING_ENDPOINTS}
+
+
+def published_skus(api):
+    return {sku for sku, result in api.publish_results.items() if result.get('listingId')}
+
+
+def test_workflow_publishes_every_sku(create_api, workdir, mock_server):
+    rows = listing_rows(45)
+    skus = [row['sku'] for row in rows]
+    write_photos(workdir / 'photos', skus, images_per_sku=2)
+    api = create_api()
+
+    api.workflow(write_sheet(workdir, rows))
+
+    assert published_skus(api) == set(skus)
+    assert set(mock_server.offers) == set(skus)
+    assert all(offer['status'] == 'PUBLISHED' for offer in mock_server.offers.values())
+    assert all(len(item['product']['imageUrls']) == 2 for item in mock_server.inventory_items.values())
+    calls = mock_server.stats.to_dict()['calls']
+    # 20 rows per batch, up to 25 offers per bulk call
+    assert calls['bulk_create_offer'] == 3
+    assert calls['UploadSiteHostedPictures'] == 90
+    # batches publish the offers they created, nothing is left in the shared dict
+    assert api.sku_offer_id_dict == {}
+
+
+def test_identical_images_uploaded_once(create_api, workdir, mock_server):
+    rows = listing_rows(30)
+    skus = [row['sku'] for row in rows]
+    write_photos(workdir / 'photos', skus, content=b'same image')
+    api = create_api(image_cache_days=0, image_upload_workers=8)
+
+    api.workflow(write_sheet(workdir, rows))
+
+    assert published_skus(api) == set(skus)
+    assert mock_server.stats.to_dict()['calls']['UploadSiteHostedPictures'] == 1
+    assert len({item['product']['imageUrls'][0] for item in mock_server.inventory_items.values()}) == 1
+
+
+def test_image_cache_key_includes_preprocessing(create_api):
+    plain = create_api()
+    resized = create_api(image_preprocess_workers=1, image_max_size=800, image_quality=70)
+    recompressed = create_api(image_preprocess_workers=1, image_max_size=800, image_quality=90)
+    keys = {api._get_image_cache_key('abc') for api in (plain, resized, recompressed)}
+    assert plain._get_image_cache_key('abc') == 'abc'
+    assert len(keys) == 3
+
+
+def test_diff_rerun_sends_nothing(create_api, workdir, mock_server):
+    rows = listing_rows(30)
+    skus = [row['sku'] for row in rows]
+    write_photos(workdir / 'photos', skus, content=b'same image')
+    sheet = write_sheet(workdir, rows)
+    create_api(image_upload_workers=8).workflow(sheet, diff=True)
+
+    mock_server.stats.reset()
+    api = create_api(image_upload_workers=8)
+    api.workflow(sheet, diff=True)
+    assert listing_calls(mock_server) == {}
+
+
+def test_diff_sends_price_changes_only(create_api, workdir, mock_server):
+    rows = listing_rows(30)
+    write_photos(workdir / 'photos', [row['sku'] for row in rows])
+    create_api().workflow(write_sheet(workdir, rows), diff=True)
+
+    rows[3]['pricingSummary.auctionStartPrice'] = 99
+    rows[4]['product.title'] = 'New title'
+    mock_server.stats.reset()
+    api = create_api()
+    api.workflow(write_sheet(workdir, rows), diff=True)
+
+    calls = mock_server.stats.to_dict()['calls']
+    assert calls['bulk_update_price_quantity'] == 1
+    assert calls['updateOffer'] == 1
+    assert mock_server.offers['SKU0003']['pricingSummary']['price']['value'] == '99'
+    assert mock_server.offers['SKU0004']['status'] == 'PUBLISHED'
+
+
+def fail_publishing(api):
+    api.bulk_publish_offer = lambda offer_ids: {
+        offer_id: {'listingId': None, 'errors': [{'message': 'down'}]} for offer_id in offer_ids
+    }
+
+
+def test_resume_publishes_only(create_api, workdir, mock_server):
+    rows = listing_rows(40)
+    write_photos(workdir / 'photos', [row['sku'] for row in rows])
+    sheet = write_sheet(workdir, rows)
+    interrupted = create_api()
+    fail_publishing(interrupted)
+    interrupted.workflow(sheet)
+    assert not published_skus(interrupted)
+
+    mock_server.stats.reset()
+    api = create_api()
+    api.workflow(sheet, resume=True)
+
+    assert published_skus(api) == {row['sku'] for row in rows}
+    assert set(listing_calls(mock_server)) == {'bulk_publish_offer'}
+
+
+def test_normal_run_keeps_journal(create_api, workdir, mock_server):
+    rows = listing_rows(40)
+    write_photos(workdir / 'photos', [row['sku'] for row in rows])
+    interrupted = create_api()
+    fail_publishing(interrupted)
+    interrupted.workflow(write_sheet(workdir, rows))
+
+    # a run without --resume doesn't throw away the progress of the others
+    create_api().workflow(write_sheet(workdir, rows[:5], 'first.csv'))
+    mock_server.stats.reset()
+    api = create_api()
+    api.workflow(write_sheet(workdir, rows), resume=True)
+
+    assert published_skus(api) == {row['sku'] for row in rows[5:]}
+    assert set(listing_calls(mock_server)) == {'bulk_publish_offer'}
+
+    # a restart forgets them
+    mock_server.stats.reset()
+    create_api().workflow(write_sheet(workdir, rows), restart=True)
+    assert 'bulk_create_or_replace_inventory_item' in listing_calls(mock_server)
+
+
+def test_failed_batches_are_reported(create_api, workdir, mock_server):
+    rows = listing_rows(60)
+    write_photos(workdir / 'photos', [row['sku'] for row in rows])
+    api = create_api()
+    # the 1st batch fails to start, the 2nd to send & the 3rd is listed
+    start_batch, bulk_create_offer = api._start_batch, api.bulk_create_offer
+
+    def failing_start_batch(batch_rows):
+        if any(row[EXCEL_COL_MAPPING['sku']] == 'SKU0000' for row in batch_rows):
+            raise RuntimeError('start failed')
+        return start_batch(batch_rows)
+
+    def failing_bulk_create_offer(offer_items):
+        if any(item['sku'] == 'SKU0020' for item in offer_items):
+            raise RuntimeError('send failed')
+        return bulk_create_offer(offer_items)
+
+    api._start_batch = failing_start_batch
+    api.bulk_create_offer = failing_bulk_create_offer
+    api.workflow(write_sheet(workdir, rows))
+
+    assert published_skus(api) == {row['sku'] for row in rows[40:]}
+    assert set(api.publish_results) == {row['sku'] for row in rows}
+    assert 'start failed' in api.publish_results['SKU0000']['errors'][0]['message']
+    assert 'send failed' in api.publish_results['SKU0039']['errors'][0]['message']
+    # the inventory items of the failed batch are journaled for --resume
+    assert api.journal.get('SKU0020')['stage'] == 'inventory'
+
+
+def test_numeric_skus_get_their_photos(create_api, workdir, mock_server, capsys):
+    rows = listing_rows(10)
+    for i, row in enumerate(rows):
+        row['sku'] = str(1000 + i)
+    # the csv is streamed & its skus read as numbers
+    write_photos(workdir / 'photos', [row['sku'] for row in rows[:8]])
+    api = create_api()
+
+    api.workflow(write_sheet(workdir, rows))
+
+    items = {str(sku): item for sku, item in mock_server.inventory_items.items()}
+    assert all(len(items[row['sku']]['product']['imageUrls']) == 1 for row in rows[:8])
+    assert '2 skus without photos: 1008, 1009' in capsys.readouterr().out
+
+
+def test_diff_rerun_keeps_journal_published(create_api, workdir, mock_server):
+    rows = listing_rows(5)
+    write_photos(workdir / 'photos', [row['sku'] for row in rows])
+    sheet = write_sheet(workdir, rows)
+    create_api().workflow(sheet)
+
+    rows[1]['pricingSummary.auctionStartPrice'] = 99
+    diff = create_api()
+    diff.workflow(write_sheet(workdir, rows), diff=True)
+    # unchanged & price updated skus are reported with their listing
+    assert published_skus(diff) == {row['sku'] for row in rows}
+    assert all(diff.journal.get(row['sku'])['stage'] == 'published' for row in rows)
+
+    mock_server.stats.reset()
+    create_api().workflow(write_sheet(workdir, rows), resume=True)
+    assert listing_calls(mock_server) == {}
+
+
+def test_read_error_still_writes_report(create_api, workdir, mock_server):
+    rows = listing_rows(45)
+    write_photos(workdir / 'photos', [row['sku'] for row in rows])
+    api = create_api()
+    iter_sheet = api.iter_sheet
+
+    def failing_iter_sheet(filename, chunk_size=100):
+        chunks = iter_sheet(filename, chunk_size=20)
+        yield next(chunks)
+        raise OSError('sheet truncated')
+
+    api.iter_sheet = failing_iter_sheet
+    api.workflow(write_sheet(workdir, rows))
+
+    assert published_skus(api) == {row['sku'] for row in rows[:20]}
+    with open(sorted(glob.glob('ebay_listing_report*.csv'))[-1], newline='') as f:
+        report = list(csv.DictReader(f))
+    assert len(report) == 21
+    assert 'sheet truncated' in report[-1]['errors']